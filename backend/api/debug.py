@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Body, HTTPException
+from fastapi.responses import JSONResponse
+
+from backend.tracing import tracer, chrome_trace
+
+router = APIRouter()
+
+
+@router.get("/traces")
+async def list_traces(limit: int = 50):
+    """Newest sampled action traces with their spans."""
+    return {
+        "sample_rate": tracer.sample_rate,
+        "buffered": len(tracer.buffer),
+        "traces": [t.to_dict() for t in tracer.traces(limit)],
+    }
+
+
+@router.get("/traces/chrome")
+async def export_traces(limit: int = 0):
+    """Buffered traces as a Chrome trace-event file (chrome://tracing, ui.perfetto.dev)."""
+    return JSONResponse(
+        chrome_trace(tracer.traces(limit or None)),
+        headers={"Content-Disposition": 'attachment; filename="coup-traces.json"'},
+    )
+
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: int):
+    trace = tracer.find(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace tidak ditemukan")
+    return trace.to_dict()
+
+
+@router.post("/traces/sample_rate")
+async def set_sample_rate(sample_rate: float = Body(..., embed=True)):
+    """Change the sampling rate of this worker until restart."""
+    if not 0 <= sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate harus di antara 0 dan 1")
+    tracer.sample_rate = sample_rate
+    return {"sample_rate": tracer.sample_rate}
+
+
+@router.delete("/traces")
+async def clear_traces():
+    tracer.clear()
+    return {"message": "Cleared"}
@@ -1,143 +1,212 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Body, Query
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Body, Query, Request, Response
 from typing import Optional
-from backend.supabase_client import supabase
-from backend.game_logic import create_deck, deal_cards, validate_action, process_action, get_player, process_action_with_card_selection, advance_turn, execute_exchange, can_challenge_action
+from backend.repository import repository, VersionConflict
+from backend.room_executor import room_executor
+from backend.timers import reaction_timers
+from backend.game_logic import create_deck, deal_cards, get_player
+from backend import engine
+from backend.room_store import room_store, room_view, decode_player
+from backend.event_log import event_log, command_payload, start_payload
+from backend.connections import connection_manager
+from backend.spectators import spectator_stream, SharedMessage
+from backend.resume import resume_buffer
+from backend.state_cache import state_cache
+from backend.pubsub import hub
+from backend import delta
+from backend import broadcast
+from backend import metrics
+from backend import wire
+from backend.tracing import tracer
+from backend.broadcast import RoomBroadcast
 import uuid, json, time, random
 from postgrest import exceptions as postgrest_exceptions
 
 
-def _ensure_revealed_length(player):
-    """Keep revealed list length in sync with current hand length."""
-    hand_len = len(player.get("hand", []))
-    revealed = player.get("revealed") or []
-    if len(revealed) < hand_len:
-        revealed.extend([False] * (hand_len - len(revealed)))
-    elif len(revealed) > hand_len:
-        revealed = revealed[:hand_len]
-    player["revealed"] = revealed
-
-
-def discard_influence(game_state, player, card_index):
-    """Remove a card from player's hand, send it to trash, and update alive state."""
-    hand = player.get("hand", [])
-    _ensure_revealed_length(player)
-    if card_index is None or card_index < 0 or card_index >= len(hand):
-        raise HTTPException(status_code=400, detail="card_index tidak valid")
-
-    card = hand.pop(card_index)
-    revealed = player.get("revealed", [])
-    if card_index < len(revealed):
-        revealed.pop(card_index)
-    player["revealed"] = revealed
-
-    trash = game_state.get("trash", [])
-    trash.append(card)
-    game_state["trash"] = trash
-
-    if len(player.get("hand", [])) == 0:
-        player["is_alive"] = False
-    return card
-
-
-def reveal_and_replace_claim(game_state, player, card_index, required_card):
-    """Discard the revealed claim card to trash, draw a new one to keep hand size."""
-    hand = player.get("hand", [])
-    _ensure_revealed_length(player)
-    if card_index is None or card_index < 0 or card_index >= len(hand):
-        raise HTTPException(status_code=400, detail="card_index tidak valid")
-    if required_card and hand[card_index] != required_card:
-        raise HTTPException(status_code=400, detail="Kartu yang dipilih tidak sesuai klaim")
-
-    trashed_card = hand[card_index]
-    trash = game_state.get("trash", [])
-    trash.append(trashed_card)
-    game_state["trash"] = trash
-
-    if not game_state.get("deck"):
-        raise HTTPException(status_code=400, detail="Deck kosong")
-    new_card = game_state["deck"].pop()
-    player["hand"][card_index] = new_card
-    player["revealed"][card_index] = False
-    _ensure_revealed_length(player)
-    return trashed_card, new_card
-
-# Helper to apply action effect after successful challenge proof
-def apply_action_effect(game_state, actor_id, action, target_id):
-    actor = get_player(game_state["players"], actor_id)
-    target = get_player(game_state["players"], target_id) if target_id else None
-    actor_name = actor.get("nickname") if actor else "Anonymous"
-    target_name = target.get("nickname") if target else "Anonymous"
-    msg = None
-    if action == "steal" and actor and target:
-        amount = min(2, max(0, target.get("coins", 0)))
-        target["coins"] = max(0, target.get("coins", 0) - amount)
-        actor["coins"] = actor.get("coins", 0) + amount
-        msg = f"{actor_name} mencuri {amount} coin dari {target_name}."
-    elif action == "tax" and actor:
-        actor["coins"] = actor.get("coins", 0) + 3
-        msg = f"{actor_name} mengambil Tax (+3 coins)."
-    elif action == "foreign_aid" and actor:
-        actor["coins"] = actor.get("coins", 0) + 2
-        msg = f"{actor_name} mengambil Foreign Aid (+2 coins)."
-    elif action == "exchange" and actor:
-        msg = f"{actor_name} akan menukar satu kartu dengan deck."
-    elif action == "assassinate" and target:
-        msg = f"{actor_name} berhasil mengasumsir {target_name}."
-    return game_state, msg
-
 router = APIRouter()
-active_connections = {}
 pending_actions = {}
 
+# Seconds a pending action waits for reactions or a card choice
+REACTION_WINDOW = 60
+
 def mask_state_for_viewer(state: dict, viewer_id: Optional[str]):
     try:
-        game = state.get("game") or {}
-        try:
-            deck = json.loads(game.get("deck") if isinstance(game.get("deck"), str) else json.dumps(game.get("deck") or []))
-        except Exception:
-            deck = game.get("deck") or []
-        try:
-            trash = json.loads(game.get("trash") if isinstance(game.get("trash"), str) else json.dumps(game.get("trash") or []))
-        except Exception:
-            trash = game.get("trash") or []
-        game_view = dict(game)
-        game_view["deck_count"] = len(deck)
-        game_view["trash"] = trash
-        players = state.get("players") or []
-        masked_players = []
-        for p in players:
-            mp = dict(p)
-            try:
-                hand = json.loads(p.get("hand") if isinstance(p.get("hand"), str) else json.dumps(p.get("hand") or []))
-            except Exception:
-                hand = p.get("hand") or []
-            try:
-                revealed = json.loads(p.get("revealed") if isinstance(p.get("revealed"), str) else json.dumps(p.get("revealed") or [False, False]))
-            except Exception:
-                revealed = p.get("revealed") or [False, False]
-
-            mp["hand"] = hand
-            mp["revealed"] = revealed
-            _ensure_revealed_length(mp)
-
-            pid = str(viewer_id) if viewer_id is not None else None
-            is_self = pid is not None and (
-                str(p.get("user_id")) == pid or str(p.get("guest_id")) == pid or str(p.get("id")) == pid
-            )
-            mp["hand"] = hand if is_self else ["?" if not mp["revealed"][i] else hand[i] for i in range(len(hand))]
-            masked_players.append(mp)
-        return {"game": game_view, "players": masked_players}
+        return RoomBroadcast(state).view(viewer_id)
     except Exception as e:
         print(f"Masking error: {e}")
         return state
 
+def pending_action_payload(pa, seats):
+    """Client-facing summary of a pending action, or None.
+
+    Players are named by row id: the stored keys are the ids players act
+    with, and this goes to every viewer.
+    """
+    if pa is None:
+        return None
+    return wire.Keyed({
+        "actor_id": seats.public_id(pa["actor_id"]),
+        "action": pa["action"],
+        "target_id": seats.public_id(pa.get("target_id")),
+        "awaiting_from": seats.public_id(pa.get("awaiting_from")),
+        "required_card": pa.get("required_card"),
+        "time_remaining": max(0, REACTION_WINDOW - (time.time() - pa["timestamp"])),
+        "stage": pa["stage"],
+        "blocker_id": seats.public_id(pa.get("blocker_id")),
+        "block_card": pa.get("block_card")
+    })
+
+async def refresh_pending(room_code):
+    """Pull the room's pending action from the shared store when running several workers."""
+    if not hub.shared:
+        return
+    pa = await hub.get(f"pending:{room_code}")
+    if pa is None:
+        pending_actions.pop(room_code, None)
+    else:
+        pending_actions[room_code] = pa
+
+async def store_pending(room_code):
+    if not hub.shared:
+        return
+    pa = pending_actions.get(room_code)
+    if pa is None:
+        await hub.delete(f"pending:{room_code}")
+    else:
+        await hub.set(f"pending:{room_code}", pa)
+
+async def flush_room(room_code):
+    """Durably persist a room, reporting a concurrent commit elsewhere as 409."""
+    try:
+        await room_store.flush(room_code)
+    except VersionConflict:
+        raise HTTPException(status_code=409, detail="State game sudah berubah, silakan muat ulang")
+
+def etag_matches(if_none_match, etag):
+    """Evaluate an If-None-Match header against ``etag`` (weak comparison)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+async def publish_room(room_code, kind, room, game=None, msg=None):
+    """Send a room change to every worker's sockets through the pub/sub hub.
+
+    ``room`` is the full internal state so other workers can replace their copy;
+    ``game`` optionally narrows the game fields clients see.
+    """
+    await hub.publish(room_code, {
+        "kind": kind,
+        "version": room_store.version(room_code),
+        "room": room,
+        "game": game,
+        "msg": msg,
+        "pending": pending_actions.get(room_code),
+    })
+
+async def on_room_event(room_code, event):
+    """Apply a room event from any worker and render it to this worker's sockets."""
+    kind = event["kind"]
+    if event.get("origin") not in (None, hub.worker_id):
+        version = room_store.replace(room_code, event["room"], event["version"])
+        if event.get("pending") is None:
+            pending_actions.pop(room_code, None)
+        else:
+            pending_actions[room_code] = event["pending"]
+        # Only the worker that set the pending action runs its timer
+        reaction_timers.cancel(room_code)
+    else:
+        version = event["version"]
+
+    room = event["room"]
+    view = room_view(room)
+    if event.get("game") is not None:
+        view["game"] = event["game"]
+    with tracer.span("mask.build", version=version):
+        bc = broadcast.build(room_code, version, view, room_store.index(room_code))
+    # The cached GET /game/state view is for an older version now
+    state_cache.forget(room_code)
+    if kind != "action":
+        # Seats only change on join, leave and start; sockets without one watch the spectator stream
+        connection_manager.reseat(room_code, bc.seat_of)
+    # Kept so sockets reconnecting with ?since= receive only what they missed
+    entry = resume_buffer.record(room_code, version, kind, bc, event.get("msg"), event.get("pending"))
+    pending_payload = pending_action_payload(entry.pending, bc.seats)
+    msg = entry.msg
+
+    def render(conn):
+        return render_event(conn, room_code, entry, pending_payload)
+
+    def render_public(codec):
+        # One message for every spectator: no version, so nothing to acknowledge
+        if kind == "lobby":
+            return bc.message(codec, {"type": "lobby_update"}, None)
+        if kind == "started":
+            return bc.message(codec, {"type": "started"}, None, "gameState")
+        payload = {"type": "action", "msg": msg}
+        if pending_payload is not None:
+            payload["pending_action"] = pending_payload
+        return bc.message(codec, payload, None, "gameState")
+
+    with metrics.fanout_seconds.time(kind):
+        connection_manager.broadcast(room_code, render)
+        spectator_stream.publish(room_code, SharedMessage(render_public, version, lambda: bc.view_json(None)))
+
+def render_event(conn, room_code, entry, pending_payload):
+    """Encode room event ``entry`` for a player socket: a snapshot, or a patch against its acked state."""
+    version, bc = entry.version, entry.bc
+    if entry.kind == "lobby":
+        fields = {"type": "lobby_update", **delta.snapshot(conn, version, bc.view(conn.player_id, conn.codec))}
+        return bc.message(conn.codec, fields, conn.player_id)
+    if entry.kind == "started":
+        fields = {"type": "started", **delta.snapshot(conn, version, bc.view(conn.player_id, conn.codec))}
+        return bc.message(conn.codec, fields, conn.player_id, "gameState")
+    fields, full = delta.encode(conn, room_code, version, bc)
+    payload = {"type": "action", "msg": entry.msg, **fields}
+    if pending_payload is not None:
+        payload["pending_action"] = pending_payload
+    if full:
+        return bc.message(conn.codec, payload, conn.player_id, "gameState")
+    return conn.codec.dumps(payload)
+
+def resume_socket(conn, room_code, since, missed):
+    """Send a reconnecting player the events after ``since`` instead of a full snapshot."""
+    base = broadcast.past(room_code, since)
+    if base is not None:
+        # The client kept the state at ``since``, so the missed events go out as patches against it
+        delta.resume(conn, since, base.view(conn.player_id, conn.codec))
+    conn.send(conn.codec.dumps({"type": "resumed", "since": since, "missed": len(missed)}))
+    for entry in missed:
+        conn.send(render_event(conn, room_code, entry, pending_action_payload(entry.pending, entry.bc.seats)))
+
+async def load_room(room_code):
+    """``room_store.load``, re-reading rooms whose events this worker does not receive."""
+    if hub.shared and not hub.subscribed(room_code) and not room_store.is_dirty(room_code):
+        room_store.evict(room_code)
+    room = await room_store.load(room_code)
+    # A pending action rebuilt from the event log after a restart gets its timer back
+    restored = room_store.restored.pop(room_code, None)
+    if restored is not None and room_code not in pending_actions:
+        pending_actions[room_code] = restored
+        sync_reaction_timer(room_code)
+    return room
+
+async def broadcast_lobby(room_code, room):
+    """Push a lobby_update snapshot of the room to every connected socket."""
+    room_store.bump_version(room_code)
+    await publish_room(room_code, "lobby", room)
+
 @router.post("/game/create")
 async def create_game(host_id: str = Body(..., embed=True), room_code: Optional[str] = Body(None, embed=True)):
     rc = room_code if room_code else str(uuid.uuid4())[:8]
     deck = create_deck()
     
     try:
-        game = supabase.table("games").insert({
+        game = await repository.create_game({
             "room_code": rc,
             "host_id": host_id,
             "status": "waiting",
@@ -145,7 +214,7 @@ async def create_game(host_id: str = Body(..., embed=True), room_code: Optional[
             "trash": json.dumps([]),
             "turn": 0,
             "game_over": False
-        }).execute()
+        })
     except postgrest_exceptions.APIError as e:
         error_msg = str(e)
         if "invalid input syntax for type uuid" in error_msg.lower():
@@ -156,7 +225,7 @@ async def create_game(host_id: str = Body(..., embed=True), room_code: Optional[
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
-    return {"message": "Game dibuat", "room_code": rc, "game": game.data}
+    return {"message": "Game dibuat", "room_code": rc, "game": game}
 
 @router.post("/game/join")
 async def join_game(
@@ -164,17 +233,19 @@ async def join_game(
     player_id: str = Body(..., embed=True),
     nickname: str = Body(..., embed=True)
 ):
-    game = supabase.table("games").select("*").eq("room_code", room_code).execute()
-    if not game.data:
+    return await room_executor.run(room_code, _join_game, room_code, player_id, nickname)
+
+async def _join_game(room_code, player_id, nickname):
+    room = await load_room(room_code)
+    if room is None:
         raise HTTPException(status_code=404, detail="Game tidak ditemukan")
-    game_id = game.data[0]["id"]
-    existing = supabase.table("game_players").select("*").eq("game_id", game_id).eq("nickname", nickname).execute()
-    if existing.data:
+    game_id = room["id"]
+    if any(p.get("nickname") == nickname for p in room["players"]):
         raise HTTPException(status_code=400, detail="Sudah join")
     
     # Always store as guest_id since we use guest login
     try:
-        player = supabase.table("game_players").insert({
+        player = await repository.insert_player({
             "game_id": game_id,
             "user_id": None,
             "guest_id": player_id,
@@ -183,7 +254,7 @@ async def join_game(
             "is_alive": True,
             "hand": json.dumps([]),
             "revealed": json.dumps([False, False])
-        }).execute()
+        })
     except postgrest_exceptions.APIError as e:
         error_msg = str(e)
         if "violates foreign key constraint" in error_msg.lower():
@@ -192,40 +263,24 @@ async def join_game(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    try:
-        state = supabase.table("games").select("*").eq("room_code", room_code).execute().data[0]
-        players = supabase.table("game_players").select("*").eq("game_id", state["id"]).order("id", {"ascending": True}).execute().data
-        for p in players:
-            try:
-                p["hand"] = json.loads(p.get("hand") or "[]")
-                p["revealed"] = json.loads(p.get("revealed") or "[false,false]")
-            except Exception:
-                p["hand"] = []
-                p["revealed"] = [False, False]
-            _ensure_revealed_length(p)
-        if room_code in active_connections:
-            for entry in list(active_connections[room_code]):
-                try:
-                    import json as _json
-                    viewer = entry.get("player_id")
-                    masked = mask_state_for_viewer({"game": state, "players": players}, viewer)
-                    await entry["ws"].send_text(_json.dumps({"type": "lobby_update", **masked}))
-                except Exception:
-                    pass
-    except Exception:
-        pass
+    if player:
+        room["players"].append(decode_player(dict(player[0])))
+        room_store.reindex(room_code)
+    await broadcast_lobby(room_code, room)
 
-    return {"message": "Berhasil join", "player": player.data}
+    return {"message": "Berhasil join", "player": player}
 
 @router.post("/game/start")
 async def start_game(room_code: str = Body(..., embed=True)):
+    return await room_executor.run(room_code, _start_game, room_code)
+
+async def _start_game(room_code):
     import random as py_random
     
-    game = supabase.table("games").select("*").eq("room_code", room_code).execute()
-    if not game.data:
+    room = await load_room(room_code)
+    if room is None:
         raise HTTPException(status_code=404, detail="Game tidak ditemukan")
-    game_id = game.data[0]["id"]
-    players = supabase.table("game_players").select("*").eq("game_id", game_id).execute().data
+    players = room["players"]
     
     if len(players) < 2:
         raise HTTPException(status_code=400, detail="Minimal 2 pemain untuk memulai")
@@ -233,67 +288,68 @@ async def start_game(room_code: str = Body(..., embed=True)):
     deck = create_deck()
     hands, deck = deal_cards(deck, len(players))
     for idx, player in enumerate(players):
-        supabase.table("game_players").update({
-            "hand": json.dumps(hands[idx]),
-            "revealed": json.dumps([False, False])
-        }).eq("id", player["id"]).execute()
-    
-    first_player_index = py_random.randint(0, len(players) - 1)
+        player["hand"] = hands[idx]
+        player["revealed"] = [False, False]
     
-    supabase.table("games").update({
-        "status": "started",
-        "deck": json.dumps(deck),
-        "turn": first_player_index
-    }).eq("id", game_id).execute()
-
-    try:
-        state_game = supabase.table("games").select("*").eq("room_code", room_code).execute().data[0]
-        try:
-            updated_players = supabase.table("game_players").select("*").eq("game_id", state_game["id"]).order("id", {"ascending": True}).execute().data
-        except Exception:
-            updated_players = supabase.table("game_players").select("*").eq("game_id", state_game["id"]).execute().data
-        for p in updated_players:
-            try:
-                p["hand"] = json.loads(p.get("hand") or "[]")
-                p["revealed"] = json.loads(p.get("revealed") or "[false,false]")
-            except Exception:
-                p["hand"] = []
-                p["revealed"] = [False, False]
-            _ensure_revealed_length(p)
-        game_state = {"game": state_game, "players": updated_players}
-        if room_code in active_connections:
-            for entry in list(active_connections[room_code]):
-                try:
-                    import json as _json
-                    viewer = entry.get("player_id")
-                    masked = mask_state_for_viewer(game_state, viewer)
-                    await entry["ws"].send_text(_json.dumps({"type": "started", "gameState": masked}))
-                except Exception:
-                    pass
-    except Exception:
-        pass
+    room["status"] = "started"
+    room["deck"] = deck
+    room["turn"] = py_random.randint(0, len(players) - 1)
+    room_store.reindex(room_code)
+    if event_log.enabled:
+        event_log.record(room_code, room, "start", None, start_payload(room))
+    room_store.mark_dirty(room_code)
+    await flush_room(room_code)
+    await publish_room(room_code, "started", room)
 
     return {"message": "Game dimulai"}
 
 @router.get("/game/state")
-async def get_game_state(room_code: str, viewer_id: Optional[str] = None):
-    game = supabase.table("games").select("*").eq("room_code", room_code).execute()
-    if not game.data:
+async def get_game_state(request: Request, room_code: str, viewer_id: Optional[str] = None):
+    room = await load_room(room_code)
+    if room is None:
         raise HTTPException(status_code=404, detail="Game tidak ditemukan")
-    game_id = game.data[0]["id"]
-    try:
-        players = supabase.table("game_players").select("*").eq("game_id", game_id).order("id", {"ascending": True}).execute().data
-    except Exception:
-        players = supabase.table("game_players").select("*").eq("game_id", game_id).execute().data
-    for p in players:
-        p["hand"] = json.loads(p["hand"])
-        p["revealed"] = json.loads(p["revealed"])
-        _ensure_revealed_length(p)
-    state = {
-        "game": game.data[0],
-        "players": players
-    }
-    return mask_state_for_viewer(state, viewer_id)
+    message = None
+    if spectator_stream.delayed and room_store.index(room_code).get(viewer_id) is None:
+        # Without a seat this is the spectator view, held back as long as the spectator stream
+        message = spectator_start(room_code, room)
+        if message is None:
+            raise HTTPException(status_code=503, detail="State penonton belum tersedia",
+                                headers={"Retry-After": str(max(1, round(spectator_stream.delay)))})
+    # The view differs per viewer_id, which is part of the URL, so the room version alone identifies it
+    version = room_store.version(room_code) if message is None else message.version
+    etag = f'"{version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if message is not None:
+        return Response(content=message.state_json(), media_type="application/json", headers=headers)
+    # Masked and encoded once per room version; mutations bump the version, which invalidates it
+    text = state_cache.view_json(room_code, version, room, room_store.index(room_code), viewer_id)
+    return Response(content=text, media_type="application/json", headers=headers)
+
+@router.get("/game/events")
+async def get_game_events(room_code: str, after: int = 0):
+    """Event log of a finished game, e.g. to check a disputed challenge."""
+    room = await load_room(room_code)
+    if room is None:
+        # Finished games are moved to games_archive by the reaper, their events with them
+        try:
+            events = await repository.archived_events(room_code, after)
+        except postgrest_exceptions.APIError as e:
+            print(f"Archived events unavailable ({room_code}): {e.message}")
+            events = None
+        if events is None:
+            raise HTTPException(status_code=404, detail="Game tidak ditemukan")
+        return {"room_code": room_code, "events": events}
+    if not room.get("game_over"):
+        # Events show every hand and draw
+        raise HTTPException(status_code=403, detail="Riwayat aksi hanya bisa dilihat setelah game berakhir")
+    if not event_log.enabled:
+        raise HTTPException(status_code=404, detail="Log aksi tidak tersedia")
+    events = [e for e in event_log.events(room_code) if e["seq"] > after]
+    if not events or events[0]["seq"] != after + 1:
+        events = await repository.list_events(room["id"], after)
+    return {"room_code": room_code, "events": events}
 
 @router.post("/game/action")
 async def game_action(
@@ -307,393 +363,90 @@ async def game_action(
     claim_card: Optional[str] = Body(None, embed=True),
     block_card: Optional[str] = Body(None, embed=True),
 ):
-    game = supabase.table("games").select("*").eq("room_code", room_code).execute()
-    if not game.data:
+    trace = tracer.current()
+    if trace is not None:
+        # Reading and validating the request body happened before the handler ran
+        trace.add("decode", trace.start, time.perf_counter())
+        trace.attrs.update(room_code=room_code, action=action_type)
+    # Commands for one room run one at a time; other rooms are not blocked
+    return await room_executor.run(
+        room_code, _game_action, room_code, player_id, action_type, target_id, card_index,
+        block_by, challenge_by, claim_card, block_card,
+    )
+
+async def _game_action(room_code, player_id, action_type, target_id, card_index, block_by, challenge_by, claim_card, block_card, expired=False):
+    # Supabase calls made from here on, including the flushes it schedules, count toward this action
+    label = action_type if action_type in engine.ACTION_CODES or action_type in engine.REACTIONS else "unknown"
+    metrics.current_action.set(label)
+    with metrics.action_seconds.time(label):
+        return await _apply_action(room_code, player_id, action_type, target_id, card_index, block_card, expired)
+
+async def _apply_action(room_code, player_id, action_type, target_id, card_index, block_card, expired):
+    with tracer.span("load"):
+        room = await load_room(room_code)
+    if room is None:
         raise HTTPException(status_code=404, detail="Game tidak ditemukan")
     
-    game_data = game.data[0]
-    game_id = game_data["id"]
+    game_id = room["id"]
     
-    if game_data.get("game_over"):
+    if room.get("game_over"):
         raise HTTPException(status_code=400, detail="Game sudah berakhir")
     
-    game_state = game_data
-    try:
-        deck = json.loads(game_state.get("deck") if isinstance(game_state.get("deck"), str) else json.dumps(game_state.get("deck") or []))
-    except Exception:
-        deck = []
-    game_state["deck"] = deck
-    try:
-        trash = json.loads(game_state.get("trash") if isinstance(game_state.get("trash"), str) else json.dumps(game_state.get("trash") or []))
-    except Exception:
-        trash = []
-    game_state["trash"] = trash
-    players = supabase.table("game_players").select("*").eq("game_id", game_id).execute().data
-    for p in players:
-        p["hand"] = json.loads(p["hand"])
-        p["revealed"] = json.loads(p["revealed"])
-        _ensure_revealed_length(p)
-    game_state["players"] = players
-    
-    if action_type in ("challenge", "block", "select_card", "pass"):
-        if room_code not in pending_actions:
+    with tracer.span("pending.refresh"):
+        await refresh_pending(room_code)
+    pending = pending_actions.get(room_code)
+    if action_type in engine.REACTIONS:
+        if pending is None:
             raise HTTPException(status_code=400, detail="Tidak ada aksi yang pending untuk direaksi")
-        
-        pending = pending_actions[room_code]
-        
         elapsed = time.time() - pending["timestamp"]
-        if elapsed > 60:
-            del pending_actions[room_code]
+        if elapsed > REACTION_WINDOW and not expired:
+            # The reaction timer resolves the expired action for everyone
             raise HTTPException(status_code=400, detail="Waktu reaksi 60 detik sudah habis")
-        
-        if action_type == "pass":
-            pa = pending
-            actor_id_pa = pa.get("actor_id")
-            action_pa = pa.get("action")
-            target_pa = pa.get("target_id")
-            current_stage = pa.get("stage")
-            if current_stage == "block_reaction":
-                blocker_id = pa.get("blocker_id")
-                blocker = get_player(players, blocker_id)
-                blocker_name = blocker.get("nickname") or "Anonymous" if blocker else "Unknown"
-                block_card_used = pa.get("block_card") or "Unknown"
-                msg = f"Block oleh {blocker_name} dengan {block_card_used} diterima! Aksi {action_pa} dibatalkan."
-                game_state = advance_turn(game_state)
-                del pending_actions[room_code]
-            elif current_stage == "reaction":
-                if action_pa == "exchange":
-                    pending_actions[room_code] = {
-                        "actor_id": actor_id_pa,
-                        "action": action_pa,
-                        "target_id": target_pa,
-                        "timestamp": time.time(),
-                        "game_id": game_id,
-                        "stage": "card_selection",
-                        "awaiting_from": actor_id_pa
-                    }
-                    msg = "Tidak ada yang challenge, pilih kartu untuk exchange."
-                elif action_pa == "assassinate":
-                    pending_actions[room_code] = {
-                        "actor_id": actor_id_pa,
-                        "action": action_pa,
-                        "target_id": target_pa,
-                        "timestamp": time.time(),
-                        "game_id": game_id,
-                        "stage": "card_selection",
-                        "awaiting_from": target_pa
-                    }
-                    msg = "Assassinate diterima, target harus memilih kartu untuk dibuang."
-                else:
-                    game_state, effect_msg = apply_action_effect(game_state, actor_id_pa, action_pa, target_pa)
-                    msg = f"Aksi {action_pa} diterima. " + (effect_msg or "")
-                    game_state = advance_turn(game_state)
-                    del pending_actions[room_code]
-            else:
-                raise HTTPException(status_code=400, detail="Tidak bisa pass pada tahap ini")
-
-        elif action_type == "select_card":
-            if card_index is None:
-                raise HTTPException(status_code=400, detail="card_index harus disediakan untuk select_card")
-            stage = pending.get("stage")
-            if stage == "reveal_claim":
-                required = pending.get("required_card")
-                actor = get_player(game_state["players"], pending.get("awaiting_from"))
-                if not actor:
-                    raise HTTPException(status_code=400, detail="Actor not found")
-                trashed_card, new_card = reveal_and_replace_claim(game_state, actor, card_index, required)
-                msg = f"{actor['nickname']} membuktikan {required}, kartu {trashed_card} dibuang ke trash, ambil kartu baru."
-                pending_actions[room_code] = {
-                    "actor_id": pending["actor_id"],
-                    "action": pending["action"],
-                    "target_id": pending["target_id"],
-                    "timestamp": time.time(),
-                    "game_id": game_id,
-                    "stage": "card_selection",
-                    "awaiting_from": pending.get("next_card_selection_from"),
-                    "challenge_failed": True
-                }
-            elif stage == "card_selection":
-                if pending.get("action") == "exchange":
-                    actor = get_player(game_state["players"], pending.get("awaiting_from"))
-                    if not actor:
-                        raise HTTPException(status_code=400, detail="Actor not found")
-                    game_state, msg = execute_exchange(game_state, pending.get("awaiting_from"), card_index)
-                    game_state = advance_turn(game_state)
-                    del pending_actions[room_code]
-                else:
-                    player = get_player(game_state["players"], pending.get("awaiting_from"))
-                    if not player:
-                        raise HTTPException(status_code=400, detail="Player not found")
-                    discarded_card = discard_influence(game_state, player, card_index)
-                    if not player.get("is_alive", True):
-                        msg = f"{player['nickname']} kehilangan semua pengaruh dan keluar dari permainan."
-                    else:
-                        remaining = len(player.get("hand", []))
-                        msg = f"{player['nickname']} membuang kartu: {discarded_card}. Sisa kartu: {remaining}."
-                    
-                    skip_advance = False
-
-                    if pending.get("challenge_failed"):
-                        if pending.get("blocker_proved"):
-                            msg = msg + " Block berhasil, aksi dibatalkan."
-                        elif pending.get("action") == "exchange":
-                            pending_actions[room_code] = {
-                                "actor_id": pending.get("actor_id"),
-                                "action": "exchange",
-                                "target_id": pending.get("target_id"),
-                                "timestamp": time.time(),
-                                "game_id": game_id,
-                                "stage": "card_selection",
-                                "awaiting_from": pending.get("actor_id")
-                            }
-                            msg = msg + " Aksi exchange berhasil, pilih kartu untuk ditukar."
-                            skip_advance = True
-                        else:
-                            game_state, effect_msg = apply_action_effect(game_state, pending.get("actor_id"), pending.get("action"), pending.get("target_id"))
-                            if effect_msg:
-                                msg = msg + " " + effect_msg
-                    
-                    elif pending.get("block_failed"):
-                        original_action = pending.get("original_action")
-                        if original_action:
-                            game_state, effect_msg = apply_action_effect(game_state, pending.get("actor_id"), original_action, pending.get("target_id"))
-                            if effect_msg:
-                                msg = msg + " " + effect_msg
-                    
-                    if not skip_advance:
-                        game_state = advance_turn(game_state)
-                        del pending_actions[room_code]
-            else:
-                raise HTTPException(status_code=400, detail="Tahap pemilihan kartu tidak dikenal")
-        else:
-            if action_type == "block":
-                action_to_block = pending.get("action")
-                blockable_actions = ["foreign_aid", "assassinate", "steal"]
-                if action_to_block not in blockable_actions:
-                    raise HTTPException(status_code=400, detail=f"Aksi {action_to_block} tidak bisa di-block")
-                
-                if not block_card:
-                    raise HTTPException(status_code=400, detail="block_card harus disediakan untuk block")
-
-                # Only valid blockers can respond:
-                # - foreign_aid: anyone except the actor may block
-                # - assassinate / steal: only the target may block
-                target_id_pending = pending.get("target_id")
-                blocker_player = get_player(players, player_id)
-                target_player = get_player(players, target_id_pending) if target_id_pending else None
-                
-                if action_to_block in ["assassinate", "steal"]:
-                    if not target_player or str(blocker_player.get("id")) != str(target_player.get("id")):
-                        raise HTTPException(status_code=400, detail=f"Hanya target yang bisa memblokir aksi {action_to_block}")
-                elif action_to_block == "foreign_aid":
-                    actor_id_pending = pending.get("actor_id")
-                    actor_player = get_player(players, actor_id_pending)
-                    if actor_player and str(blocker_player.get("id")) == str(actor_player.get("id")):
-                        raise HTTPException(status_code=400, detail="Pelaku tidak bisa memblokir aksinya sendiri")
-
-                allowed_block_cards = {
-                    "foreign_aid": ["Duke"],
-                    "assassinate": ["Contessa"],
-                    "steal": ["Captain", "Ambassador"],
-                }
-                allowed_cards = allowed_block_cards.get(action_to_block, [])
-                if block_card not in allowed_cards:
-                    raise HTTPException(status_code=400, detail=f"{block_card} tidak bisa memblokir aksi {action_to_block}")
-                
-                blocker = blocker_player  # Use already retrieved blocker_player
-                
-                blocker_name = blocker.get("nickname") or "Anonymous" if blocker else "Unknown"
-                
-                # Check if blocker actually has the block card
-                if block_card not in blocker.get("hand", []):
-                    # Blocker claims to have card but doesn't - show notification
-                    msg = f"{blocker_name} mengklaim punya {block_card} tapi tidak! Aksi lanjut ke tahap challenge reaction."
-                    # Go directly to block_reaction stage so others can challenge the false claim
-                else:
-                    msg = f"{blocker_name} blokir dengan {block_card}!"
-                
-                pending_actions[room_code] = {
-                    "actor_id": pending["actor_id"],
-                    "action": pending["action"],
-                    "target_id": pending["target_id"],
-                    "timestamp": time.time(),
-                    "game_id": game_id,
-                    "stage": "block_reaction",
-                    "blocker_id": player_id,
-                    "block_card": block_card,
-                    "block_card_claimed": True
-                }
-            else:
-                current_stage = pending.get("stage")
-                if current_stage == "block_reaction":
-                    blocker_id = pending.get("blocker_id")
-                    block_card_used = pending.get("block_card")
-                    blocker = get_player(players, blocker_id)
-                    challenger = get_player(players, player_id)
-                    blocker_name = blocker.get("nickname") or "Anonymous" if blocker else "Unknown"
-                    challenger_name = challenger.get("nickname") or "Anonymous" if challenger else "Unknown"
-                    
-                    if blocker and block_card_used in blocker.get("hand", []):
-                        msg = f"{blocker_name} membuktikan {block_card_used}! Challenge gagal."
-                        pending_actions[room_code] = {
-                            "actor_id": pending["actor_id"],
-                            "action": pending["action"],
-                            "target_id": pending["target_id"],
-                            "timestamp": time.time(),
-                            "game_id": game_id,
-                            "stage": "reveal_claim",
-                            "awaiting_from": blocker_id,
-                            "required_card": block_card_used,
-                            "next_card_selection_from": player_id,
-                            "blocker_proved": True,
-                            "original_action": pending.get("action")
-                        }
-                    else:
-                        msg = f"Challenge sukses! {blocker_name} tidak punya {block_card_used}."
-                        pending_actions[room_code] = {
-                            "actor_id": pending["actor_id"],
-                            "action": pending["action"],
-                            "target_id": pending["target_id"],
-                            "timestamp": time.time(),
-                            "game_id": game_id,
-                            "stage": "card_selection",
-                            "awaiting_from": blocker_id,
-                            "block_failed": True,
-                            "original_action": pending.get("action")
-                        }
-                else:
-                    current_action = pending.get("action")
-                    if not can_challenge_action(current_action):
-                        raise HTTPException(status_code=400, detail=f"Aksi {current_action} tidak bisa di-challenge")
-                    
-                    actor = get_player(players, pending.get("actor_id"))
-                    challenger = get_player(players, player_id)
-                    actor_name = actor.get("nickname") or "Anonymous" if actor else "Unknown"
-                    challenger_name = challenger.get("nickname") or "Anonymous" if challenger else "Unknown"
-                    
-                    action_to_card = {"tax": "Duke", "assassinate": "Assassin", "steal": "Captain", "exchange": "Ambassador"}
-                    claimed_card = action_to_card.get(pending.get("action"), "Unknown")
-                    
-                    if actor and claimed_card in actor.get("hand", []):
-                        msg = f"Challenge gagal! {actor_name} memiliki {claimed_card}. {challenger_name} harus discard kartu."
-                        pending_actions[room_code] = {
-                            "actor_id": pending["actor_id"],
-                            "action": pending["action"],
-                            "target_id": pending["target_id"],
-                            "timestamp": time.time(),
-                            "game_id": game_id,
-                            "stage": "reveal_claim",
-                            "awaiting_from": pending["actor_id"],
-                            "required_card": claimed_card,
-                            "next_card_selection_from": player_id,
-                            "challenge_failed": True
-                        }
-                    else:
-                        msg = f"Challenge sukses! {actor_name} tidak punya {claimed_card}. {actor_name} harus discard kartu."
-                        pending_actions[room_code] = {
-                            "actor_id": pending["actor_id"],
-                            "action": pending["action"],
-                            "target_id": pending["target_id"],
-                            "timestamp": time.time(),
-                            "game_id": game_id,
-                            "stage": "card_selection",
-                            "awaiting_from": pending["actor_id"]
-                        }
-    else:
-        actor = get_player(players, player_id)
-        if not actor:
-            raise HTTPException(status_code=400, detail="Pemain tidak ditemukan")
-        
-        current_turn_player = players[game_state.get("turn", 0)] if game_state.get("turn") is not None else None
-        if current_turn_player and str(current_turn_player.get("id")) != str(actor.get("id")):
-            raise HTTPException(status_code=400, detail="Bukan giliran Anda")
-        
-        if not validate_action(actor, action_type, game_state, target_id):
-            raise HTTPException(status_code=400, detail=f"Aksi '{action_type}' tidak valid")
-        
-        if action_type == "income":
-            actor["coins"] += 1
-            actor_name = actor.get("nickname") or "Anonymous"
-            msg = f"{actor_name} mengambil Income (+1 coin)."
-            game_state = advance_turn(game_state)
-            if room_code in pending_actions:
-                del pending_actions[room_code]
-        elif action_type == "coup" and target_id:
-            if actor["coins"] < 7:
-                raise HTTPException(status_code=400, detail="Tidak cukup coins untuk Coup")
-            actor["coins"] -= 7
-            target = get_player(players, target_id)
-            if not target:
-                raise HTTPException(status_code=400, detail="Target tidak ditemukan")
-            target_name = target.get("nickname") or "Anonymous"
-            msg = f"{actor['nickname']} melakukan Coup ke {target_name}! {target_name} harus memilih kartu untuk dibuang."
-            pending_actions[room_code] = {
-                "actor_id": player_id,
-                "action": action_type,
-                "target_id": target_id,
-                "timestamp": time.time(),
-                "game_id": game_id,
-                "stage": "card_selection",
-                "awaiting_from": target_id
-            }
-        elif action_type == "assassinate" and target_id:
-            if actor["coins"] < 3:
-                raise HTTPException(status_code=400, detail="Tidak cukup coins untuk Assassinate")
-            actor["coins"] -= 3
-            target = get_player(players, target_id)
-            if not target:
-                raise HTTPException(status_code=400, detail="Target tidak ditemukan")
-            target_name = target.get("nickname") or "Anonymous"
-            msg = f"{actor['nickname']} mengklaim Assassin dan mengasumsir {target_name}!"
-            pending_actions[room_code] = {
-                "actor_id": player_id,
-                "action": action_type,
-                "target_id": target_id,
-                "timestamp": time.time(),
-                "game_id": game_id,
-                "stage": "reaction"
-            }
-        elif action_type in ["tax", "steal", "foreign_aid", "exchange"]:
-            if action_type == "tax":
-                msg = f"{actor['nickname']} mengklaim Duke dan akan mengambil Tax (+3 coins)."
-            elif action_type == "steal" and target_id:
-                target = get_player(players, target_id)
-                if not target:
-                    raise HTTPException(status_code=400, detail="Target tidak ditemukan")
-                target_name = target.get("nickname") or "Anonymous"
-                msg = f"{actor['nickname']} mengklaim Captain dan akan mencuri dari {target_name}!"
-            elif action_type == "foreign_aid":
-                msg = f"{actor['nickname']} mengambil Foreign Aid (+2 coins)."
-            elif action_type == "exchange":
-                msg = f"{actor['nickname']} mengklaim Ambassador dan akan menukar kartu!"
-            
-            pending_actions[room_code] = {
-                "actor_id": player_id,
-                "action": action_type,
-                "target_id": target_id,
-                "timestamp": time.time(),
-                "game_id": game_id,
-                "stage": "reaction"
-            }
-        else:
-            raise HTTPException(status_code=400, detail="Aksi tidak valid")
     
-    for p in game_state["players"]:
-        _ensure_revealed_length(p)
-        supabase.table("game_players").update({
-            "coins": p["coins"],
-            "hand": json.dumps(p["hand"]),
-            "revealed": json.dumps(p["revealed"]),
-            "is_alive": p["is_alive"]
-        }).eq("id", p["id"]).execute()
+    players = room["players"]
+    seats = room_store.index(room_code)
+    target = None
+    if target_id:
+        target = seats.get(target_id, engine.UNKNOWN)
+    card = None
+    if block_card:
+        card = engine.CARD_CODES.get(block_card, engine.UNKNOWN)
+    command = engine.Command(action_type, seats.get(player_id), target, card_index, card)
     
-    supabase.table("games").update({
-        "turn": game_state["turn"],
-        "deck": json.dumps(game_state["deck"]),
-        "trash": json.dumps(game_state.get("trash", [])),
-        "winner": game_state.get("winner"),
-        "game_over": game_state.get("game_over", False)
-    }).eq("id", game_id).execute()
+    # The engine never mutates its input, so a rejected action leaves the live room untouched
+    with tracer.span("rules"):
+        before = engine.from_room(room, pending, seats)
+        try:
+            state, events = engine.step(before, command)
+        except engine.RuleError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        game_state = engine.to_room(room, state)
+        msg = engine.describe(events, [p.get("nickname") or "Anonymous" for p in players])
+    if state.pending is None:
+        pending_actions.pop(room_code, None)
+    elif state.pending is not before.pending:
+        # Every stage transition restarts the reaction window
+        pending_actions[room_code] = {
+            **engine.pending_to_dict(state.pending, seats.keys),
+            "timestamp": time.time(),
+            "game_id": game_id,
+        }
+    if event_log.enabled:
+        actor = seats.keys[command.seat] if command.seat is not None else str(player_id)
+        with tracer.span("event_log.record"):
+            event_log.record(room_code, game_state, action_type, actor,
+                             command_payload(before, state, command, events, expired),
+                             settled=state.pending is None)
+    room_store.put(room_code, game_state, logged=event_log.enabled)
+    sync_reaction_timer(room_code)
+    if expired:
+        msg = f"Waktu habis. {msg}"
+    if game_state.get("game_over") or hub.shared:
+        # With several workers the commit has to land before anyone else acts on this state
+        await flush_room(room_code)
+    elif room_code not in pending_actions:
+        # Turn boundary: persist now instead of waiting for the write-behind delay
+        room_store.schedule_flush(room_code)
     
     game_state_for_broadcast = {
         "id": game_id,
@@ -703,145 +456,222 @@ async def game_action(
         "trash": game_state.get("trash", []),
         "game_over": game_state.get("game_over", False),
         "winner": game_state.get("winner"),
-        "status": game_data.get("status", "started")
+        "status": room.get("status", "started")
     }
+
+    with tracer.span("pending.store"):
+        await store_pending(room_code)
+    with tracer.span("publish"):
+        await publish_room(room_code, "action", game_state, game=game_state_for_broadcast, msg=msg)
     
-    if room_code in active_connections:
-        for entry in active_connections[room_code]:
-            try:
-                viewer = entry.get("player_id")
-                masked = mask_state_for_viewer({"game": game_state_for_broadcast, "players": game_state["players"]}, viewer)
-                payload = {"type": "action", "msg": msg, "gameState": masked}
-                if room_code in pending_actions:
-                    pa = pending_actions[room_code]
-                    payload["pending_action"] = {
-                        "actor_id": pa["actor_id"],
-                        "action": pa["action"],
-                        "target_id": pa.get("target_id"),
-                        "awaiting_from": pa.get("awaiting_from"),
-                        "required_card": pa.get("required_card"),
-                        "time_remaining": max(0, 60 - (time.time() - pa["timestamp"])),
-                        "stage": pa["stage"],
-                        "blocker_id": pa.get("blocker_id"),
-                        "block_card": pa.get("block_card")
-                    }
-                await entry["ws"].send_text(json.dumps(payload))
-            except Exception:
-                pass
-    
-    return {"message": msg, "gameState": {"game": game_state_for_broadcast, "players": game_state["players"]}, "pending_action": pending_actions.get(room_code)}
+    # The actor's masked view, the same one its sockets get; usually already built by the publish
+    view = {"game": game_state_for_broadcast, "players": game_state["players"]}
+    bc = broadcast.build(room_code, room_store.version(room_code), view, seats)
+    return {"message": msg, "gameState": bc.view(player_id),
+            "pending_action": pending_action_payload(pending_actions.get(room_code), seats)}
+
+
+def sync_reaction_timer(room_code):
+    """Keep the room's expiry timer in step with its current pending action."""
+    pa = pending_actions.get(room_code)
+    if pa is None:
+        reaction_timers.cancel(room_code)
+        return
+    deadline = pa["timestamp"] + REACTION_WINDOW
+    if reaction_timers.deadline(room_code) != deadline:
+        reaction_timers.schedule(room_code, deadline, expire_pending_action, room_code, pa["timestamp"])
+
+
+def default_card_index(player, pending):
+    """Card chosen for a player who let a card selection time out."""
+    hand = player.get("hand", [])
+    required = pending.get("required_card")
+    if pending.get("stage") == "reveal_claim" and required in hand:
+        return hand.index(required)
+    revealed = player.get("revealed") or []
+    for idx in range(len(hand)):
+        if idx >= len(revealed) or not revealed[idx]:
+            return idx
+    return 0
+
+
+async def expire_pending_action(room_code, timestamp):
+    await room_executor.run(room_code, _expire_pending_action, room_code, timestamp)
+
+
+async def _expire_pending_action(room_code, timestamp):
+    """Resolve a pending action nobody answered: reactions pass, selections take a default card."""
+    await refresh_pending(room_code)
+    pa = pending_actions.get(room_code)
+    if pa is None or pa["timestamp"] != timestamp:
+        return
+    room = await load_room(room_code)
+    if room is None or room.get("game_over"):
+        del pending_actions[room_code]
+        await store_pending(room_code)
+        return
+    if pa.get("stage") in ("reaction", "block_reaction"):
+        await _game_action(room_code, pa["actor_id"], "pass", None, None, None, None, None, None, expired=True)
+        return
+    player = get_player(room["players"], pa.get("awaiting_from"), room_store.index(room_code))
+    if player is None:
+        del pending_actions[room_code]
+        await store_pending(room_code)
+        return
+    card_index = default_card_index(player, pa)
+    await _game_action(room_code, pa.get("awaiting_from"), "select_card", None, card_index, None, None, None, None, expired=True)
 
 
 @router.post("/game/leave")
 async def leave_game(room_code: str = Body(..., embed=True), player_id: str = Body(..., embed=True)):
-    game = supabase.table("games").select("*").eq("room_code", room_code).execute()
-    if not game.data:
+    return await room_executor.run(room_code, _leave_game, room_code, player_id)
+
+async def _leave_game(room_code, player_id):
+    room = await load_room(room_code)
+    if room is None:
         raise HTTPException(status_code=404, detail="Game tidak ditemukan")
-    game_id = game.data[0]["id"]
+    game_id = room["id"]
 
     try:
-        deleted = None
+        deleted = []
         try:
             uuid.UUID(str(player_id))
-            deleted = supabase.table("game_players").delete().eq("game_id", game_id).eq("user_id", player_id).execute()
-        except Exception:
-            deleted = supabase.table("game_players").delete().eq("game_id", game_id).eq("guest_id", player_id).execute()
-
-        if deleted and (not deleted.data):
-            supabase.table("game_players").delete().eq("game_id", game_id).eq("nickname", player_id).execute()
+            deleted = await repository.delete_players(game_id, user_id=player_id)
+        except ValueError:
+            pass
+        # Guest session ids are UUIDs too, but they are stored in guest_id
+        if not deleted:
+            deleted = await repository.delete_players(game_id, guest_id=player_id)
+        if not deleted:
+            deleted = await repository.delete_players(game_id, nickname=player_id)
     except postgrest_exceptions.APIError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    try:
-        state = supabase.table("games").select("*").eq("room_code", room_code).execute().data[0]
-        try:
-            players = supabase.table("game_players").select("*").eq("game_id", state["id"]).order("id", {"ascending": True}).execute().data
-        except Exception:
-            players = supabase.table("game_players").select("*").eq("game_id", state["id"]).execute().data
-        for p in players:
-            try:
-                p["hand"] = json.loads(p.get("hand") or "[]")
-                p["revealed"] = json.loads(p.get("revealed") or "[false,false]")
-            except Exception:
-                p["hand"] = []
-                p["revealed"] = [False, False]
-            _ensure_revealed_length(p)
-        if room_code in active_connections:
-            for entry in list(active_connections[room_code]):
-                try:
-                    import json as _json
-                    viewer = entry.get("player_id")
-                    masked = mask_state_for_viewer({"game": state, "players": players}, viewer)
-                    await entry["ws"].send_text(_json.dumps({"type": "lobby_update", **masked}))
-                except Exception:
-                    pass
-    except Exception:
-        pass
+    deleted_ids = {str(row.get("id")) for row in deleted}
+    if deleted_ids:
+        room["players"] = [p for p in room["players"] if str(p.get("id")) not in deleted_ids]
+        room_store.reindex(room_code)
+        if room.get("status") == "started":
+            # Logged events address players by seat; snapshot the new seating right away
+            room_store.mark_dirty(room_code)
+            await flush_room(room_code)
+
+    await broadcast_lobby(room_code, room)
 
     return {"message": "Left"}
 
 
 @router.websocket("/ws/{room_code}")
-async def websocket_endpoint(websocket: WebSocket, room_code: str, player_id: Optional[str] = Query(None)):
+async def websocket_endpoint(websocket: WebSocket, room_code: str, player_id: Optional[str] = Query(None),
+                             role: Optional[str] = Query(None), encoding: Optional[str] = Query(None),
+                             since: Optional[int] = Query(None)):
     await websocket.accept()
-    
-    if room_code not in active_connections:
-        active_connections[room_code] = []
-    
-    connection_entry = {"ws": websocket, "player_id": player_id}
-    active_connections[room_code].append(connection_entry)
+
+    codec = wire.negotiate(encoding)
+    conn = connection_manager.connect(room_code, websocket, player_id, spectator=role == "spectator", codec=codec)
     
     try:
-        game = supabase.table("games").select("*").eq("room_code", room_code).execute()
-        if game.data:
-            game_id = game.data[0]["id"]
-            players = supabase.table("game_players").select("*").eq("game_id", game_id).execute().data
-            for p in players:
-                try:
-                    p["hand"] = json.loads(p.get("hand") or "[]")
-                    p["revealed"] = json.loads(p.get("revealed") or "[false,false]")
-                except Exception:
-                    p["hand"] = []
-                    p["revealed"] = [False, False]
-                _ensure_revealed_length(p)
-            
-            state_to_send = {"game": game.data[0], "players": players}
-            masked = mask_state_for_viewer(state_to_send, player_id)
-            
-            payload = {"type": "lobby_update", **masked}
-            if room_code in pending_actions:
-                pa = pending_actions[room_code]
-                payload["pending_action"] = {
-                    "actor_id": pa["actor_id"],
-                    "action": pa["action"],
-                    "target_id": pa.get("target_id"),
-                    "awaiting_from": pa.get("awaiting_from"),
-                    "required_card": pa.get("required_card"),
-                    "time_remaining": max(0, 60 - (time.time() - pa["timestamp"])),
-                    "stage": pa["stage"]
-                }
-            
-            await websocket.send_text(json.dumps(payload))
+        missed = None
+        # A room this worker follows is current in memory; only then can the ring stand in for a load
+        if (since is not None and not conn.spectator and hub.subscribed(room_code)
+                and room_store.index(room_code).get(player_id) is not None):
+            missed = resume_buffer.since(room_code, since, room_store.version(room_code))
+        if missed is not None:
+            resume_socket(conn, room_code, since, missed)
+        else:
+            room = await load_room(room_code)
+            # Receive this room's events from every worker while we hold a socket for it
+            await hub.subscribe(room_code)
+            await refresh_pending(room_code)
+            if room_store.index(room_code).get(player_id) is None:
+                # No seat, no hand to see: the socket gets the spectator stream and its delay
+                connection_manager.watch(conn)
+            if conn.spectator:
+                send_spectator_view(conn, room_code, room)
+            elif room is not None:
+                version = room_store.version(room_code)
+                bc = broadcast.build(room_code, version, room_view(room), room_store.index(room_code))
+                payload = {"type": "lobby_update", **delta.snapshot(conn, version, bc.view(player_id, codec))}
+                pending_payload = pending_action_payload(pending_actions.get(room_code), bc.seats)
+                if pending_payload is not None:
+                    payload["pending_action"] = pending_payload
+                conn.send(bc.message(codec, payload, player_id))
         
         while True:
             try:
                 data = await websocket.receive_text()
-                if data == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
             except WebSocketDisconnect:
                 break
             except Exception:
                 break
+            connection_manager.touch(conn)
+            if data == "ping":
+                conn.send(codec.dumps({"type": "pong"}))
+                continue
+            try:
+                message = json.loads(data)
+            except ValueError:
+                continue
+            if not isinstance(message, dict):
+                continue
+            if conn.spectator:
+                if message.get("type") == "resync":
+                    send_spectator_view(conn, room_code, room_store.get(room_code))
+            elif message.get("type") == "ack":
+                delta.acknowledge(conn, message.get("version"))
+            elif message.get("type") == "resync":
+                # Client lost its base state: start over from a full snapshot
+                delta.reset(conn)
+                room = room_store.get(room_code)
+                if room is not None:
+                    version = room_store.version(room_code)
+                    bc = broadcast.build(room_code, version, room_view(room), room_store.index(room_code))
+                    payload = {"type": "action", "msg": None, **delta.snapshot(conn, version, bc.view(player_id, codec))}
+                    pending_payload = pending_action_payload(pending_actions.get(room_code), bc.seats)
+                    if pending_payload is not None:
+                        payload["pending_action"] = pending_payload
+                    conn.send(bc.message(codec, payload, player_id, "gameState"))
     
     except WebSocketDisconnect:
         pass
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        if room_code in active_connections:
-            active_connections[room_code] = [
-                entry for entry in active_connections[room_code]
-                if entry["ws"] != websocket
-            ]
-            if len(active_connections[room_code]) == 0:
-                del active_connections[room_code]
+        connection_manager.disconnect(conn)
+        if not connection_manager.occupied(room_code):
+            spectator_stream.forget(room_code)
+            if hub.shared:
+                # Events stop arriving once unsubscribed, so the ring would silently fall behind
+                resume_buffer.forget(room_code)
+            await hub.unsubscribe(room_code)
+
+
+def send_spectator_view(conn, room_code, room):
+    """Send a spectator the public view it starts from."""
+    message = spectator_start(room_code, room)
+    # While everything is still held back it arrives with the stream
+    if message is not None:
+        conn.send(message.get(conn.codec))
+
+
+def spectator_start(room_code, room):
+    """The public message a viewer without a seat starts from, or None if the delay still holds it back."""
+    if spectator_stream.delayed:
+        known, message = spectator_stream.joining(room_code)
+        if known:
+            return message
+    if room is None:
+        return None
+    version = room_store.version(room_code)
+    bc = broadcast.build(room_code, version, room_view(room), room_store.index(room_code))
+    payload = {"type": "lobby_update"}
+    pending_payload = pending_action_payload(pending_actions.get(room_code), bc.seats)
+    if pending_payload is not None:
+        payload["pending_action"] = pending_payload
+    message = SharedMessage(lambda codec: bc.message(codec, payload, None), version, lambda: bc.view_json(None))
+    changed_at = room_store.changed_at.get(room_code)
+    if spectator_stream.delayed and (changed_at is None or time.time() - changed_at < spectator_stream.delay):
+        # First spectator of a room that changed within the delay: the current state goes through it too
+        spectator_stream.publish(room_code, message)
+        return None
+    return message
@@ -0,0 +1,370 @@
+"""Vectorized Coup engine: K games of the same size advanced together with NumPy.
+
+State is a handful of arrays (coins, two card slots per player with an
+influence bitmask, the deck as a card-code array with a size pointer, trash
+counts, turn pointers). ``step`` resolves one whole turn for every game at
+once, reactions included, with the same rules as ``backend.engine``:
+``legal`` mirrors ``validate_action``, ``BLOCKERS`` ``can_block_action`` and
+``_apply_effect`` ``apply_action_effect``. The card a player loses or swaps is
+picked per game by ``card_index`` into their live cards, like ``select_card``
+(a revealed claim is always the first matching card), and the loser of a
+challenge against an exchange swaps a card instead of discarding, as the
+engine does.
+
+Games that reach a state the engine would reject (e.g. a reveal with an empty
+deck) are flagged in ``stalled`` and stop advancing.
+
+Requires NumPy, which the web server does not need (listed in
+``requirements-dev.txt``):
+
+    pip install -r requirements-dev.txt
+"""
+
+import numpy as np
+
+from backend import engine
+from backend.engine import Action, CARD_TYPES
+
+NUM_CARDS = len(CARD_TYPES)
+DECK_SIZE = NUM_CARDS * 3
+NUM_ACTIONS = len(Action)
+
+# Card claimed by each action, -1 where there is no claim to challenge
+CLAIM_CARD = np.full(NUM_ACTIONS, -1, dtype=np.int8)
+for _action, _card in engine.CLAIMS.items():
+    CLAIM_CARD[_action] = _card
+
+# BLOCK_ALLOWED[action, card]: ``card`` may block ``action``
+BLOCK_ALLOWED = np.zeros((NUM_ACTIONS, NUM_CARDS), dtype=bool)
+for _action, _cards in engine.BLOCKERS.items():
+    BLOCK_ALLOWED[_action, list(_cards)] = True
+
+TARGETED = np.zeros(NUM_ACTIONS, dtype=bool)
+TARGETED[[int(a) for a in engine.TARGETED]] = True
+
+
+class BatchState:
+    __slots__ = ("coins", "cards", "live", "deck", "deck_size", "trash", "turn", "game_over", "winner", "stalled")
+
+    def __init__(self, coins, cards, live, deck, deck_size, trash, turn):
+        size = coins.shape[0]
+        self.coins = coins
+        self.cards = cards
+        self.live = live
+        self.deck = deck
+        self.deck_size = deck_size
+        self.trash = trash
+        self.turn = turn
+        self.game_over = np.zeros(size, dtype=bool)
+        self.winner = np.full(size, -1, dtype=np.int32)
+        self.stalled = np.zeros(size, dtype=bool)
+
+    @property
+    def size(self):
+        return self.coins.shape[0]
+
+    @property
+    def players(self):
+        return self.coins.shape[1]
+
+    def alive(self):
+        return self.live != 0
+
+
+def new_batch(size, players, rng):
+    """``size`` freshly dealt games of ``players`` each, like ``engine.new_game``."""
+    base = np.repeat(np.arange(NUM_CARDS, dtype=np.int8), 3)
+    deck = base[rng.random((size, DECK_SIZE)).argsort(axis=1)]
+    top = DECK_SIZE - 1 - 2 * np.arange(players)
+    cards = np.stack([deck[:, top], deck[:, top - 1]], axis=2)
+    return BatchState(
+        coins=np.full((size, players), 2, dtype=np.int32),
+        cards=cards,
+        live=np.full((size, players), 3, dtype=np.uint8),
+        deck=deck,
+        deck_size=np.full(size, DECK_SIZE - 2 * players, dtype=np.int32),
+        trash=np.zeros((size, NUM_CARDS), dtype=np.int32),
+        turn=rng.integers(0, players, size).astype(np.int32),
+    )
+
+
+def legal(state, action, target):
+    """Per-game ``validate_action`` for the player whose turn it is."""
+    g = np.arange(state.size)
+    actor = state.turn
+    coins = state.coins[g, actor]
+    has_target = target >= 0
+    ok = state.alive()[g, actor] & (action >= 0) & (action < NUM_ACTIONS)
+    ok &= np.where(action == Action.COUP, (coins >= 7) & has_target, True)
+    ok &= np.where(action == Action.ASSASSINATE, (coins >= 3) & has_target, True)
+    ok &= np.where(action == Action.STEAL, has_target, True)
+    return ok
+
+
+def holds(state, g, seat, card):
+    """Whether ``seat`` still has ``card`` among its live cards, per game in ``g``."""
+    live = state.live[g, seat]
+    cards = state.cards[g, seat]
+    return (((live & 1) != 0) & (cards[:, 0] == card)) | (((live & 2) != 0) & (cards[:, 1] == card))
+
+
+def _none(size):
+    return np.full(size, -1, dtype=np.int32)
+
+
+def step(state, action, target, challenger=None, blocker=None, block_card=None, block_challenger=None,
+         card_index=None):
+    """Play one turn in every game; returns the mask of games that advanced.
+
+    ``action``/``target`` are the turn player's choice. Reactions are per-game
+    seats or cards with -1 for none: ``challenger`` challenges the claim,
+    otherwise ``blocker`` blocks with ``block_card`` and ``block_challenger``
+    may challenge that block. ``card_index`` is the card chosen by whoever
+    has to discard or swap one this turn (default 0). Reactions the engine
+    would refuse are ignored; illegal turn actions and finished games are
+    skipped.
+    """
+    size = state.size
+    challenger = _none(size) if challenger is None else challenger
+    blocker = _none(size) if blocker is None else blocker
+    block_card = _none(size) if block_card is None else block_card
+    block_challenger = _none(size) if block_challenger is None else block_challenger
+    index = np.zeros(size, dtype=np.int32) if card_index is None else card_index
+
+    g = np.arange(size)
+    actor = state.turn
+    action = np.asarray(action)
+    target = np.asarray(target)
+    ok = ~state.game_over & ~state.stalled & legal(state, action, target)
+    safe_action = np.clip(action, 0, NUM_ACTIONS - 1)
+
+    claim = CLAIM_CARD[safe_action]
+    challenged = ok & (challenger >= 0) & (claim >= 0)
+    valid_blocker = np.where(TARGETED[safe_action], blocker == target, blocker != actor)
+    blocked = (ok & ~challenged & (blocker >= 0) & (block_card >= 0) & valid_blocker
+               & BLOCK_ALLOWED[safe_action, np.clip(block_card, 0, NUM_CARDS - 1)])
+    block_challenged = blocked & (block_challenger >= 0)
+
+    proven = challenged & holds(state, g, actor, claim)
+    block_proven = block_challenged & holds(state, g, np.maximum(blocker, 0), block_card)
+    # A proven claim is replaced from the deck, which the engine refuses when empty
+    state.stalled |= (proven | block_proven) & (state.deck_size == 0)
+    ok &= ~state.stalled
+    challenged &= ok
+    proven &= ok
+    blocked &= ok
+    block_challenged &= ok
+    block_proven &= ok
+
+    coins = state.coins
+    coins[g[ok & (action == Action.COUP)], actor[ok & (action == Action.COUP)]] -= 7
+    coins[g[ok & (action == Action.ASSASSINATE)], actor[ok & (action == Action.ASSASSINATE)]] -= 3
+
+    # Challenged claim: the loser of the challenge discards; a proven claim still resolves
+    # As in the engine, any card selection during an exchange is an exchange by whoever owes it,
+    # so the loser of an exchange challenge swaps a card instead of discarding one
+    exchange = action == Action.EXCHANGE
+    bluffed = challenged & ~proven
+    _reveal_and_replace(state, proven, actor, claim)
+    _lose(state, proven & ~exchange, challenger, index)
+    _exchange(state, proven & exchange, challenger, index)
+    _lose(state, bluffed & ~exchange, actor, index)
+    _exchange(state, bluffed & exchange, actor, index)
+    _apply_effect(state, proven & ~exchange, actor, action, target)
+
+    # Challenged block: a proven block stands, a bluffed one lets the action through
+    _reveal_and_replace(state, block_proven, blocker, block_card)
+    _lose(state, block_proven, block_challenger, index)
+    block_failed = block_challenged & ~block_proven
+    _lose(state, block_failed, blocker, index)
+    _apply_effect(state, block_failed, actor, action, target)
+
+    # Nobody reacted
+    plain = ok & ~challenged & ~blocked
+    coins[g[plain & (action == Action.INCOME)], actor[plain & (action == Action.INCOME)]] += 1
+    _exchange(state, plain & (action == Action.EXCHANGE), actor, index)
+    _lose(state, plain & ((action == Action.ASSASSINATE) | (action == Action.COUP)), target, index)
+    _apply_effect(state, plain, actor, action, target)
+
+    ok &= ~state.stalled
+    _advance(state, ok)
+    return ok
+
+
+def _slot(live, index):
+    """The card slot holding the ``index``-th live card (the only one when a card is gone)."""
+    return np.where(live == 3, np.minimum(index, 1), np.where((live & 1) != 0, 0, 1))
+
+
+def _lose(state, mask, seat, index):
+    """Discard the ``index``-th live card of ``seat`` in the masked games."""
+    g = np.nonzero(mask)[0]
+    if not len(g):
+        return
+    s = seat[g]
+    live = state.live[g, s]
+    empty = live == 0
+    if empty.any():
+        # The engine rejects a discard from an empty hand
+        state.stalled[g[empty]] = True
+        g, s, live = g[~empty], s[~empty], live[~empty]
+    slot = _slot(live, index[g])
+    np.add.at(state.trash, (g, state.cards[g, s, slot]), 1)
+    state.live[g, s] = live & ~(1 << slot).astype(np.uint8)
+
+
+def _reveal_and_replace(state, mask, seat, card):
+    """Trash the claimed card and draw a replacement from the top of the deck."""
+    g = np.nonzero(mask)[0]
+    if not len(g):
+        return
+    s = seat[g]
+    c = card[g]
+    first = ((state.live[g, s] & 1) != 0) & (state.cards[g, s, 0] == c)
+    slot = np.where(first, 0, 1)
+    np.add.at(state.trash, (g, c), 1)
+    state.deck_size[g] -= 1
+    state.cards[g, s, slot] = state.deck[g, state.deck_size[g]]
+
+
+def _exchange(state, mask, seat, index):
+    """Swap the ``index``-th live card with the top of the deck, which keeps the old card on top."""
+    g = np.nonzero(mask & (state.deck_size > 0))[0]
+    if not len(g):
+        return
+    s = seat[g]
+    slot = _slot(state.live[g, s], index[g])
+    top = state.deck_size[g] - 1
+    old = state.cards[g, s, slot].copy()
+    state.cards[g, s, slot] = state.deck[g, top]
+    state.deck[g, top] = old
+
+
+def _apply_effect(state, mask, actor, action, target):
+    """``apply_action_effect`` for the masked games."""
+    coins = state.coins
+    for code, amount in ((Action.TAX, 3), (Action.FOREIGN_AID, 2)):
+        g = np.nonzero(mask & (action == code))[0]
+        coins[g, actor[g]] += amount
+    g = np.nonzero(mask & (action == Action.STEAL))[0]
+    if len(g):
+        stolen = np.minimum(2, np.maximum(0, coins[g, target[g]]))
+        coins[g, target[g]] -= stolen
+        coins[g, actor[g]] += stolen
+
+
+def _advance(state, mask):
+    """``advance_turn`` for the masked games."""
+    g = np.nonzero(mask)[0]
+    if not len(g):
+        return
+    n = state.players
+    alive = state.alive()[g]
+    remaining = alive.sum(axis=1)
+    over = remaining <= 1
+    if over.any():
+        done = g[over]
+        state.game_over[done] = True
+        state.winner[done] = np.where(remaining[over] == 1, alive[over].argmax(axis=1), -1)
+    g, alive = g[~over], alive[~over]
+    seats = (state.turn[g, None] + np.arange(1, n + 1)) % n
+    rows = np.arange(len(g))[:, None]
+    state.turn[g] = seats[np.arange(len(g)), alive[rows, seats].argmax(axis=1)]
+
+
+# ------------------------------------------------------------------ rollouts
+
+def _pick(rng, mask):
+    """A uniformly random True column per row of ``mask`` (-1 where none)."""
+    keys = np.where(mask, rng.random(mask.shape), -1.0)
+    choice = keys.argmax(axis=1)
+    return np.where(mask.any(axis=1), choice, -1).astype(np.int32)
+
+
+def _first(reacts, start):
+    """Per row, the first seat after ``start`` (wrapping, ``start`` itself last) with ``reacts`` set, or -1."""
+    n = reacts.shape[1]
+    seats = (start[:, None] + np.arange(1, n + 1)) % n
+    rows = np.arange(len(start))[:, None]
+    ordered = reacts[rows, seats]
+    first = seats[np.arange(len(start)), ordered.argmax(axis=1)]
+    return np.where(ordered.any(axis=1), first, -1).astype(np.int32)
+
+
+def random_turn(state, rng):
+    """``simulate.random_policy`` for every game.
+
+    The turn is uniform over legal (action, target) pairs, as the scalar
+    policy chooses among ``turn_options``. Reactions are asked seat by seat
+    from the actor's left: each lets it go half the time, otherwise picks
+    uniformly among its options including letting it go, and the first seat
+    that reacts is the one heard. A lost or swapped card is uniform over the
+    live cards.
+    """
+    size, n = state.size, state.players
+    g = np.arange(size)
+    actor = state.turn
+    alive = state.alive()
+    others = alive.copy()
+    others[g, actor] = False
+    targets = others.sum(axis=1)
+    coins = state.coins[g, actor]
+
+    # Targeted actions count once per target, like the expanded option list
+    weight = np.ones((size, NUM_ACTIONS))
+    weight[:, Action.COUP] = np.where(coins >= 7, targets, 0)
+    weight[:, Action.ASSASSINATE] = np.where(coins >= 3, targets, 0)
+    weight[:, Action.STEAL] = targets
+    cumulative = weight.cumsum(axis=1)
+    draw = rng.random(size) * cumulative[:, -1]
+    action = (cumulative <= draw[:, None]).sum(axis=1).astype(np.int32)
+    target = np.where(TARGETED[action], _pick(rng, others), -1).astype(np.int32)
+
+    # Reaction options per seat besides letting it go: a challenge, then one block per allowed card
+    claimed = CLAIM_CARD[action] >= 0
+    blocks = BLOCK_ALLOWED[action].sum(axis=1)
+    may_block = np.where((action == Action.FOREIGN_AID)[:, None], others,
+                         others & (np.arange(n) == target[:, None]))
+    options = np.where(others, claimed[:, None].astype(np.int32), 0) + np.where(may_block, blocks[:, None], 0)
+    reacts = (rng.random((size, n)) < 0.5) & (rng.random((size, n)) * (options + 1) >= 1)
+    reactor = _first(reacts, actor)
+    seat = np.maximum(reactor, 0)
+    choice = (rng.random(size) * options[g, seat]).astype(np.int32)
+    challenge = (reactor >= 0) & claimed & (choice == 0)
+    challenger = np.where(challenge, reactor, -1).astype(np.int32)
+    block = (reactor >= 0) & ~challenge
+    blocker = np.where(block, reactor, -1).astype(np.int32)
+    nth = choice - claimed
+    allowed = BLOCK_ALLOWED[action]
+    block_card = np.where(block, (allowed.cumsum(axis=1) <= nth[:, None]).sum(axis=1), -1).astype(np.int32)
+
+    # A block is then challenged by anyone still in but the blocker, the actor included, a quarter of the time
+    can_challenge = alive.copy()
+    can_challenge[g, seat] = False
+    block_challenger = np.where(block, _first(can_challenge & (rng.random((size, n)) < 0.25), actor), -1)
+    card_index = rng.integers(0, 2, size).astype(np.int32)
+    return action, target, challenger, blocker, block_card, block_challenger.astype(np.int32), card_index
+
+
+def rollout(size, players, rng, max_turns=1000):
+    """Play ``size`` random games to the end.
+
+    Returns ``(state, turns, openings)``: the final batch, turns taken per
+    game, and each player's first action (-1 if they never acted).
+    """
+    state = new_batch(size, players, rng)
+    g = np.arange(size)
+    turns = np.zeros(size, dtype=np.int32)
+    openings = np.full((size, players), -1, dtype=np.int8)
+    for _ in range(max_turns):
+        active = ~state.game_over & ~state.stalled
+        if not active.any():
+            break
+        actor = state.turn.copy()
+        action, *reactions = random_turn(state, rng)
+        played = step(state, action, *reactions)
+        turns += played
+        first = played & (openings[g, actor] < 0)
+        openings[g[first], actor[first]] = action[first]
+    state.stalled |= ~state.game_over
+    return state, turns, openings
@@ -0,0 +1,406 @@
+"""Benchmarks for the rules hot path, view masking and the action endpoint.
+
+    python -m backend.bench                       # table on stdout
+    python -m backend.bench --output base.json    # also save machine-readable results
+    python -m backend.bench --compare base.json   # exit 1 if a case got slower
+
+Three groups of cases:
+
+* ``logic.*``: the ``game_logic`` primitives on a six-player room.
+* ``mask.*`` / ``fanout.*``: ``mask_state_for_viewer`` for 2-6 players, and the
+  broadcast cost of rendering one state for 0-50 connected viewers (seated
+  players first, then spectators). ``wire.*``: a snapshot and a patch
+  message for every seat of a six-player room, per wire encoding.
+* ``action.*``: ``POST /api/game/action`` through the whole app against
+  ``backend.fake_supabase``, with every player on a socket and any further
+  viewers connected as spectators.
+  Also reports Supabase requests per move, and ``GET /api/game/state`` polls
+  of the final state (``action.state``).
+
+Timings are microseconds per operation; compare runs from the same machine.
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import platform
+import random
+import sys
+import time
+
+import httpx
+
+from backend import broadcast, delta, game_logic, wire
+from backend.fake_supabase import FakeSupabase
+
+PLAYER_COUNTS = (2, 3, 4, 5, 6)
+VIEWER_COUNTS = (0, 1, 10, 50)
+# (players, connected viewers) for the endpoint cases
+ACTION_ROOMS = ((2, 2), (4, 4), (6, 6), (4, 50))
+# The pending action a patch carries in the wire.patch cases
+PENDING = {
+    "actor_id": "guest-1", "action": "tax", "target_id": None, "awaiting_from": None, "required_card": None,
+    "time_remaining": 59.5, "stage": "reaction", "blocker_id": None, "block_card": None,
+}
+# A case is a regression when its p50 grows by more than this fraction
+DEFAULT_THRESHOLD = 0.25
+
+
+def _stats(samples, **extra):
+    samples = sorted(samples)
+    n = len(samples)
+
+    def pick(fraction):
+        return round(samples[min(n - 1, int(fraction * n))], 3)
+
+    return {
+        "samples": n,
+        "mean_us": round(sum(samples) / n, 3),
+        "min_us": round(samples[0], 3),
+        "p50_us": pick(0.5),
+        "p95_us": pick(0.95),
+        "p99_us": pick(0.99),
+        **extra,
+    }
+
+
+def measure(fn, min_time=0.2, repeat=30):
+    """Per-call time of ``fn()`` in microseconds, over ``repeat`` timed loops."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed * repeat >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) / number * 1e6)
+    return _stats(samples, loops=number)
+
+
+# ------------------------------------------------------------------- states
+
+def make_players(n, rng):
+    deck = game_logic.create_deck()
+    hands, deck = game_logic.deal_cards(deck, n)
+    players = []
+    for seat, hand in enumerate(hands):
+        players.append({
+            "id": seat + 1,
+            "game_id": "bench",
+            "user_id": None,
+            "guest_id": f"guest-{seat}",
+            "nickname": f"player{seat}",
+            "coins": rng.randint(0, 9),
+            "is_alive": True,
+            "hand": hand,
+            "revealed": [False, False],
+        })
+    return players, deck
+
+
+def make_room_state(n, rng):
+    """``{"game", "players"}`` as ``room_view`` produces it, mid-game with a revealed card."""
+    players, deck = make_players(n, rng)
+    players[0]["revealed"] = [True, False]
+    game = {
+        "id": "bench",
+        "room_code": "BENCH",
+        "status": "started",
+        "deck": deck,
+        "trash": [players[0]["hand"][0]],
+        "turn": 1,
+        "game_over": False,
+        "winner": None,
+    }
+    return {"game": game, "players": players}
+
+
+# ------------------------------------------------------------------- groups
+
+def bench_logic(rng, **opts):
+    players, deck = make_players(6, rng)
+    state = {"players": players, "deck": deck, "turn": 0}
+    last = players[-1]["guest_id"]
+    yield "logic.get_player[first]", measure(lambda: game_logic.get_player(players, "guest-0"), **opts)
+    yield "logic.get_player[last]", measure(lambda: game_logic.get_player(players, last), **opts)
+    yield "logic.get_player[missing]", measure(lambda: game_logic.get_player(players, "nobody"), **opts)
+    index = game_logic.PlayerIndex(players)
+    yield "logic.get_player[indexed]", measure(lambda: game_logic.get_player(players, last, index), **opts)
+    yield "logic.player_index[build]", measure(lambda: game_logic.PlayerIndex(players), **opts)
+    yield "logic.advance_turn", measure(lambda: game_logic.advance_turn(state), **opts)
+    # Swapping with the top of the deck keeps hand and deck sizes constant
+    yield "logic.execute_exchange", measure(lambda: game_logic.execute_exchange(state, last, 0), **opts)
+    for action, kwargs in (
+        ("income", {}),
+        ("steal", {"target_id": "guest-0"}),
+        ("tax", {"challenge_by": "guest-0", "claim_card": "Duke"}),
+        ("foreign_aid", {"block_by": "guest-0", "block_card": "Duke"}),
+    ):
+        yield f"logic.process_action[{action}]", measure(
+            lambda: game_logic.process_action(state, last, action, **kwargs), **opts)
+
+
+def bench_masking(rng, **opts):
+    from backend.api.game import mask_state_for_viewer
+
+    for n in PLAYER_COUNTS:
+        state = make_room_state(n, rng)
+        yield f"mask.view[players={n},viewer=player]", measure(
+            lambda: mask_state_for_viewer(state, "guest-0"), **opts)
+        yield f"mask.view[players={n},viewer=spectator]", measure(
+            lambda: mask_state_for_viewer(state, None), **opts)
+        for viewers in VIEWER_COUNTS:
+            # Seated players first, the rest are spectators sharing one public message
+            viewer_ids = [f"guest-{i}" for i in range(min(viewers, n))]
+            spectators = viewers > n
+
+            def fanout():
+                bc = broadcast.RoomBroadcast(state)
+                for viewer_id in viewer_ids:
+                    bc.view_json(viewer_id)
+                if spectators:
+                    bc.view_json(None)
+
+            yield f"fanout.render[players={n},viewers={viewers}]", measure(fanout, **opts)
+
+    # A full snapshot message for each seat of a six-player room, per wire encoding
+    state = make_room_state(6, rng)
+    fields = {"type": "action", "msg": "bench", "version": 1}
+    for name, codec in wire.CODECS.items():
+        def encode():
+            bc = broadcast.RoomBroadcast(state)
+            for seat in range(6):
+                bc.message(codec, fields, f"guest-{seat}", "gameState")
+
+        bc = broadcast.RoomBroadcast(state)
+        size = len(bc.message(codec, fields, "guest-0", "gameState"))
+        yield f"wire.encode[encoding={name}]", dict(measure(encode, **opts), bytes=size)
+
+    # The patch message each seat gets after a turn passes with coins spent
+    after = copy.deepcopy(state)
+    after["game"]["turn"] = 2
+    after["players"][1]["coins"] = 0
+    for name, codec in wire.CODECS.items():
+        before_bc, after_bc = broadcast.RoomBroadcast(state), broadcast.RoomBroadcast(after)
+        patches = [
+            delta.diff_views(before_bc.view(f"guest-{seat}", codec), after_bc.view(f"guest-{seat}", codec), codec)
+            for seat in range(6)
+        ]
+
+        def patch_messages():
+            pending = wire.Keyed(PENDING)
+            for seat, patch in enumerate(patches):
+                codec.dumps({"type": "action", "msg": "bench", "version": 2, "base": 1,
+                             "patch": patch, "pending_action": pending})
+
+        yield f"wire.patch[encoding={name}]", measure(patch_messages, **opts)
+
+
+class NullSocket:
+    """Accepts and discards everything sent to a connected viewer."""
+
+    async def send_text(self, text):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+
+async def _action_room(client, room_code, players):
+    await client.post("/api/game/create", json={"host_id": "bench-host", "room_code": room_code})
+    ids = [f"{room_code}-{seat}" for seat in range(players)]
+    for seat, player_id in enumerate(ids):
+        await client.post("/api/game/join", json={
+            "room_code": room_code, "player_id": player_id, "nickname": f"player{seat}",
+        })
+    await client.post("/api/game/start", json={"room_code": room_code})
+    state = (await client.get("/api/game/state", params={"room_code": room_code})).json()
+    return ids, state["game"]["turn"]
+
+
+async def _bench_actions(moves):
+    from backend.api.game import on_room_event
+    from backend.connections import connection_manager
+    from backend.main import app
+    from backend.pubsub import hub
+    from backend.repository import repository
+    from backend.room_store import room_store
+    from backend.timers import reaction_timers
+
+    fake = FakeSupabase()
+    repository.transport = fake.transport()
+    await repository.aclose()
+    await hub.start(on_room_event)
+    room_store.start()
+    reaction_timers.start()
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            for players, viewers in ACTION_ROOMS:
+                room_code = f"B{players}V{viewers}"
+                ids, turn = await _action_room(client, room_code, players)
+                conns = [connection_manager.connect(room_code, NullSocket(), ids[i] if i < players else None,
+                                                    spectator=i >= players)
+                         for i in range(viewers)]
+                await room_store.flush_all()
+                fake.reset_calls()
+                latencies = {"income": [], "steal": [], "pass": []}
+                requests = 0
+
+                async def act(kind, player_id, **fields):
+                    started = time.perf_counter()
+                    res = await client.post("/api/game/action", json={
+                        "room_code": room_code, "player_id": player_id, "action_type": kind, **fields,
+                    })
+                    latencies[kind].append((time.perf_counter() - started) * 1e6)
+                    if res.status_code != 200:
+                        raise RuntimeError(f"{kind} failed: {res.status_code} {res.text}")
+                    return res.json()
+
+                for move in range(moves):
+                    actor = ids[turn]
+                    if move % 2:
+                        # Coins only grow, so every turn stays legal and the room never finishes
+                        body = await act("income", actor)
+                    else:
+                        await act("steal", actor, target_id=ids[(turn + 1) % players])
+                        body = await act("pass", actor)
+                    requests += 2 - move % 2
+                    turn = body["gameState"]["game"]["turn"]
+                    # Let socket writers and write-behind flushes run between moves
+                    await asyncio.sleep(0)
+                await room_store.flush_all()
+                calls = sum(fake.calls.values())
+                # Polling reads of one room version, as the lobby poller and fetchAndRenderState do
+                state_latencies = []
+                for i in range(moves):
+                    started = time.perf_counter()
+                    res = await client.get("/api/game/state", params={"room_code": room_code,
+                                                                      "viewer_id": ids[i % players]})
+                    state_latencies.append((time.perf_counter() - started) * 1e6)
+                    if res.status_code != 200:
+                        raise RuntimeError(f"state failed: {res.status_code} {res.text}")
+                for conn in conns:
+                    connection_manager.disconnect(conn)
+                for kind, samples in latencies.items():
+                    yield f"action.{kind}[players={players},viewers={viewers}]", _stats(samples)
+                yield f"action.state[players={players},viewers={viewers}]", _stats(state_latencies)
+                yield f"action.supabase[players={players},viewers={viewers}]", {
+                    "requests": requests,
+                    "supabase_calls": calls,
+                    "supabase_calls_per_request": round(calls / requests, 3),
+                    "calls": dict(fake.calls),
+                }
+    finally:
+        await reaction_timers.stop()
+        await room_store.stop()
+        await hub.stop()
+        await repository.aclose()
+
+
+def bench_actions(rng, moves=200, **opts):
+    async def collect():
+        return [item async for item in _bench_actions(moves)]
+
+    yield from asyncio.run(collect())
+
+
+GROUPS = {
+    "logic": bench_logic,
+    "mask": bench_masking,
+    "action": bench_actions,
+}
+
+
+# ------------------------------------------------------------------- driver
+
+def run(groups, seed=0, min_time=0.2, repeat=30, moves=200, only=None):
+    rng = random.Random(seed)
+    random.seed(seed)
+    results = {}
+    for name in groups:
+        kwargs = {"min_time": min_time, "repeat": repeat}
+        if name == "action":
+            kwargs = {"moves": moves}
+        for case, stats in GROUPS[name](rng, **kwargs):
+            if only is None or only in case:
+                results[case] = stats
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "timestamp": int(time.time()),
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Cases whose p50 grew by more than ``threshold`` against ``baseline``."""
+    regressions = []
+    for case, stats in current["results"].items():
+        before = baseline.get("results", {}).get(case)
+        if not before or "p50_us" not in stats or not before.get("p50_us"):
+            continue
+        ratio = stats["p50_us"] / before["p50_us"]
+        if ratio > 1 + threshold:
+            regressions.append({"case": case, "before_us": before["p50_us"], "after_us": stats["p50_us"],
+                                "ratio": round(ratio, 3)})
+    return regressions
+
+
+def print_results(result):
+    for case, stats in result["results"].items():
+        if "p50_us" in stats:
+            print(f"{case:55} p50 {stats['p50_us']:>10.2f}us  p95 {stats['p95_us']:>10.2f}us  "
+                  f"p99 {stats['p99_us']:>10.2f}us")
+        else:
+            print(f"{case:55} {stats['supabase_calls_per_request']} Supabase calls per request")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coup server benchmarks")
+    parser.add_argument("--group", action="append", choices=list(GROUPS),
+                        help="run only this group (repeatable; default: all)")
+    parser.add_argument("--filter", default=None, help="only report cases containing this text")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per micro-benchmark case")
+    parser.add_argument("--repeat", type=int, default=30, help="timed samples per micro-benchmark case")
+    parser.add_argument("--moves", type=int, default=200, help="turns played per endpoint case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--output", default=None, help="also write the JSON results to this file")
+    parser.add_argument("--compare", default=None, help="baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed p50 growth before a case counts as a regression")
+    args = parser.parse_args()
+
+    result = run(args.group or list(GROUPS), args.seed, args.min_time, args.repeat, args.moves, args.filter)
+    if args.compare:
+        with open(args.compare) as f:
+            result["regressions"] = compare(result, json.load(f), args.threshold)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print_results(result)
+        for regression in result.get("regressions", ()):
+            print(f"REGRESSION {regression['case']}: {regression['before_us']}us -> "
+                  f"{regression['after_us']}us (x{regression['ratio']})")
+    if result.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+from backend import wire
+from backend.game_logic import PlayerIndex
+from backend.room_store import decode_json
+
+# Public views remembered per room so patches can be diffed against older bases
+HISTORY_SIZE = 32
+# Columns clients see; bookkeeping columns (version, event_seq, timestamps, game_id) stay server-side
+GAME_FIELDS = ("id", "room_code", "status", "turn", "trash", "winner", "game_over")
+PLAYER_FIELDS = ("id", "user_id", "guest_id", "nickname", "coins", "hand", "revealed", "is_alive")
+# Ids that prove a seat (see PlayerIndex.get): only ever in the player's own entry, never in the public view
+CREDENTIAL_FIELDS = ("user_id", "guest_id")
+
+_history = {}
+
+
+def _revealed_for(hand, revealed):
+    revealed = list(revealed or [])
+    if len(revealed) < len(hand):
+        revealed.extend([False] * (len(hand) - len(revealed)))
+    return revealed[:len(hand)]
+
+
+class RoomBroadcast:
+    """Every viewer's masked view of one room state, built from a single parse.
+
+    The shared public view (all hands masked) is computed once per key
+    schema and serialized once per wire encoding; a viewer's view only swaps
+    in that viewer's own seat.
+    """
+
+    def __init__(self, state, index=None):
+        game = state.get("game") or {}
+        game_view = {k: game[k] for k in GAME_FIELDS if k in game}
+        # Clients only need the size of the deck, never its order
+        game_view["deck_count"] = len(decode_json(game.get("deck"), []))
+        game_view["trash"] = decode_json(game.get("trash"), [])
+        self.game = game_view
+
+        self.players = []
+        self.own = []
+        players = state.get("players") or []
+        # Seat lookup by any client id; the room's own index when the caller has it
+        self.seats = index if index is not None else PlayerIndex(players)
+        for p in players:
+            hand = decode_json(p.get("hand"), [])
+            revealed = _revealed_for(hand, decode_json(p.get("revealed"), [False, False]))
+            own = {k: p[k] for k in PLAYER_FIELDS if k in p}
+            own["hand"] = hand
+            own["revealed"] = revealed
+            public = {k: v for k, v in own.items() if k not in CREDENTIAL_FIELDS}
+            public["hand"] = [hand[i] if revealed[i] else "?" for i in range(len(hand))]
+            self.own.append(own)
+            self.players.append(public)
+
+        # key schema -> (game, public players, own players) with that schema's keys
+        self._views = {"long": (self.game, self.players, self.own)}
+        # codec name -> (game, public players, {seat: own player}) encoded with that codec
+        self._encoded = {}
+        # Shared public patches keyed by (key schema, base version), filled by backend/delta.py
+        self.patches = {}
+
+    def seat_of(self, viewer_id):
+        return self.seats.get(viewer_id)
+
+    def _schema(self, codec):
+        views = self._views.get(codec.schema)
+        if views is None:
+            keyed = codec.keyed
+            views = self._views[codec.schema] = (
+                keyed(self.game), [keyed(p) for p in self.players], [keyed(p) for p in self.own],
+            )
+        return views
+
+    def public_view(self, codec=wire.DEFAULT):
+        game, players, _ = self._schema(codec)
+        return {codec.key("game"): game, codec.key("players"): players}
+
+    def view(self, viewer_id, codec=wire.DEFAULT):
+        """Masked view for ``viewer_id``: public view with the viewer's own hand, in ``codec``'s keys."""
+        game, players, own = self._schema(codec)
+        seat = self.seat_of(viewer_id)
+        if seat is not None:
+            players = list(players)
+            players[seat] = own[seat]
+        return {codec.key("game"): game, codec.key("players"): players}
+
+    def _fragments(self, codec):
+        encoded = self._encoded.get(codec.name)
+        if encoded is None:
+            game, players, _ = self._schema(codec)
+            encoded = self._encoded[codec.name] = (codec.encode(game), [codec.encode(p) for p in players], {})
+        return encoded
+
+    def encoded_view(self, viewer_id, codec=wire.DEFAULT):
+        """``view(viewer_id)`` encoded with ``codec``, spliced from pre-encoded fragments."""
+        game, fragments, own_encoded = self._fragments(codec)
+        seat = self.seat_of(viewer_id)
+        if seat is not None:
+            own = own_encoded.get(seat)
+            if own is None:
+                own = own_encoded[seat] = codec.encode(self._schema(codec)[2][seat])
+            fragments = list(fragments)
+            fragments[seat] = own
+        return codec.view(game, fragments)
+
+    def view_json(self, viewer_id):
+        """JSON text of ``view(viewer_id)``, as ``GET /api/game/state`` returns it."""
+        return self.encoded_view(viewer_id)
+
+    def message(self, codec, fields, viewer_id, key=None):
+        """Encode ``fields`` plus ``viewer_id``'s view, nested under ``key`` or merged in if ``key`` is None."""
+        return codec.splice(fields, self.encoded_view(viewer_id, codec), key)
+
+
+def build(room_code, version, state, index=None):
+    """Return the broadcast for ``version``, reusing it if already built."""
+    history = _history.setdefault(room_code, {})
+    broadcast = history.get(version)
+    if broadcast is None:
+        broadcast = history[version] = RoomBroadcast(state, index)
+        while len(history) > HISTORY_SIZE:
+            del history[min(history)]
+    return broadcast
+
+
+def past(room_code, version):
+    """A previously built broadcast of the room, if it is still remembered."""
+    return _history.get(room_code, {}).get(version)
+
+
+def rooms():
+    """Rooms with broadcasts in the history."""
+    return list(_history)
+
+
+def forget(room_code):
+    _history.pop(room_code, None)
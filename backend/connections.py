@@ -0,0 +1,301 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from backend import metrics, wire
+from backend.timers import reaction_timers
+from backend.tracing import tracer
+
+# Outbound messages buffered per socket before it is considered too slow
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+# How long a socket may lag behind the newest message before it is dropped
+MAX_SEND_LAG = float(os.getenv("WS_MAX_SEND_LAG_MS", "5000")) / 1000.0
+# Close a socket the client has sent nothing on for this long; 0 disables it
+IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT_MS", "75000")) / 1000.0
+# Not 1001, so the browser client reconnects (see connectWS in static/game.js)
+IDLE_CLOSE_CODE = 4000
+IDLE_TIMER_KEY = "connections:idle"
+CLOSE_TIMEOUT = 1.0
+
+
+class Connection:
+    """One WebSocket with its own bounded outbound queue and writer task."""
+
+    def __init__(self, manager, room_code, ws, player_id, spectator=False, codec=wire.DEFAULT):
+        self.manager = manager
+        self.room_code = room_code
+        self.ws = ws
+        self.player_id = player_id
+        # Wire encoding negotiated on connect, see backend/wire.py
+        self.codec = codec
+        # Spectators share the room's public stream, see backend/spectators.py
+        self.spectator = spectator
+        self.queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.sending_since = None
+        self.closed = False
+        # Delta protocol state, see backend/delta.py
+        self.views = {}
+        self.acked_version = None
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def label(self):
+        return "spectator" if self.spectator else str(self.player_id)
+
+    def send(self, text):
+        """Queue an encoded message (text, or bytes for binary codecs) without waiting.
+
+        Returns False if the socket was dropped.
+        """
+        if self.closed:
+            return False
+        now = time.monotonic()
+        if self.sending_since is not None and now - self.sending_since > MAX_SEND_LAG:
+            self.manager.drop(self, "send stalled")
+            return False
+        try:
+            # The sampled trace of the request that produced the message, to time its write
+            self.queue.put_nowait((now, text, tracer.current()))
+        except asyncio.QueueFull:
+            self.manager.drop(self, "send queue full")
+            return False
+        return True
+
+    async def _write_loop(self):
+        try:
+            while True:
+                queued_at, text, trace = await self.queue.get()
+                self.sending_since = time.monotonic()
+                if self.sending_since - queued_at > MAX_SEND_LAG:
+                    self.manager.drop(self, "lagging")
+                    return
+                started = time.perf_counter()
+                if isinstance(text, bytes):
+                    await self.ws.send_bytes(text)
+                else:
+                    await self.ws.send_text(text)
+                if trace is not None:
+                    trace.add("ws.send", started, time.perf_counter(), viewer=self.label(), bytes=len(text),
+                              queued_ms=round((self.sending_since - queued_at) * 1000, 3))
+                self.sending_since = None
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            self.manager.drop(self, "send failed")
+
+    async def close(self, code=1013):
+        self.closed = True
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        try:
+            await asyncio.wait_for(self.ws.close(code=code), CLOSE_TIMEOUT)
+        except Exception:
+            pass
+
+
+class Session:
+    """One player's open sockets (browser tabs) in a room."""
+
+    __slots__ = ("room_code", "player_id", "conns")
+
+    def __init__(self, room_code, player_id):
+        self.room_code = room_code
+        self.player_id = player_id
+        # Connection -> None; a dict keeps tabs in connect order with O(1) add and remove
+        self.conns = {}
+
+    def __len__(self):
+        return len(self.conns)
+
+    def __iter__(self):
+        return iter(self.conns)
+
+
+class ConnectionManager:
+    """Tracks room sockets and fans messages out without blocking the caller.
+
+    Player sockets are grouped into one ``Session`` per ``(room, player)``, so
+    a player with several tabs is one entry with several sockets. Spectators
+    are kept per room, together with player sockets whose ``player_id`` has
+    no seat. Adding and removing a socket is O(1).
+
+    A socket that sends nothing (not even the client's ``"ping"`` heartbeat)
+    for ``WS_IDLE_TIMEOUT_MS`` is closed. Sockets are kept in order of their
+    last activity and a single entry on the shared deadline timer fires for
+    the oldest one, so activity costs a dict move and no timer operation.
+    """
+
+    def __init__(self, timers=None, idle_timeout=IDLE_TIMEOUT):
+        # room_code -> {player_id: Session}
+        self.rooms = {}
+        # room_code -> {Connection: None}
+        self.watchers = {}
+        self.timers = timers
+        self.idle_timeout = idle_timeout
+        # Connection -> last activity (time.time()), least recently active first
+        self.activity = OrderedDict()
+
+    # ------------------------------------------------------------- membership
+
+    def connect(self, room_code, ws, player_id=None, spectator=False, codec=wire.DEFAULT):
+        conn = Connection(self, room_code, ws, None if spectator else player_id, spectator, codec)
+        self._add(conn)
+        self.touch(conn)
+        return conn
+
+    def disconnect(self, conn):
+        conn.closed = True
+        if conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+        self.activity.pop(conn, None)
+        self._remove(conn)
+
+    def watch(self, conn, spectator=True):
+        """Move a player socket to the room's spectators, or back with ``spectator=False``.
+
+        The socket keeps its ``player_id``, so it can take the seat back if the
+        player joins (again).
+        """
+        if conn.closed or conn.spectator == spectator:
+            return
+        self._remove(conn)
+        conn.spectator = spectator
+        self._add(conn)
+
+    def reseat(self, room_code, seat_of):
+        """After seats changed, move each socket to where its ``player_id`` now belongs."""
+        for conn in self.connections(room_code):
+            if seat_of(conn.player_id) is None:
+                self.watch(conn)
+        for conn in self.spectators(room_code):
+            if conn.player_id is not None and seat_of(conn.player_id) is not None:
+                self.watch(conn, spectator=False)
+
+    def _add(self, conn):
+        if conn.spectator:
+            self.watchers.setdefault(conn.room_code, {})[conn] = None
+            return
+        sessions = self.rooms.setdefault(conn.room_code, {})
+        session = sessions.get(conn.player_id)
+        if session is None:
+            session = sessions[conn.player_id] = Session(conn.room_code, conn.player_id)
+        session.conns[conn] = None
+
+    def _remove(self, conn):
+        if conn.spectator:
+            conns = self.watchers.get(conn.room_code)
+            if conns is None:
+                return
+            conns.pop(conn, None)
+            if not conns:
+                del self.watchers[conn.room_code]
+            return
+        sessions = self.rooms.get(conn.room_code)
+        session = sessions.get(conn.player_id) if sessions is not None else None
+        if session is None:
+            return
+        session.conns.pop(conn, None)
+        if not session.conns:
+            del sessions[conn.player_id]
+            if not sessions:
+                del self.rooms[conn.room_code]
+
+    def drop(self, conn, reason):
+        """Disconnect a slow or broken consumer and close its socket in the background."""
+        if conn.closed:
+            return
+        metrics.fanout_failures.inc(reason)
+        print(f"Dropping WebSocket in room {conn.room_code} ({conn.player_id}): {reason}")
+        self.disconnect(conn)
+        asyncio.ensure_future(conn.close())
+
+    def close_room(self, room_code, code=1001):
+        """Disconnect every socket of a room that is going away and close them in the background."""
+        conns = self.connections(room_code) + self.spectators(room_code)
+        self.rooms.pop(room_code, None)
+        self.watchers.pop(room_code, None)
+        for conn in conns:
+            conn.closed = True
+            self.activity.pop(conn, None)
+            asyncio.ensure_future(conn.close(code))
+        return len(conns)
+
+    # ---------------------------------------------------------------- lookups
+
+    def connections(self, room_code):
+        """Player sockets of the room, grouped by player."""
+        return [conn for session in self.rooms.get(room_code, {}).values() for conn in session.conns]
+
+    def spectators(self, room_code):
+        return list(self.watchers.get(room_code, ()))
+
+    def occupied(self, room_code):
+        """Whether any player or spectator socket is open on the room."""
+        return room_code in self.rooms or room_code in self.watchers
+
+    def counts(self):
+        """Open ``(sessions, player sockets, spectator sockets)`` on this worker."""
+        sessions = [session for room in self.rooms.values() for session in room.values()]
+        return len(sessions), sum(len(s) for s in sessions), sum(len(c) for c in self.watchers.values())
+
+    def all_connections(self):
+        """Every open socket on this worker."""
+        conns = [conn for room in self.rooms.values() for session in room.values() for conn in session.conns]
+        for watchers in self.watchers.values():
+            conns.extend(watchers)
+        return conns
+
+    # --------------------------------------------------------------- fan-out
+
+    def broadcast(self, room_code, render):
+        """Queue ``render(conn)`` for every socket in the room; ``None`` skips a socket."""
+        trace = tracer.current()
+        for conn in self.connections(room_code):
+            started = time.perf_counter()
+            try:
+                text = render(conn)
+            except Exception as e:
+                metrics.fanout_failures.inc("render error")
+                print(f"Broadcast render error: {e}")
+                continue
+            if trace is not None:
+                trace.add("ws.render", started, time.perf_counter(), viewer=conn.label())
+            if text is not None:
+                conn.send(text)
+
+    def broadcast_spectators(self, room_code, message):
+        """Queue one shared message on every spectator socket, encoded once per codec via ``message.get``."""
+        with tracer.span("ws.spectators", room=room_code):
+            for conn in self.spectators(room_code):
+                conn.send(message.get(conn.codec))
+
+    # ---------------------------------------------------------- idle timeouts
+
+    def touch(self, conn):
+        """Record activity from the client (any frame it sent)."""
+        if conn.closed or self.timers is None or self.idle_timeout <= 0:
+            return
+        self.activity[conn] = time.time()
+        self.activity.move_to_end(conn)
+        if self.timers.deadline(IDLE_TIMER_KEY) is None:
+            self._schedule_idle()
+
+    def _schedule_idle(self):
+        if self.activity:
+            oldest = next(iter(self.activity.values()))
+            self.timers.schedule(IDLE_TIMER_KEY, oldest + self.idle_timeout, self._expire_idle)
+
+    async def _expire_idle(self):
+        cutoff = time.time() - self.idle_timeout
+        while self.activity:
+            conn, seen = next(iter(self.activity.items()))
+            if seen > cutoff:
+                break
+            metrics.ws_idle_closed.inc()
+            print(f"Closing idle WebSocket in room {conn.room_code} ({conn.label()})")
+            self.disconnect(conn)
+            asyncio.ensure_future(conn.close(IDLE_CLOSE_CODE))
+        self._schedule_idle()
+
+
+connection_manager = ConnectionManager(reaction_timers)
@@ -0,0 +1,135 @@
+"""Versioned state patches for WebSocket broadcasts.
+
+Every state message carries the room ``version``. A client acknowledges the
+versions it has applied (``{"type": "ack", "version": v}``); later messages
+then carry only a ``patch`` against the newest acknowledged ``base``. Until
+the first ack, or when the client asks for a ``resync``, a full ``gameState``
+snapshot is sent instead.
+
+Patch format, applied to a copy of the client's state at ``base``::
+
+    {"game": {field: value}, "game_unset": [field],
+     "players": {"<index>": {field: value}}, "players_length": n}
+
+Views and patches are kept in the key schema of the connection's codec
+(see ``backend/wire.py``), so a compact client's patch is diffed with short
+keys rather than renamed after the fact.
+"""
+
+from backend import broadcast, wire
+
+# Unacknowledged views kept per connection before falling back to a snapshot
+MAX_UNACKED_VIEWS = 32
+
+
+def diff_fields(old, new):
+    """Fields of dict ``new`` that differ from ``old``."""
+    return {k: v for k, v in new.items() if k not in old or old[k] != v}
+
+
+def diff_views(old, new, codec=wire.DEFAULT):
+    """Return the patch that turns masked view ``old`` into ``new``, both in ``codec``'s keys."""
+    key = codec.key
+    patch = {}
+    old_game = old.get(key("game")) or {}
+    new_game = new.get(key("game")) or {}
+    game = diff_fields(old_game, new_game)
+    if game:
+        patch[key("game")] = game
+    unset = [k for k in old_game if k not in new_game]
+    if unset:
+        patch[key("game_unset")] = unset
+
+    old_players = old.get(key("players")) or []
+    new_players = new.get(key("players")) or []
+    players = {}
+    for idx, p in enumerate(new_players):
+        changed = diff_fields(old_players[idx], p) if idx < len(old_players) else p
+        if changed:
+            players[str(idx)] = changed
+    if players:
+        patch[key("players")] = players
+    if len(new_players) != len(old_players):
+        patch[key("players_length")] = len(new_players)
+    return patch
+
+
+def snapshot(conn, version, view):
+    """Record a full snapshot sent to ``conn``; the caller places ``view`` in the message."""
+    _remember(conn, version, view)
+    return {"version": version}
+
+
+def encode(conn, room_code, version, bc):
+    """Message fields for broadcast ``bc`` as seen by ``conn``.
+
+    Returns ``(fields, full)``; when ``full`` is true the client has no usable
+    base and the caller must add the viewer's full view as ``gameState``.
+    """
+    view = bc.view(conn.player_id, conn.codec)
+    base_version = conn.acked_version
+    base = conn.views.get(base_version) if base_version is not None else None
+    base_bc = broadcast.past(room_code, base_version) if base is not None else None
+    # Only the viewer's own entry carries its ids and patches never remove a field,
+    # so a viewer whose seat moved since its base starts over from a snapshot
+    if (base_bc is None or base_bc.seat_of(conn.player_id) != bc.seat_of(conn.player_id)
+            or len(conn.views) >= MAX_UNACKED_VIEWS):
+        reset(conn)
+        return snapshot(conn, version, view), True
+    _remember(conn, version, view)
+    patch = _viewer_patch(conn, base_version, base, base_bc, bc, view)
+    return {"version": version, "base": base_version, "patch": patch}, False
+
+
+def _viewer_patch(conn, base_version, base_view, base_bc, bc, view):
+    """Reuse the room-wide public patch and only diff the viewer's own seat."""
+    codec = conn.codec
+    players_key = codec.key("players")
+    seat = bc.seat_of(conn.player_id)
+    shared = bc.patches.get((codec.schema, base_version))
+    if shared is None:
+        shared = bc.patches[(codec.schema, base_version)] = diff_views(
+            base_bc.public_view(codec), bc.public_view(codec), codec,
+        )
+    if seat is None:
+        return shared
+    patch = dict(shared)
+    players = dict(shared.get(players_key, {}))
+    own = diff_fields(base_view[players_key][seat], view[players_key][seat])
+    if own:
+        players[str(seat)] = own
+    else:
+        players.pop(str(seat), None)
+    if players:
+        patch[players_key] = players
+    else:
+        patch.pop(players_key, None)
+    return patch
+
+
+def acknowledge(conn, version):
+    """Mark ``version`` as applied by the client and forget older views."""
+    if version not in conn.views:
+        return
+    if conn.acked_version is not None and version < conn.acked_version:
+        return
+    conn.acked_version = version
+    for v in [v for v in conn.views if v < version]:
+        del conn.views[v]
+
+
+def resume(conn, version, view):
+    """Start ``conn`` from the state at ``version`` that a reconnecting client still holds."""
+    reset(conn)
+    _remember(conn, version, view)
+    conn.acked_version = version
+
+
+def reset(conn):
+    """Forget everything the client has acknowledged (e.g. on resync)."""
+    conn.views.clear()
+    conn.acked_version = None
+
+
+def _remember(conn, version, view):
+    conn.views[version] = view
@@ -0,0 +1,643 @@
+"""Headless Coup rules engine.
+
+A pure state machine over a compact representation: cards are ints indexing
+``CARD_TYPES``, players are ``__slots__`` objects addressed by seat, and the
+pending action carries an explicit ``Stage``. ``step(state, command)`` returns a
+new state plus the events it produced, never touching its input and doing no
+I/O; an illegal command raises ``RuleError`` with the message shown to players.
+``from_room``/``to_room`` convert to and from the room dicts the server keeps.
+"""
+
+from enum import IntEnum
+
+from backend.game_logic import CARD_TYPES, PlayerIndex
+
+DUKE, ASSASSIN, CAPTAIN, AMBASSADOR, CONTESSA = range(len(CARD_TYPES))
+CARD_CODES = {name: code for code, name in enumerate(CARD_TYPES)}
+
+
+class Action(IntEnum):
+    INCOME = 0
+    FOREIGN_AID = 1
+    TAX = 2
+    COUP = 3
+    ASSASSINATE = 4
+    STEAL = 5
+    EXCHANGE = 6
+
+
+class Stage(IntEnum):
+    REACTION = 0
+    BLOCK_REACTION = 1
+    REVEAL_CLAIM = 2
+    CARD_SELECTION = 3
+
+
+class Event(IntEnum):
+    INCOME = 0             # seat
+    COUP = 1               # seat, target
+    CLAIM = 2              # seat, action, target
+    BLOCK_ACCEPTED = 3     # blocker, card, action
+    EXCHANGE_PENDING = 4   # -
+    ASSASSINATE_PENDING = 5  # -
+    ACTION_ACCEPTED = 6    # action
+    EFFECT = 7             # action, seat, target, amount
+    CLAIM_PROVEN = 8       # seat, card, trashed card
+    EXCHANGED = 9          # seat, deck size
+    EXCHANGE_FAILED = 10   # seat, card index (None: empty deck)
+    DISCARDED = 11         # seat, card, cards left
+    ELIMINATED = 12        # seat
+    BLOCK_STOOD = 13       # -
+    EXCHANGE_ALLOWED = 14  # -
+    BLOCK_CLAIMED = 15     # blocker, card, honest
+    BLOCK_CHALLENGED = 16  # blocker, card, proven
+    CHALLENGED = 17        # seat, challenger, card, proven
+    TURN = 18              # seat
+    GAME_OVER = 19         # winner seat or None
+
+
+ACTION_NAMES = {action: action.name.lower() for action in Action}
+ACTION_CODES = {name: action for action, name in ACTION_NAMES.items()}
+STAGE_NAMES = {stage: stage.name.lower() for stage in Stage}
+STAGE_CODES = {name: stage for stage, name in STAGE_NAMES.items()}
+
+# Mirrors game_logic.can_block_action / can_challenge_action
+BLOCKERS = {
+    Action.FOREIGN_AID: (DUKE,),
+    Action.ASSASSINATE: (CONTESSA,),
+    Action.STEAL: (CAPTAIN, AMBASSADOR),
+}
+CLAIMS = {
+    Action.TAX: DUKE,
+    Action.ASSASSINATE: ASSASSIN,
+    Action.STEAL: CAPTAIN,
+    Action.EXCHANGE: AMBASSADOR,
+}
+REACTIONS = ("challenge", "block", "select_card", "pass")
+TARGETED = (Action.COUP, Action.ASSASSINATE, Action.STEAL)
+
+# Command.target for an id that was given but matches nobody at the table
+UNKNOWN = -1
+
+
+class RuleError(Exception):
+    """The command is not legal in this state."""
+
+
+def card_name(card):
+    if card is None or not 0 <= card < len(CARD_TYPES):
+        return "Unknown"
+    return CARD_TYPES[card]
+
+
+class Player:
+    __slots__ = ("coins", "hand", "revealed", "alive")
+
+    def __init__(self, coins=2, hand=None, revealed=None, alive=True):
+        self.coins = coins
+        self.hand = hand if hand is not None else []
+        self.revealed = revealed if revealed is not None else [False] * len(self.hand)
+        self.alive = alive
+
+    def copy(self):
+        return Player(self.coins, list(self.hand), list(self.revealed), self.alive)
+
+
+class Pending:
+    """An action waiting on reactions or a card choice. Treated as immutable."""
+
+    __slots__ = (
+        "actor", "action", "target", "stage", "awaiting", "blocker", "block_card",
+        "required_card", "next_from", "challenge_failed", "blocker_proved",
+        "block_failed", "original_action",
+    )
+
+    def __init__(self, actor, action, target, stage, awaiting=None, blocker=None, block_card=None,
+                 required_card=None, next_from=None, challenge_failed=False, blocker_proved=False,
+                 block_failed=False, original_action=None):
+        self.actor = actor
+        self.action = action
+        self.target = target
+        self.stage = stage
+        self.awaiting = awaiting
+        self.blocker = blocker
+        self.block_card = block_card
+        self.required_card = required_card
+        self.next_from = next_from
+        self.challenge_failed = challenge_failed
+        self.blocker_proved = blocker_proved
+        self.block_failed = block_failed
+        self.original_action = original_action
+
+
+class State:
+    __slots__ = ("players", "deck", "trash", "turn", "pending", "game_over", "winner")
+
+    def __init__(self, players, deck, trash=None, turn=0, pending=None, game_over=False, winner=None):
+        self.players = players
+        self.deck = deck
+        self.trash = trash if trash is not None else []
+        self.turn = turn
+        self.pending = pending
+        self.game_over = game_over
+        self.winner = winner
+
+    def copy(self):
+        return State([p.copy() for p in self.players], list(self.deck), list(self.trash),
+                     self.turn, self.pending, self.game_over, self.winner)
+
+
+class Command:
+    """``kind`` is an action name or one of ``REACTIONS``; players are seats."""
+
+    __slots__ = ("kind", "seat", "target", "card_index", "card")
+
+    def __init__(self, kind, seat, target=None, card_index=None, card=None):
+        self.kind = kind
+        self.seat = seat
+        self.target = target
+        self.card_index = card_index
+        self.card = card
+
+
+def new_game(deck, num_players, turn=0):
+    """Deal two cards each from the top (end) of ``deck``, like ``deal_cards``."""
+    deck = list(deck)
+    players = [Player(2, [deck.pop(), deck.pop()]) for _ in range(num_players)]
+    return State(players, deck, turn=turn)
+
+
+def is_legal(state, seat, action, target=None):
+    """Mirrors ``game_logic.validate_action``."""
+    player = state.players[seat]
+    if not player.alive:
+        return False
+    if action == Action.COUP:
+        return player.coins >= 7 and target is not None
+    if action == Action.ASSASSINATE:
+        return player.coins >= 3 and target is not None
+    if action == Action.STEAL:
+        return target is not None
+    return action in ACTION_NAMES
+
+
+def step(state, command):
+    """Apply ``command`` to ``state``; returns ``(new_state, events)``."""
+    if state.game_over:
+        raise RuleError("Game sudah berakhir")
+    state = state.copy()
+    events = []
+    kind = command.kind
+    if kind in REACTIONS:
+        if state.pending is None:
+            raise RuleError("Tidak ada aksi yang pending untuk direaksi")
+        if kind == "pass":
+            _pass(state, events)
+        elif kind == "select_card":
+            _select_card(state, command, events)
+        elif kind == "block":
+            _block(state, command, events)
+        else:
+            _challenge(state, command, events)
+    else:
+        _turn_action(state, command, events)
+    return state, events
+
+
+# ------------------------------------------------------------------ commands
+
+def _turn_action(state, command, events):
+    seat = command.seat
+    if seat is None:
+        raise RuleError("Pemain tidak ditemukan")
+    if state.turn is not None and state.turn != seat:
+        raise RuleError("Bukan giliran Anda")
+    action = ACTION_CODES.get(command.kind)
+    target = command.target
+    if action is None or not is_legal(state, seat, action, target):
+        raise RuleError(f"Aksi '{command.kind}' tidak valid")
+    if target == UNKNOWN:
+        if action in TARGETED:
+            raise RuleError("Target tidak ditemukan")
+        target = None
+    actor = state.players[seat]
+
+    if action == Action.INCOME:
+        actor.coins += 1
+        events.append((Event.INCOME, seat))
+        _advance(state, events)
+        state.pending = None
+    elif action == Action.COUP:
+        actor.coins -= 7
+        events.append((Event.COUP, seat, target))
+        state.pending = Pending(seat, action, target, Stage.CARD_SELECTION, awaiting=target)
+    else:
+        if action == Action.ASSASSINATE:
+            actor.coins -= 3
+        events.append((Event.CLAIM, seat, action, target))
+        state.pending = Pending(seat, action, target, Stage.REACTION)
+
+
+def _pass(state, events):
+    pa = state.pending
+    if pa.stage == Stage.BLOCK_REACTION:
+        events.append((Event.BLOCK_ACCEPTED, pa.blocker, pa.block_card, pa.action))
+        _advance(state, events)
+        state.pending = None
+    elif pa.stage == Stage.REACTION:
+        if pa.action == Action.EXCHANGE:
+            state.pending = Pending(pa.actor, pa.action, pa.target, Stage.CARD_SELECTION, awaiting=pa.actor)
+            events.append((Event.EXCHANGE_PENDING,))
+        elif pa.action == Action.ASSASSINATE:
+            state.pending = Pending(pa.actor, pa.action, pa.target, Stage.CARD_SELECTION, awaiting=pa.target)
+            events.append((Event.ASSASSINATE_PENDING,))
+        else:
+            events.append((Event.ACTION_ACCEPTED, pa.action))
+            _apply_effect(state, pa.actor, pa.action, pa.target, events)
+            _advance(state, events)
+            state.pending = None
+    else:
+        raise RuleError("Tidak bisa pass pada tahap ini")
+
+
+def _select_card(state, command, events):
+    pa = state.pending
+    index = command.card_index
+    if index is None:
+        raise RuleError("card_index harus disediakan untuk select_card")
+    if pa.stage == Stage.REVEAL_CLAIM:
+        if pa.awaiting is None:
+            raise RuleError("Actor not found")
+        trashed = _reveal_and_replace(state, pa.awaiting, index, pa.required_card)
+        events.append((Event.CLAIM_PROVEN, pa.awaiting, pa.required_card, trashed))
+        state.pending = Pending(pa.actor, pa.action, pa.target, Stage.CARD_SELECTION, awaiting=pa.next_from,
+                                challenge_failed=True, blocker_proved=pa.blocker_proved)
+    elif pa.stage == Stage.CARD_SELECTION:
+        if pa.action == Action.EXCHANGE:
+            if pa.awaiting is None:
+                raise RuleError("Actor not found")
+            _exchange(state, pa.awaiting, index, events)
+            _advance(state, events)
+            state.pending = None
+            return
+        if pa.awaiting is None:
+            raise RuleError("Player not found")
+        player = state.players[pa.awaiting]
+        card = _discard(state, pa.awaiting, index)
+        if not player.alive:
+            events.append((Event.ELIMINATED, pa.awaiting))
+        else:
+            events.append((Event.DISCARDED, pa.awaiting, card, len(player.hand)))
+
+        if pa.challenge_failed:
+            if pa.blocker_proved:
+                events.append((Event.BLOCK_STOOD,))
+            elif pa.action == Action.EXCHANGE:
+                state.pending = Pending(pa.actor, Action.EXCHANGE, pa.target, Stage.CARD_SELECTION, awaiting=pa.actor)
+                events.append((Event.EXCHANGE_ALLOWED,))
+                return
+            else:
+                _apply_effect(state, pa.actor, pa.action, pa.target, events)
+        elif pa.block_failed and pa.original_action is not None:
+            _apply_effect(state, pa.actor, pa.original_action, pa.target, events)
+        _advance(state, events)
+        state.pending = None
+    else:
+        raise RuleError("Tahap pemilihan kartu tidak dikenal")
+
+
+def _block(state, command, events):
+    pa = state.pending
+    action = pa.action
+    allowed = BLOCKERS.get(action)
+    if allowed is None:
+        raise RuleError(f"Aksi {ACTION_NAMES[action]} tidak bisa di-block")
+    if command.card is None:
+        raise RuleError("block_card harus disediakan untuk block")
+    blocker = command.seat
+    if blocker is None:
+        raise RuleError("Pemain tidak ditemukan")
+    if action in (Action.ASSASSINATE, Action.STEAL):
+        if pa.target is None or blocker != pa.target:
+            raise RuleError(f"Hanya target yang bisa memblokir aksi {ACTION_NAMES[action]}")
+    elif blocker == pa.actor:
+        raise RuleError("Pelaku tidak bisa memblokir aksinya sendiri")
+    if command.card not in allowed:
+        raise RuleError(f"{card_name(command.card)} tidak bisa memblokir aksi {ACTION_NAMES[action]}")
+
+    honest = command.card in state.players[blocker].hand
+    events.append((Event.BLOCK_CLAIMED, blocker, command.card, honest))
+    state.pending = Pending(pa.actor, action, pa.target, Stage.BLOCK_REACTION, blocker=blocker, block_card=command.card)
+
+
+def _challenge(state, command, events):
+    pa = state.pending
+    challenger = command.seat
+    if pa.stage == Stage.BLOCK_REACTION:
+        blocker = pa.blocker
+        proven = blocker is not None and pa.block_card in state.players[blocker].hand
+        events.append((Event.BLOCK_CHALLENGED, blocker, pa.block_card, proven))
+        if proven:
+            state.pending = Pending(pa.actor, pa.action, pa.target, Stage.REVEAL_CLAIM, awaiting=blocker,
+                                    required_card=pa.block_card, next_from=challenger,
+                                    blocker_proved=True, original_action=pa.action)
+        else:
+            state.pending = Pending(pa.actor, pa.action, pa.target, Stage.CARD_SELECTION, awaiting=blocker,
+                                    block_failed=True, original_action=pa.action)
+        return
+
+    claimed = CLAIMS.get(pa.action)
+    if claimed is None:
+        raise RuleError(f"Aksi {ACTION_NAMES[pa.action]} tidak bisa di-challenge")
+    proven = pa.actor is not None and claimed in state.players[pa.actor].hand
+    events.append((Event.CHALLENGED, pa.actor, challenger, claimed, proven))
+    if proven:
+        state.pending = Pending(pa.actor, pa.action, pa.target, Stage.REVEAL_CLAIM, awaiting=pa.actor,
+                                required_card=claimed, next_from=challenger, challenge_failed=True)
+    else:
+        state.pending = Pending(pa.actor, pa.action, pa.target, Stage.CARD_SELECTION, awaiting=pa.actor)
+
+
+# ------------------------------------------------------------------- effects
+
+def _advance(state, events):
+    """Mirrors ``game_logic.advance_turn``."""
+    players = state.players
+    alive = [seat for seat, p in enumerate(players) if p.alive]
+    if len(alive) <= 1:
+        state.winner = alive[0] if alive else None
+        state.game_over = True
+        events.append((Event.GAME_OVER, state.winner))
+        return
+    turn = (state.turn + 1) % len(players)
+    attempts = 0
+    while not players[turn].alive and attempts < len(players):
+        turn = (turn + 1) % len(players)
+        attempts += 1
+    state.turn = turn
+    events.append((Event.TURN, turn))
+
+
+def _apply_effect(state, actor, action, target, events):
+    """Resolve an action that survived its reactions (``apply_action_effect``)."""
+    players = state.players
+    if action == Action.STEAL and actor is not None and target is not None:
+        amount = min(2, max(0, players[target].coins))
+        players[target].coins -= amount
+        players[actor].coins += amount
+        events.append((Event.EFFECT, action, actor, target, amount))
+    elif action == Action.TAX and actor is not None:
+        players[actor].coins += 3
+        events.append((Event.EFFECT, action, actor, target, 3))
+    elif action == Action.FOREIGN_AID and actor is not None:
+        players[actor].coins += 2
+        events.append((Event.EFFECT, action, actor, target, 2))
+    elif action == Action.EXCHANGE and actor is not None:
+        events.append((Event.EFFECT, action, actor, target, 0))
+    elif action == Action.ASSASSINATE and target is not None:
+        events.append((Event.EFFECT, action, actor, target, 0))
+
+
+def _check_index(player, index):
+    if index < 0 or index >= len(player.hand):
+        raise RuleError("card_index tidak valid")
+
+
+def _fit_revealed(player):
+    revealed = player.revealed
+    if len(revealed) < len(player.hand):
+        revealed.extend([False] * (len(player.hand) - len(revealed)))
+    elif len(revealed) > len(player.hand):
+        del revealed[len(player.hand):]
+
+
+def _discard(state, seat, index):
+    """Lose one influence: the card goes to the trash; no cards left means out."""
+    player = state.players[seat]
+    _fit_revealed(player)
+    _check_index(player, index)
+    card = player.hand.pop(index)
+    player.revealed.pop(index)
+    state.trash.append(card)
+    if not player.hand:
+        player.alive = False
+    return card
+
+
+def _reveal_and_replace(state, seat, index, required):
+    """Show the claimed card, trash it and draw a replacement."""
+    player = state.players[seat]
+    _fit_revealed(player)
+    _check_index(player, index)
+    if required is not None and player.hand[index] != required:
+        raise RuleError("Kartu yang dipilih tidak sesuai klaim")
+    trashed = player.hand[index]
+    state.trash.append(trashed)
+    if not state.deck:
+        raise RuleError("Deck kosong")
+    player.hand[index] = state.deck.pop()
+    player.revealed[index] = False
+    return trashed
+
+
+def _exchange(state, seat, index, events):
+    """Swap one card with the top of the deck (``execute_exchange``)."""
+    player = state.players[seat]
+    if not state.deck:
+        events.append((Event.EXCHANGE_FAILED, seat, None))
+        return
+    if index < 0 or index >= len(player.hand) or (index < len(player.revealed) and player.revealed[index]):
+        events.append((Event.EXCHANGE_FAILED, seat, index))
+        return
+    old = player.hand[index]
+    player.hand[index] = state.deck.pop()
+    state.deck.append(old)
+    events.append((Event.EXCHANGED, seat, len(state.deck)))
+
+
+# ------------------------------------------------------------------ messages
+
+def describe(events, names):
+    """Player-facing message for ``events``; ``names`` are nicknames by seat."""
+
+    def name(seat):
+        return names[seat] if seat is not None else "Unknown"
+
+    parts = []
+    for event in events:
+        kind = event[0]
+        if kind == Event.INCOME:
+            parts.append(f"{name(event[1])} mengambil Income (+1 coin).")
+        elif kind == Event.COUP:
+            target = name(event[2])
+            parts.append(f"{name(event[1])} melakukan Coup ke {target}! {target} harus memilih kartu untuk dibuang.")
+        elif kind == Event.CLAIM:
+            _, seat, action, target = event
+            if action == Action.ASSASSINATE:
+                parts.append(f"{name(seat)} mengklaim Assassin dan mengasumsir {name(target)}!")
+            elif action == Action.TAX:
+                parts.append(f"{name(seat)} mengklaim Duke dan akan mengambil Tax (+3 coins).")
+            elif action == Action.STEAL:
+                parts.append(f"{name(seat)} mengklaim Captain dan akan mencuri dari {name(target)}!")
+            elif action == Action.FOREIGN_AID:
+                parts.append(f"{name(seat)} mengambil Foreign Aid (+2 coins).")
+            else:
+                parts.append(f"{name(seat)} mengklaim Ambassador dan akan menukar kartu!")
+        elif kind == Event.BLOCK_ACCEPTED:
+            _, blocker, card, action = event
+            parts.append(f"Block oleh {name(blocker)} dengan {card_name(card)} diterima! Aksi {ACTION_NAMES[action]} dibatalkan.")
+        elif kind == Event.EXCHANGE_PENDING:
+            parts.append("Tidak ada yang challenge, pilih kartu untuk exchange.")
+        elif kind == Event.ASSASSINATE_PENDING:
+            parts.append("Assassinate diterima, target harus memilih kartu untuk dibuang.")
+        elif kind == Event.ACTION_ACCEPTED:
+            parts.append(f"Aksi {ACTION_NAMES[event[1]]} diterima.")
+        elif kind == Event.EFFECT:
+            _, action, seat, target, amount = event
+            actor = names[seat] if seat is not None else "Anonymous"
+            if action == Action.STEAL:
+                parts.append(f"{actor} mencuri {amount} coin dari {name(target)}.")
+            elif action == Action.TAX:
+                parts.append(f"{actor} mengambil Tax (+3 coins).")
+            elif action == Action.FOREIGN_AID:
+                parts.append(f"{actor} mengambil Foreign Aid (+2 coins).")
+            elif action == Action.EXCHANGE:
+                parts.append(f"{actor} akan menukar satu kartu dengan deck.")
+            else:
+                parts.append(f"{actor} berhasil mengasumsir {name(target)}.")
+        elif kind == Event.CLAIM_PROVEN:
+            _, seat, card, trashed = event
+            parts.append(f"{name(seat)} membuktikan {card_name(card)}, kartu {card_name(trashed)} dibuang ke trash, ambil kartu baru.")
+        elif kind == Event.EXCHANGED:
+            parts.append(f"{name(event[1])} menukar kartu dengan deck. Deck kembali ke {event[2]} kartu.")
+        elif kind == Event.EXCHANGE_FAILED:
+            if event[2] is None:
+                parts.append(f"{name(event[1])} tidak bisa menukar - deck kosong!")
+            else:
+                parts.append(f"Kartu ke-{event[2] + 1} tidak valid atau sudah terungkap!")
+        elif kind == Event.DISCARDED:
+            _, seat, card, left = event
+            parts.append(f"{name(seat)} membuang kartu: {card_name(card)}. Sisa kartu: {left}.")
+        elif kind == Event.ELIMINATED:
+            parts.append(f"{name(event[1])} kehilangan semua pengaruh dan keluar dari permainan.")
+        elif kind == Event.BLOCK_STOOD:
+            parts.append("Block berhasil, aksi dibatalkan.")
+        elif kind == Event.EXCHANGE_ALLOWED:
+            parts.append("Aksi exchange berhasil, pilih kartu untuk ditukar.")
+        elif kind == Event.BLOCK_CLAIMED:
+            _, blocker, card, honest = event
+            if honest:
+                parts.append(f"{name(blocker)} blokir dengan {card_name(card)}!")
+            else:
+                parts.append(f"{name(blocker)} mengklaim punya {card_name(card)} tapi tidak! Aksi lanjut ke tahap challenge reaction.")
+        elif kind == Event.BLOCK_CHALLENGED:
+            _, blocker, card, proven = event
+            if proven:
+                parts.append(f"{name(blocker)} membuktikan {card_name(card)}! Challenge gagal.")
+            else:
+                parts.append(f"Challenge sukses! {name(blocker)} tidak punya {card_name(card)}.")
+        elif kind == Event.CHALLENGED:
+            _, seat, challenger, card, proven = event
+            actor = name(seat)
+            if proven:
+                parts.append(f"Challenge gagal! {actor} memiliki {card_name(card)}. {name(challenger)} harus discard kartu.")
+            else:
+                parts.append(f"Challenge sukses! {actor} tidak punya {card_name(card)}. {actor} harus discard kartu.")
+    return " ".join(parts)
+
+
+# ------------------------------------------------------------- room adapter
+
+def seat_index(players):
+    """Map the ids a client may send to seats (see ``PlayerIndex``)."""
+    return PlayerIndex(players)
+
+
+def _cards(names):
+    return [CARD_CODES.get(card, -1) for card in names]
+
+
+def pending_from_dict(pa, seats):
+    if pa is None:
+        return None
+
+    def seat(key):
+        value = pa.get(key)
+        return seats.target(value) if value is not None else None
+
+    def card(key):
+        value = pa.get(key)
+        return CARD_CODES.get(value, -1) if value is not None else None
+
+    original = pa.get("original_action")
+    return Pending(
+        seat("actor_id"), ACTION_CODES[pa["action"]], seat("target_id"), STAGE_CODES[pa["stage"]],
+        awaiting=seat("awaiting_from"), blocker=seat("blocker_id"), block_card=card("block_card"),
+        required_card=card("required_card"), next_from=seat("next_card_selection_from"),
+        challenge_failed=bool(pa.get("challenge_failed")), blocker_proved=bool(pa.get("blocker_proved")),
+        block_failed=bool(pa.get("block_failed")),
+        original_action=ACTION_CODES[original] if original is not None else None,
+    )
+
+
+def pending_to_dict(pending, keys):
+    """The pending_actions dict for ``pending``; ``keys`` are client ids by seat."""
+
+    def key(seat):
+        return keys[seat] if seat is not None else None
+
+    pa = {
+        "actor_id": key(pending.actor),
+        "action": ACTION_NAMES[pending.action],
+        "target_id": key(pending.target),
+        "stage": STAGE_NAMES[pending.stage],
+    }
+    if pending.awaiting is not None:
+        pa["awaiting_from"] = key(pending.awaiting)
+    if pending.blocker is not None:
+        pa["blocker_id"] = key(pending.blocker)
+        pa["block_card"] = card_name(pending.block_card)
+    if pending.required_card is not None:
+        pa["required_card"] = card_name(pending.required_card)
+    if pending.next_from is not None:
+        pa["next_card_selection_from"] = key(pending.next_from)
+    for flag in ("challenge_failed", "blocker_proved", "block_failed"):
+        if getattr(pending, flag):
+            pa[flag] = True
+    if pending.original_action is not None:
+        pa["original_action"] = ACTION_NAMES[pending.original_action]
+    return pa
+
+
+def from_room(room, pending=None, seats=None):
+    """Engine state for a room dict and its pending_actions entry."""
+    if seats is None:
+        seats = seat_index(room["players"])
+    players = [
+        Player(p.get("coins", 0), _cards(p.get("hand") or []), list(p.get("revealed") or []), p.get("is_alive", True))
+        for p in room["players"]
+    ]
+    for player in players:
+        _fit_revealed(player)
+    return State(
+        players, _cards(room.get("deck") or []), _cards(room.get("trash") or []),
+        room.get("turn"), pending_from_dict(pending, seats), bool(room.get("game_over")),
+    )
+
+
+def to_room(room, state):
+    """A new room dict carrying ``state``; ``room`` itself is left untouched."""
+    result = dict(room)
+    result["players"] = [
+        dict(p, coins=player.coins, hand=[card_name(c) for c in player.hand],
+             revealed=list(player.revealed), is_alive=player.alive)
+        for p, player in zip(room["players"], state.players)
+    ]
+    result["deck"] = [card_name(c) for c in state.deck]
+    result["trash"] = [card_name(c) for c in state.trash]
+    result["turn"] = state.turn
+    if state.game_over:
+        result["game_over"] = True
+        winner = room["players"][state.winner] if state.winner is not None else None
+        result["winner"] = (winner.get("nickname") or "Anonymous") if winner else None
+    return result
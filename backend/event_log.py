@@ -0,0 +1,183 @@
+"""Append-only log of the commands played in each room.
+
+Every accepted command becomes one event: the command with seats and card
+codes, the player who sent it, the pending stage before and after, the cards
+drawn from the deck and the engine events it produced (who challenged whom
+and whether the claim was proven). ``start`` events carry the shuffled deck,
+the dealt hands and the first turn, the only random draws in a game.
+
+Events are kept in memory and appended to ``game_events`` by the room
+store's write-behind flush. The full ``games``/``game_players`` rows are only
+rewritten as a snapshot every ``SNAPSHOT_INTERVAL`` events, and
+``games.event_seq`` records the last event a snapshot includes, so a room is
+rebuilt by replaying the tail after its snapshot through the engine.
+"""
+
+import os
+import time
+
+from backend import engine
+from backend.game_logic import PlayerIndex
+
+# Events between full snapshots of a room
+SNAPSHOT_INTERVAL = int(os.getenv("EVENT_SNAPSHOT_INTERVAL", "25"))
+# Events kept in memory per room once persisted
+MEMORY_TAIL = int(os.getenv("EVENT_LOG_MEMORY", "256"))
+
+
+class RoomLog:
+    __slots__ = ("game_id", "seq", "persisted_seq", "snapshot_seq", "events", "settled")
+
+    def __init__(self, game_id, seq=0, snapshot_seq=0):
+        self.game_id = game_id
+        self.seq = seq
+        self.persisted_seq = seq
+        self.snapshot_seq = snapshot_seq
+        self.events = []
+        # False while the newest event left an action pending; snapshots don't carry pending actions
+        self.settled = True
+
+
+class EventLog:
+    """In-memory event log per room, persisted through ``room_store.flush``."""
+
+    def __init__(self):
+        self.rooms = {}
+        # Switched off when the database has no game_events table
+        self.enabled = True
+
+    def attach(self, room_code, room, snapshot_seq=None):
+        """Start logging a room whose state includes every event up to ``room["event_seq"]``."""
+        seq = room.get("event_seq") or 0
+        log = self.rooms.get(room_code)
+        if snapshot_seq is None:
+            snapshot_seq = log.snapshot_seq if log is not None and log.game_id == room.get("id") else seq
+        self.rooms[room_code] = RoomLog(room.get("id"), seq, min(snapshot_seq, seq))
+        return self.rooms[room_code]
+
+    def forget(self, room_code):
+        self.rooms.pop(room_code, None)
+
+    def record(self, room_code, room, kind, actor, payload, settled=True):
+        """Append an event for the change just applied to ``room``; returns it."""
+        log = self.rooms.get(room_code)
+        if log is None or log.game_id != room.get("id"):
+            log = self.attach(room_code, room)
+        log.seq += 1
+        room["event_seq"] = log.seq
+        log.settled = settled
+        event = {
+            "game_id": log.game_id,
+            "seq": log.seq,
+            "kind": kind,
+            "actor": actor,
+            "payload": dict(payload, at=time.time()),
+        }
+        log.events.append(event)
+        self._trim(log)
+        return event
+
+    def _trim(self, log):
+        excess = len(log.events) - MEMORY_TAIL
+        if excess <= 0:
+            return
+        # Never drop events that still have to be written
+        keep = next((i for i, e in enumerate(log.events) if e["seq"] > log.persisted_seq), len(log.events))
+        del log.events[:min(excess, keep)]
+
+    def unpersisted(self, room_code):
+        log = self.rooms.get(room_code)
+        if log is None:
+            return []
+        return [e for e in log.events if e["seq"] > log.persisted_seq]
+
+    def mark_persisted(self, room_code, seq):
+        log = self.rooms.get(room_code)
+        if log is not None:
+            log.persisted_seq = max(log.persisted_seq, seq)
+            self._trim(log)
+
+    def mark_snapshot(self, room_code, seq):
+        log = self.rooms.get(room_code)
+        if log is not None:
+            log.snapshot_seq = max(log.snapshot_seq, seq)
+
+    def snapshot_due(self, room_code):
+        log = self.rooms.get(room_code)
+        return log is not None and log.settled and log.seq - log.snapshot_seq >= SNAPSHOT_INTERVAL
+
+    def events(self, room_code):
+        """Events still held in memory for the room, oldest first."""
+        log = self.rooms.get(room_code)
+        return list(log.events) if log is not None else []
+
+
+# ------------------------------------------------------------------ payloads
+
+def start_payload(room):
+    return {
+        "deck": list(room.get("deck") or []),
+        "hands": [list(p.get("hand") or []) for p in room["players"]],
+        "turn": room.get("turn"),
+    }
+
+
+def command_payload(before, after, command, events, expired=False):
+    """Payload of a command event; cards and actions are engine codes, players are seats."""
+    drawn = any(e[0] in (engine.Event.CLAIM_PROVEN, engine.Event.EXCHANGED) for e in events)
+    return {
+        "command": {
+            "kind": command.kind,
+            "seat": command.seat,
+            "target": command.target,
+            "card_index": command.card_index,
+            "card": command.card,
+        },
+        "stage": [_stage(before.pending), _stage(after.pending)],
+        # Replacements and exchanges both take the top card
+        "draws": [engine.card_name(before.deck[-1])] if drawn and before.deck else [],
+        "events": [[engine.Event(e[0]).name.lower(), *e[1:]] for e in events],
+        "expired": expired,
+    }
+
+
+def _stage(pending):
+    return engine.STAGE_NAMES[pending.stage] if pending is not None else None
+
+
+# -------------------------------------------------------------------- replay
+
+def replay(room, events):
+    """Apply logged ``events`` to a snapshot ``room``.
+
+    Returns ``(room, pending)`` where ``pending`` is the pending_actions entry
+    left by the last event, or None.
+    """
+    index = PlayerIndex(room["players"])
+    state = engine.from_room(room, None, index)
+    pending_at = None
+    for event in events:
+        payload = event["payload"]
+        if event["kind"] == "start":
+            room = dict(room, status="started", deck=list(payload["deck"]), turn=payload["turn"])
+            room["players"] = [dict(p, hand=list(hand), revealed=[False] * len(hand))
+                               for p, hand in zip(room["players"], payload["hands"])]
+            state = engine.from_room(room, None, index)
+        else:
+            c = payload["command"]
+            previous = state.pending
+            state, _ = engine.step(state, engine.Command(c["kind"], c["seat"], c["target"], c["card_index"], c["card"]))
+            if state.pending is not previous:
+                pending_at = payload.get("at")
+        room = dict(engine.to_room(room, state), event_seq=event["seq"])
+    pending = None
+    if state.pending is not None:
+        pending = {
+            **engine.pending_to_dict(state.pending, index.keys),
+            "timestamp": pending_at or time.time(),
+            "game_id": room.get("id"),
+        }
+    return room, pending
+
+
+event_log = EventLog()
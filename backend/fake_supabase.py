@@ -0,0 +1,322 @@
+"""In-memory stand-in for the Supabase tables the game server uses.
+
+Implements the slice of PostgREST that ``backend.repository`` talks to: the
+``games``, ``game_players`` and ``game_events`` tables with ``eq.``/``gt.``
+filters, embedded ``game_players(*)`` selects, ``order=<column>.asc``, the
+``apply_game_state`` RPC with its version check, and the ``archive_game`` /
+``purge_stale_games`` RPCs of the reaper (``archive`` holds the archived games,
+readable as ``games_archive`` with ``limit``). Plug it into a repository without any network:
+
+    fake = FakeSupabase()
+    repository.transport = fake.transport()
+
+or serve it over HTTP and point a server at it with ``SUPABASE_URL``:
+
+    python -m backend.fake_supabase --port 54321 --latency-ms 5
+    SUPABASE_URL=http://127.0.0.1:54321 uvicorn backend.main:app --port 3000
+
+``calls`` counts requests by method and table, and ``latency`` adds a fixed
+delay per request to imitate the round trip to a hosted database.
+"""
+
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+GAME_DEFAULTS = {
+    "status": "waiting",
+    "trash": [],
+    "turn": 0,
+    "current_player_index": 0,
+    "winner": None,
+    "game_over": False,
+    "version": 0,
+    "event_seq": 0,
+}
+PLAYER_DEFAULTS = {
+    "user_id": None,
+    "guest_id": None,
+    "coins": 2,
+    "hand": [],
+    "revealed": [],
+    "is_alive": True,
+}
+# Fields apply_game_state writes, see setup_database.sql
+GAME_STATE_FIELDS = ("status", "turn", "deck", "trash", "winner", "game_over", "event_seq")
+PLAYER_STATE_FIELDS = ("coins", "hand", "revealed", "is_alive")
+
+
+def _error(status, message, code=None):
+    return httpx.Response(status, json={"message": message, "code": code, "details": None, "hint": None})
+
+
+def _decode(value):
+    # JSONB columns arrive as JSON-encoded strings from the insert paths
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+class FakeSupabase:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.games = []
+        self.players = []
+        self.events = []
+        self.archive = []
+        self.calls = Counter()
+        # games.id -> time of the last write touching the game, like the updated_at/created_at columns
+        self._active_at = {}
+        self._player_ids = itertools.count(1)
+        self._event_ids = itertools.count(1)
+        self._event_keys = set()
+
+    def transport(self):
+        return httpx.MockTransport(self.handle)
+
+    def reset_calls(self):
+        self.calls.clear()
+
+    async def handle(self, request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        path = request.url.path
+        if "/rest/v1" in path:
+            path = path.split("/rest/v1", 1)[1]
+        self.calls[f"{request.method} {path}"] += 1
+        body = json.loads(request.content) if request.content else None
+        if path.startswith("/rpc/"):
+            if path == "/rpc/apply_game_state":
+                return self.apply_game_state(body)
+            if path == "/rpc/archive_game":
+                return httpx.Response(200, json=self.archive_game(body["p_game_id"], body.get("p_outcome", "finished")))
+            if path == "/rpc/purge_stale_games":
+                return self.purge_stale_games(body)
+            return _error(404, f"function {path[5:]} not found", "PGRST202")
+        table = {"/games": self.games, "/game_players": self.players, "/game_events": self.events,
+                 "/games_archive": self.archive}.get(path)
+        if table is None:
+            return _error(404, f"relation {path.strip('/')} does not exist", "42P01")
+        params = request.url.params
+        try:
+            filters = self._filters(params)
+        except ValueError as e:
+            return _error(400, str(e), "PGRST100")
+        returning = "return=representation" in request.headers.get("prefer", "")
+        if request.method == "GET":
+            return httpx.Response(200, json=self.select(table, filters, params))
+        if request.method == "POST":
+            try:
+                rows = self.insert(path, body if isinstance(body, list) else [body])
+            except ValueError as e:
+                return _error(409, str(e), "23505")
+            return httpx.Response(201, json=rows) if returning else httpx.Response(201)
+        if request.method == "PATCH":
+            rows = [row for row in table if self._match(row, filters)]
+            for row in rows:
+                row.update(body)
+            return httpx.Response(200, json=copy.deepcopy(rows)) if returning else httpx.Response(204)
+        if request.method == "DELETE":
+            rows = [row for row in table if self._match(row, filters)]
+            for row in rows:
+                table.remove(row)
+            if table is self.games:
+                self._cascade({row["id"] for row in rows})
+            return httpx.Response(200, json=rows) if returning else httpx.Response(204)
+        return _error(405, f"method {request.method} not allowed")
+
+    # -------------------------------------------------------------- tables
+
+    def _filters(self, params):
+        filters = []
+        for column, value in params.multi_items():
+            if column in ("select", "order", "limit") or "." in column:
+                continue
+            op, _, operand = value.partition(".")
+            if op not in ("eq", "gt"):
+                raise ValueError(f"unsupported filter {column}={value}")
+            filters.append((column, op, operand))
+        return filters
+
+    @staticmethod
+    def _match(row, filters):
+        for column, op, value in filters:
+            if op == "eq" and str(row.get(column)) != value:
+                return False
+            if op == "gt" and not (row.get(column) is not None and row.get(column) > type(row.get(column))(value)):
+                return False
+        return True
+
+    def select(self, table, filters, params):
+        rows = [copy.deepcopy(row) for row in table if self._match(row, filters)]
+        order = params.get("order")
+        if order:
+            column = order.split(".")[0]
+            rows.sort(key=lambda row: row[column], reverse=order.endswith(".desc"))
+        if table is self.games and "game_players(" in params.get("select", ""):
+            for game in rows:
+                game["game_players"] = sorted(
+                    (copy.deepcopy(p) for p in self.players if p["game_id"] == game["id"]),
+                    key=lambda p: p["id"],
+                )
+        if params.get("limit"):
+            rows = rows[:int(params["limit"])]
+        return rows
+
+    def insert(self, path, rows):
+        inserted = []
+        for row in rows:
+            if path == "/game_events":
+                key = (row["game_id"], row["seq"])
+                if key in self._event_keys:
+                    raise ValueError('duplicate key value violates unique constraint "game_events_game_id_seq_key"')
+                self._event_keys.add(key)
+                self._active_at[row["game_id"]] = time.time()
+                row = {"id": next(self._event_ids), "actor": None, **row}
+                self.events.append(row)
+            elif path == "/games":
+                if any(game["room_code"] == row.get("room_code") for game in self.games):
+                    raise ValueError('duplicate key value violates unique constraint "games_room_code_key"')
+                row = {**GAME_DEFAULTS, "id": str(uuid.uuid4()), **row}
+                row["deck"] = _decode(row.get("deck"))
+                row["trash"] = _decode(row.get("trash"))
+                self._active_at[row["id"]] = time.time()
+                self.games.append(row)
+            else:
+                row = {**PLAYER_DEFAULTS, "id": next(self._player_ids), **row}
+                row["hand"] = _decode(row.get("hand"))
+                row["revealed"] = _decode(row.get("revealed"))
+                self._active_at[row["game_id"]] = time.time()
+                self.players.append(row)
+            inserted.append(copy.deepcopy(row))
+        return inserted
+
+    def apply_game_state(self, body):
+        game = next((g for g in self.games if g["id"] == body["p_game_id"]), None)
+        if game is None or game["version"] != body["p_expected_version"]:
+            return _error(400, f"version conflict on game {body['p_game_id']}", "40001")
+        update = body.get("p_game") or {}
+        for field in GAME_STATE_FIELDS:
+            if field in ("status", "event_seq") and update.get(field) is None:
+                continue
+            game[field] = update.get(field)
+        game["game_over"] = bool(game["game_over"])
+        game["version"] += 1
+        self._active_at[game["id"]] = time.time()
+        by_id = {row.get("id"): row for row in body.get("p_players") or []}
+        for player in self.players:
+            row = by_id.get(player["id"])
+            if row is not None and player["game_id"] == game["id"]:
+                for field in PLAYER_STATE_FIELDS:
+                    player[field] = row.get(field)
+        return httpx.Response(200, json=game["version"])
+
+    def _cascade(self, game_ids):
+        self.players[:] = [p for p in self.players if p["game_id"] not in game_ids]
+        self.events[:] = [e for e in self.events if e["game_id"] not in game_ids]
+        self._event_keys = {key for key in self._event_keys if key[0] not in game_ids}
+        for game_id in game_ids:
+            self._active_at.pop(game_id, None)
+
+    def archive_game(self, game_id, outcome):
+        game = next((g for g in self.games if g["id"] == game_id), None)
+        if game is None:
+            return False
+        if not any(a["id"] == game_id for a in self.archive):
+            self.archive.append({
+                "id": game_id,
+                "room_code": game["room_code"],
+                "host_id": game.get("host_id"),
+                "outcome": outcome,
+                "winner": game.get("winner"),
+                "players": [
+                    {k: p.get(k) for k in ("nickname", "user_id", "guest_id", "coins", "is_alive")}
+                    for p in sorted((p for p in self.players if p["game_id"] == game_id), key=lambda p: p["id"])
+                ],
+                "event_count": sum(1 for e in self.events if e["game_id"] == game_id),
+                "events": [
+                    {k: copy.deepcopy(e.get(k)) for k in ("seq", "kind", "actor", "payload", "created_at")}
+                    for e in sorted((e for e in self.events if e["game_id"] == game_id), key=lambda e: e["seq"])
+                ],
+                "finished_at": time.time(),
+            })
+        self.games.remove(game)
+        self._cascade({game_id})
+        return True
+
+    def purge_stale_games(self, body):
+        now = time.time()
+        counts = {"deleted": 0, "finished": 0, "abandoned": 0, "expired": 0}
+        for game in list(self.games):
+            idle = now - self._active_at.get(game["id"], now)
+            if game.get("game_over"):
+                if idle >= body["p_finished_ttl"]:
+                    counts["finished"] += self.archive_game(game["id"], "finished")
+            elif game.get("status") == "waiting":
+                if idle >= body["p_waiting_ttl"]:
+                    self.games.remove(game)
+                    self._cascade({game["id"]})
+                    counts["deleted"] += 1
+            elif idle >= body["p_abandoned_ttl"]:
+                counts["abandoned"] += self.archive_game(game["id"], "abandoned")
+        if body.get("p_archive_retention"):
+            cutoff = now - body["p_archive_retention"] * 86400
+            kept = [a for a in self.archive if a["finished_at"] >= cutoff]
+            counts["expired"] = len(self.archive) - len(kept)
+            self.archive[:] = kept
+        return httpx.Response(200, json=counts)
+
+
+def asgi_app(fake):
+    """Serve ``fake`` as a plain ASGI HTTP application."""
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        url = httpx.URL(path=scope["path"], query=scope.get("query_string", b""))
+        request = httpx.Request(scope["method"], url, headers=[(k.decode(), v.decode()) for k, v in scope["headers"]],
+                                content=body)
+        response = await fake.handle(request)
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        await send({"type": "http.response.body", "body": response.content})
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every request")
+    args = parser.parse_args()
+    uvicorn.run(asgi_app(FakeSupabase(args.latency_ms / 1000.0)), host=args.host, port=args.port, log_level="warning")
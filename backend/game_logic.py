@@ -35,8 +35,69 @@ def deal_cards(deck, num_players):
         hands.append(hand)
     return hands, deck
 
-def get_player(players, player_id):
+def player_key(p):
+    """The id clients use for a player (guest sessions send their guest_id)."""
+    for key in ("guest_id", "user_id", "id"):
+        if p.get(key) is not None:
+            return str(p.get(key))
+    return None
+
+class PlayerIndex:
+    """Seats of one room's players by the ids a client may send.
+
+    ``get`` resolves the ids a client proves its seat with (user_id,
+    guest_id). The row ``id`` is what every viewer sees of the other players,
+    so it only names targets: ``target`` resolves it as well. Seats only move
+    when players join or leave, so the index is rebuilt then; eliminated
+    players keep their seat.
+    """
+
+    __slots__ = ("seats", "targets", "keys", "ids")
+
+    def __init__(self, players=()):
+        self.seats = {}
+        self.targets = {}
+        # player_key by seat, the ids pending actions are stored with
+        self.keys = []
+        # Row id by seat, the id other clients know a player by
+        self.ids = []
+        for seat, p in enumerate(players):
+            for key in ("user_id", "guest_id"):
+                if p.get(key):
+                    self.seats.setdefault(str(p.get(key)), seat)
+            row_id = p.get("id")
+            if row_id is not None:
+                self.targets.setdefault(str(row_id), seat)
+            self.ids.append(str(row_id) if row_id is not None else None)
+            self.keys.append(player_key(p))
+        for key, seat in self.seats.items():
+            self.targets.setdefault(key, seat)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, player_id, default=None):
+        """Seat of the player ``player_id`` identifies (user_id or guest_id), or ``default``."""
+        if player_id is None:
+            return default
+        return self.seats.get(player_id if type(player_id) is str else str(player_id), default)
+
+    def target(self, player_id, default=None):
+        """Seat named by ``player_id`` in any of its forms, row id included, or ``default``."""
+        if player_id is None:
+            return default
+        return self.targets.get(player_id if type(player_id) is str else str(player_id), default)
+
+    def public_id(self, player_id):
+        """Row id of the seat ``player_id`` names, for messages every viewer receives."""
+        seat = self.target(player_id)
+        return self.ids[seat] if seat is not None else None
+
+def get_player(players, player_id, index=None):
     # Support lookup by internal row id, user_id (UUID) or guest_id (text)
+    if index is not None:
+        seat = index.target(player_id)
+        return players[seat] if seat is not None else None
     pid = str(player_id)
     for p in players:
         if str(p.get("id")) == pid:
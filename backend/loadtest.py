@@ -0,0 +1,379 @@
+"""End-to-end load generator: many concurrent tables over HTTP and WebSocket.
+
+Every table creates a room, joins its players, opens one ``/api/ws`` socket per
+player and plays complete games through ``/api/game/action`` with random
+moves, reactions and card selections, then starts over in a new room. Run it
+against a server backed by ``backend.fake_supabase``:
+
+    python -m backend.loadtest --spawn --tables 50 --duration 60
+
+or against servers you started yourself:
+
+    python -m backend.fake_supabase --port 54321
+    SUPABASE_URL=http://127.0.0.1:54321 uvicorn backend.main:app --port 3000
+    python -m backend.loadtest --url http://127.0.0.1:3000 --tables 50
+
+Reports actions/sec and games/sec, request latency per action type, and
+broadcast delivery latency: the time from sending an action to each socket of
+the room receiving its ``action`` message.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+import websockets
+
+ACTION_COST = {"assassinate": 3, "coup": 7}
+TARGETED = ("coup", "assassinate", "steal")
+CHALLENGEABLE = {"tax": "Duke", "assassinate": "Assassin", "steal": "Captain", "exchange": "Ambassador"}
+BLOCKERS = {"foreign_aid": ["Duke"], "assassinate": ["Contessa"], "steal": ["Captain", "Ambassador"]}
+# Requests per game before a table gives up on it
+MAX_MOVES = 1000
+SPAWN_TIMEOUT = 20.0
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+    n = len(samples)
+
+    def pick(fraction):
+        return round(samples[min(n - 1, int(fraction * n))] * 1000, 3)
+
+    return {
+        "count": n,
+        "mean": round(sum(samples) / n * 1000, 3),
+        "p50": pick(0.5),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(samples[-1] * 1000, 3),
+    }
+
+
+class Stats:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.delivery = []
+        self.games = 0
+        self.stalled = 0
+        self.broadcasts = 0
+        self.errors = Counter()
+
+    def report(self, elapsed, tables, players):
+        actions = sum(len(samples) for kind, samples in self.latency.items() if kind != "setup")
+        return {
+            "tables": tables,
+            "players": players,
+            "seconds": round(elapsed, 3),
+            "games_finished": self.games,
+            "games_abandoned": self.stalled,
+            "actions": actions,
+            "actions_per_sec": round(actions / elapsed, 1) if elapsed else None,
+            "games_per_sec": round(self.games / elapsed, 3) if elapsed else None,
+            "action_latency_ms": percentiles([s for k, ss in self.latency.items() if k != "setup" for s in ss]),
+            "action_latency_by_type_ms": {k: percentiles(ss) for k, ss in sorted(self.latency.items())},
+            "broadcast_latency_ms": percentiles(self.delivery),
+            "broadcasts_received": self.broadcasts,
+            "errors": dict(self.errors),
+        }
+
+
+class Table:
+    """One room being played by ``players`` simulated clients."""
+
+    def __init__(self, client, ws_url, stats, players, rng, think=0.0):
+        self.client = client
+        self.ws_url = ws_url
+        self.stats = stats
+        self.size = players
+        self.rng = rng
+        self.think = think
+        self.room_code = None
+        self.ids = []
+        self.players = []
+        self.turn = 0
+        self.pending = None
+        self.game_over = False
+        # Send times of accepted actions, in the order their broadcasts arrive
+        self.sent = []
+        self.sockets = []
+
+    async def post(self, path, kind, **body):
+        started = time.perf_counter()
+        res = await self.client.post(path, json=body)
+        self.stats.latency[kind].append(time.perf_counter() - started)
+        if res.status_code != 200:
+            self.stats.errors[f"{kind} {res.status_code}"] += 1
+            return None
+        return res.json()
+
+    # ------------------------------------------------------------ lifecycle
+
+    async def play(self):
+        try:
+            await self.setup()
+            for _ in range(MAX_MOVES):
+                if self.game_over:
+                    self.stats.games += 1
+                    return
+                if not await self.move():
+                    break
+                if self.think:
+                    await asyncio.sleep(self.think)
+            self.stats.stalled += 1
+        finally:
+            await self.close()
+
+    async def setup(self):
+        host = str(uuid.uuid4())
+        body = await self.post("/api/game/create", "setup", host_id=host)
+        if body is None:
+            raise RuntimeError("create failed")
+        self.room_code = body["room_code"]
+        self.ids = [str(uuid.uuid4()) for _ in range(self.size)]
+        for seat, player_id in enumerate(self.ids):
+            if await self.post("/api/game/join", "setup", room_code=self.room_code, player_id=player_id,
+                               nickname=f"bot{seat}") is None:
+                raise RuntimeError("join failed")
+        for player_id in self.ids:
+            ws = await websockets.connect(f"{self.ws_url}/api/ws/{self.room_code}?player_id={player_id}",
+                                          max_size=None)
+            self.sockets.append((ws, asyncio.create_task(self.listen(ws))))
+        if await self.post("/api/game/start", "setup", room_code=self.room_code) is None:
+            raise RuntimeError("start failed")
+        res = await self.client.get("/api/game/state", params={"room_code": self.room_code, "viewer_id": self.ids[0]})
+        state = res.json()
+        self.players = state["players"]
+        self.turn = state["game"]["turn"]
+        # Pending actions name players by row id
+        self.seats = {str(p["id"]): seat for seat, p in enumerate(self.players)}
+
+    async def close(self):
+        for ws, reader in self.sockets:
+            reader.cancel()
+            try:
+                await ws.close()
+            except Exception:
+                pass
+        self.sockets = []
+
+    async def listen(self, ws):
+        received = 0
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                if message.get("type") != "action":
+                    continue
+                if received < len(self.sent):
+                    self.stats.delivery.append(time.perf_counter() - self.sent[received])
+                received += 1
+                self.stats.broadcasts += 1
+                if message.get("version") is not None:
+                    # Acknowledge like the browser so the server sends patches
+                    await ws.send(json.dumps({"type": "ack", "version": message["version"]}))
+        except asyncio.CancelledError:
+            pass
+        except websockets.ConnectionClosed:
+            self.stats.errors["socket closed"] += 1
+
+    # ---------------------------------------------------------------- moves
+
+    async def act(self, player_id, action_type, **fields):
+        self.sent.append(time.perf_counter())
+        body = await self.post("/api/game/action", action_type, room_code=self.room_code, player_id=player_id,
+                               action_type=action_type, **fields)
+        if body is None:
+            # A rejected action is never broadcast
+            self.sent.pop()
+            return False
+        self.players = body["gameState"]["players"]
+        game = body["gameState"]["game"]
+        self.turn = game["turn"]
+        self.game_over = bool(game.get("game_over"))
+        self.pending = body.get("pending_action")
+        return True
+
+    def alive(self, exclude=None):
+        return [pid for pid, p in zip(self.ids, self.players) if p["is_alive"] and pid != exclude]
+
+    def player(self, row_id):
+        """Our id for the player a pending action names by ``row_id``."""
+        return self.ids[self.seats[str(row_id)]] if row_id is not None else None
+
+    async def hand(self, player_id):
+        # Responses only show the actor's own hand, so ask as the player choosing a card
+        res = await self.client.get("/api/game/state", params={"room_code": self.room_code, "viewer_id": player_id})
+        player = res.json()["players"][self.ids.index(player_id)]
+        hand = player["hand"]
+        revealed = player.get("revealed") or []
+        return hand, [i for i in range(len(hand)) if i >= len(revealed) or not revealed[i]]
+
+    async def move(self):
+        pa = self.pending
+        rng = self.rng
+        if pa is None:
+            actor = self.ids[self.turn]
+            coins = self.players[self.turn]["coins"]
+            targets = self.alive(exclude=actor)
+            if coins >= 10:
+                return await self.act(actor, "coup", target_id=rng.choice(targets))
+            options = ["income", "foreign_aid", "tax", "exchange", "steal"]
+            options += [action for action, cost in ACTION_COST.items() if coins >= cost]
+            action = rng.choice(options)
+            if action in TARGETED:
+                return await self.act(actor, action, target_id=rng.choice(targets))
+            return await self.act(actor, action)
+
+        stage = pa["stage"]
+        action = pa["action"]
+        actor = self.player(pa["actor_id"])
+        if stage == "reaction":
+            others = self.alive(exclude=actor)
+            if action in CHALLENGEABLE and rng.random() < 0.2:
+                return await self.act(rng.choice(others), "challenge")
+            if action in BLOCKERS and rng.random() < 0.3:
+                blocker = self.player(pa.get("target_id")) if action in TARGETED else rng.choice(others)
+                return await self.act(blocker, "block", block_card=rng.choice(BLOCKERS[action]))
+            return await self.act(actor, "pass")
+        if stage == "block_reaction":
+            others = self.alive(exclude=self.player(pa.get("blocker_id")))
+            if others and rng.random() < 0.3:
+                return await self.act(rng.choice(others), "challenge")
+            return await self.act(actor, "pass")
+        player_id = self.player(pa["awaiting_from"])
+        hand, unrevealed = await self.hand(player_id)
+        if stage == "reveal_claim" and pa.get("required_card") in hand:
+            index = hand.index(pa["required_card"])
+        else:
+            index = rng.choice(unrevealed) if unrevealed else 0
+        return await self.act(player_id, "select_card", card_index=index)
+
+
+async def run_table(client, ws_url, stats, players, deadline, rng, think):
+    while time.monotonic() < deadline:
+        try:
+            await Table(client, ws_url, stats, players, rng, think).play()
+        except Exception as e:
+            stats.errors[f"table: {type(e).__name__}"] += 1
+            await asyncio.sleep(0.1)
+
+
+async def run(url, tables, players, duration, ramp=0.0, think=0.0, seed=None):
+    stats = Stats()
+    ws_url = "ws" + url[len("http"):]
+    limits = httpx.Limits(max_connections=tables * 2, max_keepalive_connections=tables * 2)
+    started = time.monotonic()
+    deadline = started + duration
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+        tasks = []
+        for table in range(tables):
+            rng = random.Random(None if seed is None else seed + table)
+            tasks.append(asyncio.create_task(run_table(client, ws_url, stats, players, deadline, rng, think)))
+            if ramp:
+                await asyncio.sleep(ramp / tables)
+        await asyncio.gather(*tasks)
+    return stats.report(time.monotonic() - started, tables, players)
+
+
+# ----------------------------------------------------------------- spawning
+
+def _wait_for(url, process):
+    deadline = time.monotonic() + SPAWN_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def spawn(port, supabase_port, latency_ms):
+    """Start the Supabase stand-in and one server worker; returns (url, processes)."""
+    fake = subprocess.Popen([sys.executable, "-m", "backend.fake_supabase", "--port", str(supabase_port),
+                             "--latency-ms", str(latency_ms)])
+    env = dict(os.environ, SUPABASE_URL=f"http://127.0.0.1:{supabase_port}")
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+                               "--log-level", "warning", "--no-access-log"], env=env)
+    processes = [server, fake]
+    try:
+        _wait_for(f"http://127.0.0.1:{supabase_port}/rest/v1/games", fake)
+        _wait_for(f"http://127.0.0.1:{port}/", server)
+    except Exception:
+        for process in processes:
+            process.terminate()
+        raise
+    return f"http://127.0.0.1:{port}", processes
+
+
+def print_report(result):
+    print(f"{result['tables']} tables x {result['players']} players for {result['seconds']}s: "
+          f"{result['actions']} actions ({result['actions_per_sec']}/s), "
+          f"{result['games_finished']} games ({result['games_per_sec']}/s)")
+    if result["games_abandoned"]:
+        print(f"  {result['games_abandoned']} games abandoned after {MAX_MOVES} moves")
+
+    def line(name, p):
+        if p["count"]:
+            print(f"  {name:16} n={p['count']:<7} p50 {p['p50']:>8.2f}ms  p95 {p['p95']:>8.2f}ms  "
+                  f"p99 {p['p99']:>8.2f}ms  max {p['max']:>8.2f}ms")
+
+    print("Action latency:")
+    line("all", result["action_latency_ms"])
+    for kind, p in result["action_latency_by_type_ms"].items():
+        line(kind, p)
+    print("Broadcast delivery:")
+    line("action", result["broadcast_latency_ms"])
+    if result["errors"]:
+        print("Errors:")
+        for error, count in sorted(result["errors"].items()):
+            print(f"  {error}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coup end-to-end load generator")
+    parser.add_argument("--url", default="http://127.0.0.1:3000", help="server to drive")
+    parser.add_argument("--tables", type=int, default=20, help="concurrent rooms")
+    parser.add_argument("--players", type=int, default=4, help="players per room (2-6)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep starting games")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which tables start")
+    parser.add_argument("--think", type=float, default=0.0, help="pause between a table's moves, in seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--spawn", action="store_true",
+                        help="start a Supabase stand-in and a server on --port instead of using --url")
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument("--supabase-port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="stand-in delay per Supabase request")
+    args = parser.parse_args()
+
+    processes = []
+    url = args.url
+    if args.spawn:
+        url, processes = spawn(args.port, args.supabase_port, args.latency_ms)
+    try:
+        result = asyncio.run(run(url, args.tables, args.players, args.duration, args.ramp, args.think, args.seed))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,82 @@
 from fastapi import FastAPI
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
 from backend.api.auth import router as auth_router
-from backend.api.game import router as game_router
+from backend.api.debug import router as debug_router
+from backend.api.game import router as game_router, on_room_event, pending_actions
+from backend.connections import connection_manager
+from backend.room_store import room_store
+from backend.repository import repository
+from backend.timers import reaction_timers
+from backend.pubsub import hub
+from backend.reaper import reaper
+from backend import metrics
+from backend.tracing import TracingMiddleware, DEBUG_ENDPOINTS
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 STATIC_DIR = BASE_DIR / "static"
 
 app = FastAPI(title="Coup Game API")
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 app.include_router(auth_router, prefix="/auth")
 app.include_router(game_router, prefix="/api")
+if DEBUG_ENDPOINTS:
+    # Unauthenticated: they expose traces and change the sampling rate
+    app.include_router(debug_router, prefix="/api/debug")
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 
+metrics.registry.gauge("coup_rooms", "Rooms held in memory.", lambda: len(room_store.rooms))
+metrics.registry.gauge("coup_rooms_dirty", "Rooms with state not yet persisted.",
+                       lambda: sum(1 for code in room_store.rooms if room_store.is_dirty(code)))
+metrics.registry.gauge("coup_pending_actions", "Actions waiting for reactions or a card choice.",
+                       lambda: len(pending_actions))
+metrics.registry.gauge("coup_timers", "Scheduled reaction, spectator, reaper and idle-socket deadlines.", lambda: len(reaction_timers))
+metrics.registry.gauge("ws_rooms", "Rooms with at least one open socket on this worker.",
+                       lambda: len(set(connection_manager.rooms) | set(connection_manager.watchers)))
+metrics.registry.gauge(
+    "ws_sockets", "Open WebSockets by role.",
+    lambda: dict(zip((("player",), ("spectator",)), connection_manager.counts()[1:])),
+    ("role",))
+metrics.registry.gauge("ws_sessions", "Players with at least one open socket (tabs count once).",
+                       lambda: connection_manager.counts()[0])
+metrics.registry.gauge(
+    "ws_send_queue_messages", "Messages queued on this worker's sockets, not yet written.",
+    lambda: sum(conn.queue.qsize() for conn in connection_manager.all_connections()))
+
+
+@app.on_event("startup")
+async def startup():
+    await hub.start(on_room_event)
+    room_store.start()
+    reaction_timers.start()
+    reaper.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    reaper.stop()
+    await reaction_timers.stop()
+    # Persist any write-behind state before the worker exits
+    await room_store.stop()
+    await hub.stop()
+    await repository.aclose()
+
+
 @app.get("/")
 async def root():
     return FileResponse(STATIC_DIR / "index.html")
 
 
+@app.get("/metrics", include_in_schema=False)
+async def scrape_metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,215 @@
+"""Process metrics in the Prometheus text format, served at ``GET /metrics``.
+
+Counters and histograms are plain in-process objects: recording is a dict
+lookup and a couple of additions on the event loop thread. Gauges are read
+from the live structures (rooms, sockets, pending actions) when scraped.
+With several workers each process reports its own series; scrape every
+worker, or aggregate them in Prometheus.
+"""
+
+import bisect
+import contextvars
+import time
+
+# Seconds; covers in-memory handlers up to slow database round trips
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# What the current task is doing, for attributing Supabase calls: the route,
+# or the action type inside /game/action. Write-behind flushes run outside
+# any request and keep the default.
+current_action = contextvars.ContextVar("metrics_action", default="background")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (last one is +Inf), sum]
+        self.values = {}
+
+    def observe(self, value, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def time(self, *labels):
+        """Context manager observing the seconds spent inside it."""
+        return _Timer(self, labels)
+
+    def count(self, *labels):
+        series = self.values.get(labels)
+        return sum(series[0]) if series is not None else 0
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _labels(self.labelnames, labels, (("le", _number(float(bound))),))
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class Gauge:
+    """Value read at scrape time from ``read()``: a number, or ``{labels: number}``."""
+
+    def __init__(self, name, documentation, read, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        value = self.read()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labels, v in sorted(value.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(v)}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print(f"Metric {metric.name} error: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.",
+    ("method", "route", "status"))
+action_seconds = registry.histogram(
+    "coup_action_duration_seconds", "Time spent applying a game action, by action type.", ("action",))
+room_queue_seconds = registry.histogram(
+    "coup_room_queue_seconds", "Time a command waited behind earlier commands of its room.")
+supabase_seconds = registry.histogram(
+    "supabase_request_duration_seconds", "Supabase (PostgREST) request latency by operation and action.",
+    ("operation", "action"))
+supabase_errors = registry.counter(
+    "supabase_request_errors_total", "Failed Supabase requests by operation and action.",
+    ("operation", "action"))
+fanout_seconds = registry.histogram(
+    "ws_fanout_duration_seconds", "Time to render and queue one room event on this worker's sockets.",
+    ("kind",), buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+fanout_failures = registry.counter(
+    "ws_fanout_failures_total", "Messages not delivered to a socket, by reason.", ("reason",))
+ws_idle_closed = registry.counter(
+    "ws_idle_timeouts_total", "WebSockets closed because the client sent nothing for WS_IDLE_TIMEOUT_MS.")
+state_cache_lookups = registry.counter(
+    "coup_state_cache_lookups_total",
+    "GET /game/state views served from the per-version cache (hit) or built (miss).", ("result",))
+rooms_reaped = registry.counter(
+    "coup_rooms_reaped_total", "Rooms evicted from memory by the reaper, by policy.", ("policy",))
+games_purged = registry.counter(
+    "coup_games_purged_total", "Games deleted or archived in the database by the reaper, by outcome.",
+    ("outcome",))
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        token = current_action.set(scope["path"])
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            current_action.reset(token)
+            # The router stores the matched route in the scope; unmatched paths share one series
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http_request_seconds.observe(time.perf_counter() - started, scope["method"], path, status[0])
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import os
+import uuid
+from urllib.parse import urlparse
+
+# redis://[:password@]host:port[/db]; empty keeps everything inside this process
+PUBSUB_URL = os.getenv("PUBSUB_URL", "")
+CHANNEL_PREFIX = os.getenv("PUBSUB_PREFIX", "coup")
+RECONNECT_DELAY = 1.0
+
+
+class InProcessBackend:
+    """Room events and shared state for a single worker.
+
+    ``publish`` hands the event straight to the local handler and the key/value
+    store is a dict, so nothing is serialized.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self.handler = None
+        self._store = {}
+
+    async def start(self, handler):
+        self.handler = handler
+
+    async def stop(self):
+        self.handler = None
+
+    async def subscribe(self, room_code):
+        pass
+
+    async def unsubscribe(self, room_code):
+        pass
+
+    def subscribed(self, room_code):
+        return True
+
+    async def publish(self, room_code, event):
+        if self.handler is not None:
+            await self.handler(room_code, event)
+
+    async def get(self, key):
+        return self._store.get(key)
+
+    async def set(self, key, value):
+        self._store[key] = value
+
+    async def delete(self, key):
+        self._store.pop(key, None)
+
+
+class RespConnection:
+    """Minimal RESP2 client connection over asyncio streams."""
+
+    def __init__(self, host, port, password=None, db=0):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.db = db
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self.call("AUTH", self.password)
+        if self.db:
+            await self.call("SELECT", str(self.db))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def send(self, *args):
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.writer.write(b"".join(out))
+
+    async def call(self, *args):
+        self.send(*args)
+        await self.writer.drain()
+        return await self.read()
+
+    async def read(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("broker closed the connection")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            data = await self.reader.readexactly(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(rest)
+            if size < 0:
+                return None
+            return [await self.read() for _ in range(size)]
+        raise RuntimeError(f"unexpected reply {line!r}")
+
+
+class RedisBackend:
+    """Room events and shared state through a Redis-compatible broker.
+
+    Events are published on one channel per room and delivered to every worker
+    subscribed to it; the publishing worker handles its own event directly and
+    ignores the echo. Shared state is stored as JSON strings.
+    """
+
+    shared = True
+
+    def __init__(self, url, prefix=CHANNEL_PREFIX):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self.prefix = prefix
+        self.worker_id = uuid.uuid4().hex
+        self.handler = None
+        self.rooms = set()
+        self._commands = None
+        self._command_lock = asyncio.Lock()
+        self._subscriber = None
+        self._listener = None
+
+    def _connection(self):
+        return RespConnection(self.host, self.port, self.password, self.db)
+
+    def channel(self, room_code):
+        return f"{self.prefix}:room:{room_code}"
+
+    async def start(self, handler):
+        self.handler = handler
+        self._commands = self._connection()
+        await self._commands.connect()
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        for conn in (self._commands, self._subscriber):
+            if conn is not None:
+                conn.close()
+        self._commands = self._subscriber = None
+
+    async def _call(self, *args):
+        async with self._command_lock:
+            try:
+                return await self._commands.call(*args)
+            except (ConnectionError, OSError):
+                # One reconnect attempt; a broker restart shouldn't take the worker down
+                self._commands.close()
+                self._commands = self._connection()
+                await self._commands.connect()
+                return await self._commands.call(*args)
+
+    async def subscribe(self, room_code):
+        if room_code in self.rooms:
+            return
+        self.rooms.add(room_code)
+        if self._subscriber is not None and self._subscriber.writer is not None:
+            self._subscriber.send("SUBSCRIBE", self.channel(room_code))
+            await self._subscriber.writer.drain()
+
+    def subscribed(self, room_code):
+        return room_code in self.rooms
+
+    async def unsubscribe(self, room_code):
+        if room_code not in self.rooms:
+            return
+        self.rooms.discard(room_code)
+        if self._subscriber is not None and self._subscriber.writer is not None:
+            self._subscriber.send("UNSUBSCRIBE", self.channel(room_code))
+            await self._subscriber.writer.drain()
+
+    async def publish(self, room_code, event):
+        event = dict(event, origin=self.worker_id)
+        if self.handler is not None:
+            await self.handler(room_code, event)
+        await self._call("PUBLISH", self.channel(room_code), json.dumps(event))
+
+    async def get(self, key):
+        raw = await self._call("GET", f"{self.prefix}:{key}")
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key, value):
+        await self._call("SET", f"{self.prefix}:{key}", json.dumps(value))
+
+    async def delete(self, key):
+        await self._call("DEL", f"{self.prefix}:{key}")
+
+    async def _listen(self):
+        prefix = f"{self.prefix}:room:"
+        while True:
+            try:
+                self._subscriber = self._connection()
+                await self._subscriber.connect()
+                for room_code in self.rooms:
+                    self._subscriber.send("SUBSCRIBE", self.channel(room_code))
+                await self._subscriber.writer.drain()
+                while True:
+                    reply = await self._subscriber.read()
+                    if not isinstance(reply, list) or len(reply) != 3 or reply[0] != b"message":
+                        continue
+                    event = json.loads(reply[2])
+                    if event.get("origin") == self.worker_id:
+                        continue
+                    room_code = reply[1].decode()[len(prefix):]
+                    try:
+                        await self.handler(room_code, event)
+                    except Exception as e:
+                        print(f"Room event error ({room_code}): {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Pub/sub connection lost: {e}")
+                if self._subscriber is not None:
+                    self._subscriber.close()
+                await asyncio.sleep(RECONNECT_DELAY)
+
+
+def create_backend(url=PUBSUB_URL):
+    if not url:
+        return InProcessBackend()
+    if url.startswith("redis://"):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported PUBSUB_URL: {url}")
+
+
+hub = create_backend()
@@ -0,0 +1,112 @@
+"""Stand-in pub/sub broker for local multi-worker testing.
+
+Speaks the subset of the Redis protocol ``backend.pubsub.RedisBackend`` uses
+(PING, AUTH, SELECT, GET, SET, DEL, PUBLISH, SUBSCRIBE, UNSUBSCRIBE), keeping
+everything in memory. Run it and point every worker at it:
+
+    python -m backend.pubsub_broker --port 6380
+    PUBSUB_URL=redis://127.0.0.1:6380 uvicorn backend.main:app --port 3000
+"""
+
+import argparse
+import asyncio
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _array(items):
+    return b"*%d\r\n" % len(items) + b"".join(items)
+
+
+class Broker:
+    def __init__(self):
+        self.store = {}
+        self.channels = {}
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command, e.g. from telnet
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            size = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    async def handle(self, reader, writer):
+        subscribed = set()
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                command = args[0].upper()
+                if command == b"PING":
+                    writer.write(b"+PONG\r\n")
+                elif command in (b"AUTH", b"SELECT"):
+                    writer.write(b"+OK\r\n")
+                elif command == b"GET":
+                    writer.write(_bulk(self.store.get(args[1])))
+                elif command == b"SET":
+                    self.store[args[1]] = args[2]
+                    writer.write(b"+OK\r\n")
+                elif command == b"DEL":
+                    removed = sum(1 for key in args[1:] if self.store.pop(key, None) is not None)
+                    writer.write(b":%d\r\n" % removed)
+                elif command == b"PUBLISH":
+                    receivers = self.channels.get(args[1], ())
+                    message = _array([_bulk(b"message"), _bulk(args[1]), _bulk(args[2])])
+                    for receiver in list(receivers):
+                        receiver.write(message)
+                    writer.write(b":%d\r\n" % len(receivers))
+                elif command == b"SUBSCRIBE":
+                    for channel in args[1:]:
+                        subscribed.add(channel)
+                        self.channels.setdefault(channel, set()).add(writer)
+                        writer.write(_array([_bulk(b"subscribe"), _bulk(channel), b":%d\r\n" % len(subscribed)]))
+                elif command == b"UNSUBSCRIBE":
+                    for channel in args[1:] or list(subscribed):
+                        subscribed.discard(channel)
+                        self._leave(channel, writer)
+                        writer.write(_array([_bulk(b"unsubscribe"), _bulk(channel), b":%d\r\n" % len(subscribed)]))
+                else:
+                    writer.write(b"-ERR unknown command '%s'\r\n" % command)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscribed:
+                self._leave(channel, writer)
+            writer.close()
+
+    def _leave(self, channel, writer):
+        receivers = self.channels.get(channel)
+        if receivers is not None:
+            receivers.discard(writer)
+            if not receivers:
+                del self.channels[channel]
+
+
+async def serve(host, port):
+    broker = Broker()
+    server = await asyncio.start_server(broker.handle, host, port)
+    print(f"Pub/sub broker listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
@@ -0,0 +1,202 @@
+"""Background lifecycle management for rooms and games.
+
+Every ``REAPER_INTERVAL`` the reaper looks at the rooms held in memory and
+applies a TTL by state, counted from the room's last client-visible change:
+
+* ``waiting`` rooms nobody started within ``ROOM_WAITING_TTL`` are evicted
+  and their games row is deleted (players and events cascade).
+* Started rooms idle for ``ROOM_IDLE_TTL`` with no socket open are evicted
+  from memory only; the game stays in the database and is loaded again if
+  anyone comes back. A room with sockets open is left alone: its tabs would
+  take the close as final (see below) although the game goes on.
+* Finished rooms are evicted ``ROOM_FINISHED_TTL`` after game over and the
+  game is moved to ``games_archive``, a one-row summary per game that also
+  keeps its event log for ``GET /api/game/events``.
+
+Evicting flushes the room, closes its sockets (code 1001, which the browser
+does not reconnect on) and drops every
+per-room structure: room store entry, pending action and its timer,
+broadcast history, resume ring, cached state view and spectator feed.
+Pending actions left behind by rooms that are no longer in memory are
+dropped, and ones whose timer was lost are re-armed so the reaction window
+still resolves.
+
+Every ``PURGE_INTERVAL`` the ``purge_stale_games`` function applies the same
+policies to games no worker holds in memory, archives started games idle
+for ``ROOM_ABANDONED_TTL`` as abandoned, and deletes archive rows older than
+``ARCHIVE_RETENTION_DAYS``. Without the SQL functions from
+``setup_database.sql`` the database side is skipped and only memory is
+reclaimed.
+"""
+
+import os
+import time
+
+from postgrest import exceptions as postgrest_exceptions
+
+from backend import broadcast, metrics
+from backend.api.game import pending_actions, store_pending, sync_reaction_timer, REACTION_WINDOW
+from backend.connections import connection_manager
+from backend.repository import repository, is_missing_function
+from backend.resume import resume_buffer
+from backend.room_executor import room_executor
+from backend.room_store import room_store
+from backend.spectators import spectator_stream
+from backend.state_cache import state_cache
+from backend.timers import reaction_timers
+
+# Seconds between sweeps of the in-memory rooms
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", "60"))
+# Seconds between database purges
+PURGE_INTERVAL = float(os.getenv("PURGE_INTERVAL", "600"))
+# Seconds since the last change before a room is reaped, by state
+WAITING_TTL = float(os.getenv("ROOM_WAITING_TTL", "1800"))
+IDLE_TTL = float(os.getenv("ROOM_IDLE_TTL", "3600"))
+FINISHED_TTL = float(os.getenv("ROOM_FINISHED_TTL", "300"))
+# Seconds before a started game nobody touches is archived as abandoned
+ABANDONED_TTL = float(os.getenv("ROOM_ABANDONED_TTL", "86400"))
+# Days archived games are kept; 0 keeps them forever
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "90"))
+
+TIMER_KEY = "reaper:sweep"
+
+
+def policy(room):
+    """The TTL policy that applies to a room: ``waiting``, ``idle`` or ``finished``."""
+    if room.get("game_over"):
+        return "finished"
+    if room.get("status") == "waiting":
+        return "waiting"
+    return "idle"
+
+
+TTLS = {"waiting": WAITING_TTL, "idle": IDLE_TTL, "finished": FINISHED_TTL}
+
+
+class Reaper:
+    def __init__(self, timers, interval=REAPER_INTERVAL, purge_interval=PURGE_INTERVAL):
+        self.timers = timers
+        self.interval = interval
+        self.purge_interval = purge_interval
+        # Cleared when the SQL functions are missing, see setup_database.sql
+        self.archiving = True
+        self.purging = True
+        self._next_purge = 0.0
+
+    def start(self):
+        self._next_purge = time.time() + self.purge_interval
+        self.timers.schedule(TIMER_KEY, time.time() + self.interval, self._tick)
+
+    def stop(self):
+        self.timers.cancel(TIMER_KEY)
+
+    async def _tick(self):
+        try:
+            await self.sweep()
+        finally:
+            self.timers.schedule(TIMER_KEY, time.time() + self.interval, self._tick)
+
+    def expired(self, room_code, room, now):
+        """The room's policy if it has been idle past its TTL, else None."""
+        changed_at = room_store.changed_at.get(room_code)
+        if changed_at is None:
+            # Installed without going through load/bump (e.g. a direct put); start its clock now
+            room_store.changed_at[room_code] = now
+            return None
+        name = policy(room)
+        if name == "idle" and connection_manager.occupied(room_code):
+            return None
+        return name if now - changed_at >= TTLS[name] else None
+
+    async def sweep(self):
+        now = time.time()
+        for room_code in list(room_store.rooms):
+            room = room_store.get(room_code)
+            if room is not None and self.expired(room_code, room, now):
+                try:
+                    await room_executor.run(room_code, self._reap, room_code)
+                except Exception as e:
+                    print(f"Reaper error ({room_code}): {e}")
+        self._sweep_pending(now)
+        for room_code in broadcast.rooms():
+            if room_code not in room_store.rooms:
+                broadcast.forget(room_code)
+        for cache in (resume_buffer, state_cache):
+            for room_code in cache.rooms():
+                if room_code not in room_store.rooms:
+                    cache.forget(room_code)
+        if self.purging and now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            await self.purge()
+
+    async def _reap(self, room_code):
+        # Runs on the room's executor, so no command interleaves; re-check in case one ran meanwhile
+        room = room_store.get(room_code)
+        if room is None:
+            return
+        name = self.expired(room_code, room, time.time())
+        if name is None:
+            return
+        await room_store.flush(room_code)
+        pending_actions.pop(room_code, None)
+        reaction_timers.cancel(room_code)
+        closed = connection_manager.close_room(room_code)
+        room_store.evict(room_code)
+        broadcast.forget(room_code)
+        resume_buffer.forget(room_code)
+        state_cache.forget(room_code)
+        spectator_stream.forget(room_code)
+        metrics.rooms_reaped.inc(name)
+        print(f"Reaped {name} room {room_code} ({closed} sockets closed)")
+        if name == "idle":
+            return
+        # The game is gone for good: don't leave its pending action in the shared store
+        await store_pending(room_code)
+        if name == "waiting":
+            await repository.delete_game(room["id"])
+            metrics.games_purged.inc("deleted")
+        elif self.archiving:
+            try:
+                await repository.archive_game(room["id"], "finished")
+            except postgrest_exceptions.APIError as e:
+                if not is_missing_function(e):
+                    raise
+                print(f"archive_game unavailable, finished games stay in games: {e.message}")
+                self.archiving = False
+                return
+            metrics.games_purged.inc("finished")
+
+    def _sweep_pending(self, now):
+        for room_code in list(pending_actions):
+            if room_code not in room_store.rooms:
+                # Nothing can resolve or show it any more; a later load restores it from the event log
+                del pending_actions[room_code]
+                reaction_timers.cancel(room_code)
+            elif (reaction_timers.deadline(room_code) is None
+                  and now - pending_actions[room_code]["timestamp"] > REACTION_WINDOW + self.interval):
+                # Its timer was lost (e.g. the worker that owned it went away); let this worker resolve it
+                sync_reaction_timer(room_code)
+
+    async def purge(self):
+        """Apply the TTL policies to games in the database, including ones no worker holds."""
+        try:
+            counts = await repository.purge_stale_games(WAITING_TTL, FINISHED_TTL, ABANDONED_TTL,
+                                                        ARCHIVE_RETENTION_DAYS)
+        except postgrest_exceptions.APIError as e:
+            if not is_missing_function(e):
+                print(f"Purge error: {e.message}")
+                return
+            print(f"purge_stale_games unavailable, skipping database cleanup: {e.message}")
+            self.purging = False
+            return
+        except Exception as e:
+            print(f"Purge error: {e}")
+            return
+        for outcome, count in counts.items():
+            if count:
+                metrics.games_purged.inc(outcome, amount=count)
+        if any(counts.values()):
+            print(f"Purged stale games: {counts}")
+
+
+reaper = Reaper(reaction_timers)
@@ -0,0 +1,192 @@
+import os
+import time
+
+import httpx
+from postgrest import exceptions as postgrest_exceptions
+
+from backend import metrics
+from backend.tracing import tracer
+from backend.supabase_client import SUPABASE_URL, SUPABASE_KEY
+
+# Connection pool and timeouts for the PostgREST API, in connections and seconds
+POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+REQUEST_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+POOL_TIMEOUT = float(os.getenv("SUPABASE_POOL_TIMEOUT", "5"))
+
+
+class VersionConflict(Exception):
+    """The games row changed since it was read; the caller's state is stale."""
+
+
+class GameRepository:
+    """Non-blocking access to the ``games`` and ``game_players`` tables.
+
+    Talks to Supabase's PostgREST endpoint over one pooled keep-alive
+    ``httpx.AsyncClient``, so handlers never block the event loop on I/O.
+    Failed requests raise ``postgrest.exceptions.APIError`` like the sync client.
+    """
+
+    def __init__(self, url=SUPABASE_URL, key=SUPABASE_KEY, pool_size=POOL_SIZE, transport=None):
+        self.base_url = f"{url.rstrip('/')}/rest/v1"
+        self.headers = {
+            "apikey": key,
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+        }
+        self.pool_size = pool_size
+        self.transport = transport
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT, pool=POOL_TIMEOUT),
+                transport=self.transport,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method, path, params=None, json=None, returning=False):
+        headers = {"Prefer": "return=representation"} if returning else None
+        operation = f"{method} {path}"
+        action = metrics.current_action.get()
+        started = time.perf_counter()
+        try:
+            with tracer.span(f"supabase {operation}"):
+                res = await self.client.request(method, path, params=params, json=json, headers=headers)
+        except Exception:
+            metrics.supabase_errors.inc(operation, action)
+            raise
+        finally:
+            metrics.supabase_seconds.observe(time.perf_counter() - started, operation, action)
+        if res.status_code >= 400:
+            metrics.supabase_errors.inc(operation, action)
+            try:
+                error = res.json()
+            except ValueError:
+                error = {"message": res.text}
+            if not isinstance(error, dict):
+                error = {"message": str(error)}
+            raise postgrest_exceptions.APIError(error)
+        if res.status_code == 204 or not res.content:
+            return None
+        return res.json()
+
+    # ------------------------------------------------------------------ games
+
+    async def get_game_with_players(self, room_code):
+        """The games row with its ``game_players`` embedded in seat order, in one round trip."""
+        rows = await self._request("GET", "/games", params={
+            "room_code": f"eq.{room_code}",
+            "select": "*,game_players(*)",
+            "game_players.order": "id.asc",
+        })
+        return rows[0] if rows else None
+
+    async def create_game(self, row):
+        return await self._request("POST", "/games", json=row, returning=True)
+
+    async def apply_game_state(self, game_id, expected_version, game, players):
+        """Commit a whole room snapshot through the ``apply_game_state`` function.
+
+        Returns the new ``games.version``; raises ``VersionConflict`` if the row
+        is no longer at ``expected_version``.
+        """
+        try:
+            return await self._request("POST", "/rpc/apply_game_state", json={
+                "p_game_id": game_id,
+                "p_expected_version": expected_version,
+                "p_game": game,
+                "p_players": players,
+            })
+        except postgrest_exceptions.APIError as e:
+            if e.code == "40001":
+                raise VersionConflict(e.message or "version conflict") from e
+            raise
+
+    async def delete_game(self, game_id):
+        """Delete a games row; its players and events go with it (ON DELETE CASCADE)."""
+        await self._request("DELETE", "/games", params={"id": f"eq.{game_id}"})
+
+    async def archive_game(self, game_id, outcome="finished"):
+        """Move a game into ``games_archive`` through the ``archive_game`` function."""
+        return await self._request("POST", "/rpc/archive_game", json={"p_game_id": game_id, "p_outcome": outcome})
+
+    async def archived_events(self, room_code, after_seq=0):
+        """Events of the room's most recently archived game with ``seq > after_seq``, or None if none is archived."""
+        rows = await self._request("GET", "/games_archive", params={
+            "room_code": f"eq.{room_code}",
+            "select": "events",
+            "order": "finished_at.desc",
+            "limit": "1",
+        })
+        if not rows:
+            return None
+        return [e for e in rows[0].get("events") or [] if e["seq"] > after_seq]
+
+    async def purge_stale_games(self, waiting_ttl, finished_ttl, abandoned_ttl, archive_retention_days):
+        """Delete or archive games idle past their TTL (seconds); returns counts per outcome."""
+        return await self._request("POST", "/rpc/purge_stale_games", json={
+            "p_waiting_ttl": int(waiting_ttl),
+            "p_finished_ttl": int(finished_ttl),
+            "p_abandoned_ttl": int(abandoned_ttl),
+            "p_archive_retention": int(archive_retention_days),
+        }) or {}
+
+    # ----------------------------------------------------------- game_players
+
+    async def insert_player(self, row):
+        return await self._request("POST", "/game_players", json=row, returning=True)
+
+    async def delete_players(self, game_id, **filters):
+        """Delete the room's players matching ``column=value`` filters; returns deleted rows."""
+        params = {"game_id": f"eq.{game_id}"}
+        params.update({column: f"eq.{value}" for column, value in filters.items()})
+        return await self._request("DELETE", "/game_players", params=params, returning=True) or []
+
+    # ------------------------------------------------------------ game_events
+
+    async def append_events(self, rows):
+        """Insert log events; a taken ``(game_id, seq)`` means another worker wrote first."""
+        try:
+            await self._request("POST", "/game_events", json=rows)
+        except postgrest_exceptions.APIError as e:
+            if e.code == "23505":
+                raise VersionConflict(e.message or "event sequence taken") from e
+            raise
+
+    async def list_events(self, game_id, after_seq=0):
+        """The room's events with ``seq > after_seq``, oldest first."""
+        return await self._request("GET", "/game_events", params={
+            "game_id": f"eq.{game_id}",
+            "seq": f"gt.{after_seq}",
+            "select": "*",
+            "order": "seq.asc",
+        }) or []
+
+
+def is_missing_table(error):
+    """Whether a PostgREST error says the table does not exist (schema not migrated yet)."""
+    return error.code in ("42P01", "PGRST205")
+
+
+def is_missing_function(error):
+    """Whether a PostgREST error says the RPC function does not exist."""
+    return error.code in ("42883", "PGRST202")
+
+
+repository = GameRepository()
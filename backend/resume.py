@@ -0,0 +1,70 @@
+"""Recent room events, so a reconnecting socket only receives what it missed.
+
+Every room event rendered by this worker is kept in a bounded per-room ring
+together with its ``RoomBroadcast``. The room ``version`` carried by every
+state message is the event's sequence number: a client reconnects with
+``?since=<last version it applied>`` and, when that version is still in the
+ring, gets the events after it rendered as patches against the state it
+already holds, without the room being read again. Otherwise (gap older than
+the ring, room not live on this worker) it gets a full snapshot as on a
+first connect.
+"""
+
+import os
+from collections import deque
+
+# Events kept per room; matches the views a connection may hold unacknowledged (see delta.py)
+RESUME_BUFFER = int(os.getenv("WS_RESUME_BUFFER", "32"))
+
+
+class RoomEvent:
+    """One rendered room event: what every socket saw at ``version``."""
+
+    __slots__ = ("version", "kind", "bc", "msg", "pending")
+
+    def __init__(self, version, kind, bc, msg, pending):
+        self.version = version
+        self.kind = kind
+        self.bc = bc
+        self.msg = msg
+        # Raw pending action, so a replay reports the time remaining now
+        self.pending = pending
+
+
+class ResumeBuffer:
+    def __init__(self, size=RESUME_BUFFER):
+        self.size = size
+        self.rings = {}
+
+    def record(self, room_code, version, kind, bc, msg, pending):
+        ring = self.rings.get(room_code)
+        if ring is None:
+            ring = self.rings[room_code] = deque(maxlen=self.size)
+        event = RoomEvent(version, kind, bc, msg, pending)
+        ring.append(event)
+        return event
+
+    def since(self, room_code, version, current):
+        """Events after ``version`` up to ``current``, or None if the ring does not cover the gap."""
+        if version == current:
+            return []
+        ring = self.rings.get(room_code)
+        # A room reloaded since its last event has changes the ring never saw
+        if not ring or ring[-1].version != current or not ring[0].version <= version < current:
+            return None
+        events = []
+        for event in reversed(ring):
+            if event.version == version:
+                events.reverse()
+                return events
+            events.append(event)
+        return None
+
+    def rooms(self):
+        return list(self.rings)
+
+    def forget(self, room_code):
+        self.rings.pop(room_code, None)
+
+
+resume_buffer = ResumeBuffer()
@@ -0,0 +1,73 @@
+import asyncio
+import contextvars
+import time
+
+from backend import metrics
+
+
+class RoomExecutor:
+    """Runs commands for one room strictly one after another.
+
+    Each room with queued work gets its own actor task draining a FIFO queue,
+    so commands for the same room never interleave across ``await`` points
+    while different rooms proceed in parallel. Idle actors exit and are
+    recreated on the next command.
+    """
+
+    def __init__(self):
+        self._queues = {}
+        # Running actors; the loop only keeps weak references to tasks
+        self._actors = set()
+
+    async def run(self, room_code, fn, *args, **kwargs):
+        """Queue ``await fn(*args, **kwargs)`` on the room's actor and return its result.
+
+        The command runs in a copy of the caller's context, so context
+        variables (e.g. ``metrics.current_action``) follow it onto the actor.
+        """
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(room_code)
+        if queue is None:
+            queue = self._queues[room_code] = asyncio.Queue()
+            task = asyncio.create_task(self._actor(room_code, queue))
+            self._actors.add(task)
+            task.add_done_callback(self._actors.discard)
+            task.add_done_callback(_log_actor_error)
+        queue.put_nowait((fn, args, kwargs, future, contextvars.copy_context(), time.perf_counter()))
+        return await future
+
+    def pending(self, room_code):
+        queue = self._queues.get(room_code)
+        return queue.qsize() if queue is not None else 0
+
+    async def _actor(self, room_code, queue):
+        try:
+            while not queue.empty():
+                fn, args, kwargs, future, context, queued_at = queue.get_nowait()
+                if future.cancelled():
+                    continue
+                metrics.room_queue_seconds.observe(time.perf_counter() - queued_at)
+                try:
+                    # A task created inside ``context`` runs every step of the command in it
+                    result = await context.run(asyncio.ensure_future, fn(*args, **kwargs))
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                else:
+                    if not future.cancelled():
+                        future.set_result(result)
+        finally:
+            # Nothing left; a later run() starts a fresh actor
+            if self._queues.get(room_code) is queue:
+                del self._queues[room_code]
+
+
+def _log_actor_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Room actor error: {task.exception()}")
+
+
+room_executor = RoomExecutor()
@@ -0,0 +1,367 @@
+import asyncio
+import functools
+import json
+import os
+import time
+
+from postgrest import exceptions as postgrest_exceptions
+
+from backend.event_log import event_log, replay
+from backend.game_logic import PlayerIndex
+from backend.repository import repository, VersionConflict, is_missing_table
+from backend.tracing import tracer
+
+# How long dirty rooms wait before being written, so bursts of mutations coalesce
+WRITE_BEHIND_DELAY = float(os.getenv("ROOM_WRITE_BEHIND_MS", "250")) / 1000.0
+WRITE_RETRY_DELAY = 1.0
+
+
+def decode_json(value, default):
+    """Decode a JSONB column that may arrive as a JSON string or as a parsed value."""
+    if value is None:
+        return list(default)
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except Exception:
+            return list(default)
+    return value
+
+
+def decode_player(p):
+    """Parse hand/revealed of a game_players row in place and keep both lists aligned."""
+    p["hand"] = decode_json(p.get("hand"), [])
+    p["revealed"] = decode_json(p.get("revealed"), [False, False])
+    hand_len = len(p["hand"])
+    if len(p["revealed"]) < hand_len:
+        p["revealed"].extend([False] * (hand_len - len(p["revealed"])))
+    elif len(p["revealed"]) > hand_len:
+        p["revealed"] = p["revealed"][:hand_len]
+    return p
+
+
+def room_view(room):
+    """Split an in-memory room into the {"game", "players"} shape used by masking."""
+    game = {k: v for k, v in room.items() if k != "players"}
+    return {"game": game, "players": room.get("players", [])}
+
+
+def game_row(room):
+    """Columns of the games row that change during play."""
+    return {
+        "status": room.get("status"),
+        "turn": room.get("turn", 0),
+        "deck": json.dumps(room.get("deck") or []),
+        "trash": json.dumps(room.get("trash") or []),
+        "winner": room.get("winner"),
+        "game_over": room.get("game_over", False),
+        "event_seq": room.get("event_seq") or 0,
+    }
+
+
+def player_row(p):
+    """Columns of a game_players row that change during play."""
+    return {
+        "coins": p["coins"],
+        "hand": json.dumps(p["hand"]),
+        "revealed": json.dumps(p["revealed"]),
+        "is_alive": p["is_alive"],
+    }
+
+
+async def _fetch_room(room_code):
+    """Read a room's latest snapshot, its players in seat order, and replay the events after it.
+
+    Returns ``(room, snapshot_seq, pending)``.
+    """
+    room = await repository.get_game_with_players(room_code)
+    if room is None:
+        return None, 0, None
+    room["deck"] = decode_json(room.get("deck"), [])
+    room["trash"] = decode_json(room.get("trash"), [])
+    room["players"] = [decode_player(p) for p in room.pop("game_players", None) or []]
+    snapshot_seq = room.get("event_seq") or 0
+    pending = None
+    if event_log.enabled:
+        try:
+            tail = await repository.list_events(room["id"], snapshot_seq)
+        except postgrest_exceptions.APIError as e:
+            if not is_missing_table(e):
+                raise
+            _disable_event_log(e)
+            tail = []
+        if tail:
+            room, pending = replay(room, tail)
+    return room, snapshot_seq, pending
+
+
+def _disable_event_log(error):
+    print(f"game_events unavailable, writing full snapshots instead: {error.message}")
+    event_log.enabled = False
+
+
+class RoomStore:
+    """Authoritative in-memory state for live rooms, persisted to Supabase write-behind.
+
+    A room is the game_state dict the rules code already works on: the games row
+    with decoded ``deck``/``trash`` plus a ``players`` list of decoded rows.
+    Mutations are recorded with ``mark_dirty`` and written by a background worker
+    after ``WRITE_BEHIND_DELAY``; ``flush`` writes immediately and is used at turn
+    boundaries and game over.
+
+    Mutations covered by ``event_log`` events are persisted by appending the
+    events; the full rows are only rewritten when a snapshot is due, at game
+    over, or after a mutation that was not logged.
+    """
+
+    def __init__(self):
+        self.rooms = {}
+        self.versions = {}
+        self.indexes = {}
+        # Pending actions rebuilt from the event log on load, picked up by the API layer
+        self.restored = {}
+        # Wall-clock time of the last load or client-visible change, for the reaper's TTLs
+        self.changed_at = {}
+        self._unlogged = set()
+        self._mutations = {}
+        self._persisted = {}
+        self._locks = {}
+        # room_code -> in-flight read, shared by concurrent loads
+        self._loading = {}
+        self._queued = set()
+        self._queue = None
+        self._worker = None
+
+    # ------------------------------------------------------------------ reads
+
+    def get(self, room_code):
+        return self.rooms.get(room_code)
+
+    def version(self, room_code):
+        """Monotonic version of the room state as seen by clients."""
+        return self.versions.get(room_code, 0)
+
+    def index(self, room_code):
+        """The room's ``PlayerIndex``, built on first use after a load."""
+        index = self.indexes.get(room_code)
+        if index is None:
+            room = self.rooms.get(room_code)
+            if room is None:
+                return PlayerIndex()
+            index = self.reindex(room_code)
+        return index
+
+    def reindex(self, room_code):
+        """Rebuild the room's index after players joined or left.
+
+        A new index replaces the old one, so broadcasts built earlier keep the
+        seats they were built with.
+        """
+        room = self.rooms.get(room_code)
+        index = self.indexes[room_code] = PlayerIndex(room.get("players") or [] if room else [])
+        return index
+
+    async def load(self, room_code):
+        """Return the live room, reading it from Supabase on first use.
+
+        Concurrent misses for a room share one read.
+        """
+        room = self.rooms.get(room_code)
+        if room is not None:
+            return room
+        task = self._loading.get(room_code)
+        if task is None:
+            task = self._loading[room_code] = asyncio.ensure_future(self._load(room_code))
+            task.add_done_callback(functools.partial(self._loaded, room_code))
+        # Shielded so one caller giving up does not cancel the read for the others
+        return await asyncio.shield(task)
+
+    def _loaded(self, room_code, task):
+        if self._loading.get(room_code) is task:
+            del self._loading[room_code]
+        if not task.cancelled():
+            # Retrieved here too, so a read whose callers all gave up doesn't log an unretrieved error
+            task.exception()
+
+    async def _load(self, room_code):
+        fetched, snapshot_seq, pending = await _fetch_room(room_code)
+        if fetched is None:
+            return None
+        # Another request may have loaded (and mutated) the room while we waited
+        room = self.rooms.setdefault(room_code, fetched)
+        if room is fetched:
+            event_log.attach(room_code, room, snapshot_seq)
+            if pending is not None:
+                self.restored[room_code] = pending
+            self.changed_at[room_code] = time.time()
+        # Start from the clock so versions keep increasing across evictions and restarts
+        self.versions.setdefault(room_code, int(time.time() * 1000))
+        return room
+
+    # ----------------------------------------------------------------- writes
+
+    def put(self, room_code, room, logged=False):
+        """Install a room (e.g. a mutated copy) as the authoritative state.
+
+        ``logged`` means the change was recorded in ``event_log``.
+        """
+        self.rooms[room_code] = room
+        self.mark_dirty(room_code, logged)
+
+    def replace(self, room_code, room, version=0):
+        """Install state committed by another worker and return the local version.
+
+        The room is not marked dirty; the worker that produced it persists it.
+        """
+        self.rooms[room_code] = room
+        self.indexes.pop(room_code, None)
+        event_log.attach(room_code, room)
+        self._persisted[room_code] = self._mutations.get(room_code, 0)
+        self._unlogged.discard(room_code)
+        self.changed_at[room_code] = time.time()
+        self.versions[room_code] = max(self.versions.get(room_code, 0) + 1, version)
+        return self.versions[room_code]
+
+    def bump_version(self, room_code):
+        """Record a client-visible change that does not need persisting (e.g. join/leave)."""
+        self.changed_at[room_code] = time.time()
+        self.versions[room_code] = self.versions.get(room_code, 0) + 1
+        return self.versions[room_code]
+
+    def mark_dirty(self, room_code, logged=False):
+        self.bump_version(room_code)
+        if not logged:
+            self._unlogged.add(room_code)
+        self._mutations[room_code] = self._mutations.get(room_code, 0) + 1
+        if room_code in self._queued:
+            return
+        self._queued.add(room_code)
+        if self._queue is not None:
+            self._queue.put_nowait((room_code, time.monotonic() + WRITE_BEHIND_DELAY))
+
+    def evict(self, room_code):
+        self.rooms.pop(room_code, None)
+        self.versions.pop(room_code, None)
+        self.indexes.pop(room_code, None)
+        self.restored.pop(room_code, None)
+        self.changed_at.pop(room_code, None)
+        self._unlogged.discard(room_code)
+        event_log.forget(room_code)
+        self._mutations.pop(room_code, None)
+        self._persisted.pop(room_code, None)
+        self._locks.pop(room_code, None)
+        self._queued.discard(room_code)
+
+    def is_dirty(self, room_code):
+        return self._persisted.get(room_code, 0) < self._mutations.get(room_code, 0)
+
+    async def flush(self, room_code):
+        """Durably write the latest state of a room, waiting for completion."""
+        lock = self._locks.setdefault(room_code, asyncio.Lock())
+        async with lock:
+            room = self.rooms.get(room_code)
+            if room is None or not self.is_dirty(room_code):
+                return
+            version = self._mutations.get(room_code, 0)
+            try:
+                with tracer.span("persist", room=room_code):
+                    await self._append_events(room_code)
+                    if self._snapshot_due(room_code, room):
+                        await self._snapshot(room_code, room)
+            except VersionConflict:
+                # Someone else committed this room; our copy is stale, reload it on next use
+                print(f"Version conflict on room {room_code}, dropping in-memory state")
+                self.evict(room_code)
+                raise
+            self._persisted[room_code] = max(self._persisted.get(room_code, 0), version)
+
+    async def _append_events(self, room_code):
+        events = event_log.unpersisted(room_code)
+        if not events or not event_log.enabled:
+            return
+        try:
+            await repository.append_events(events)
+        except postgrest_exceptions.APIError as e:
+            if not is_missing_table(e):
+                raise
+            _disable_event_log(e)
+            return
+        event_log.mark_persisted(room_code, events[-1]["seq"])
+
+    def _snapshot_due(self, room_code, room):
+        return (not event_log.enabled or room_code in self._unlogged or bool(room.get("game_over"))
+                or event_log.snapshot_due(room_code))
+
+    async def _snapshot(self, room_code, room):
+        # Serialize on the loop thread so later mutations can't race the write
+        game_update = game_row(room)
+        player_updates = [{"id": p["id"], **player_row(p)} for p in room.get("players", [])]
+        self._unlogged.discard(room_code)
+        # One apply_game_state RPC commits players and games row in a single transaction
+        try:
+            new_version = await repository.apply_game_state(room["id"], room.get("version") or 0, game_update, player_updates)
+        except Exception:
+            self._unlogged.add(room_code)
+            raise
+        event_log.mark_snapshot(room_code, game_update["event_seq"])
+        current = self.rooms.get(room_code)
+        if current is not None:
+            current["version"] = new_version
+
+    def schedule_flush(self, room_code):
+        """Start a durable flush without making the caller wait for it."""
+        task = asyncio.create_task(self.flush(room_code))
+        task.add_done_callback(_log_flush_error)
+        return task
+
+    async def flush_all(self):
+        for room_code in list(self.rooms):
+            try:
+                await self.flush(room_code)
+            except Exception as e:
+                print(f"Room flush error ({room_code}): {e}")
+
+    # ----------------------------------------------------------------- worker
+
+    def start(self):
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue()
+        for room_code in self._queued:
+            self._queue.put_nowait((room_code, time.monotonic() + WRITE_BEHIND_DELAY))
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self._queue = None
+        await self.flush_all()
+
+    async def _run(self):
+        while True:
+            room_code, due = await self._queue.get()
+            wait = due - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._queued.discard(room_code)
+            try:
+                await self.flush(room_code)
+            except Exception as e:
+                print(f"Write-behind error ({room_code}): {e}")
+                await asyncio.sleep(WRITE_RETRY_DELAY)
+                if room_code in self.rooms and room_code not in self._queued:
+                    self._queued.add(room_code)
+                    self._queue.put_nowait((room_code, time.monotonic()))
+
+
+def _log_flush_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Room flush error: {task.exception()}")
+
+
+room_store = RoomStore()
@@ -0,0 +1,342 @@
+"""Self-play simulator on top of ``backend.engine``.
+
+Plays complete games between pluggable policies and fans batches out over a
+process pool:
+
+    python -m backend.simulate --games 1000000 --players 4 --policy honest,random
+    python -m backend.simulate --games 200000 --workers 8 --json
+    python -m backend.simulate --games 1000000 --vectorized --batch 20000
+
+``--vectorized`` plays the random policy through ``backend.batch_engine``,
+thousands of games per NumPy step, instead of one game at a time.
+``batch_engine.random_turn`` draws turns, reactions and card choices with the
+same distribution as ``random_policy``, so both modes report the same game.
+
+Reports games/sec, win rates by seat and by each player's opening action, and
+the distribution of game lengths in turns.
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from backend import engine
+from backend.engine import Action, Command, Stage
+
+# Games without a winner after this many decisions are counted as stalled
+MAX_DECISIONS = 2000
+
+
+def shuffled_deck(rng):
+    """``create_deck`` as card codes: three of each card, shuffled."""
+    deck = [card for card in range(len(engine.CARD_TYPES)) for _ in range(3)]
+    rng.shuffle(deck)
+    return deck
+
+
+# ------------------------------------------------------------------ options
+
+def turn_options(state, seat):
+    """Every legal turn command for ``seat``."""
+    targets = [t for t, p in enumerate(state.players) if p.alive and t != seat]
+    options = []
+    for action, name in engine.ACTION_NAMES.items():
+        if action in engine.TARGETED:
+            # Legality only depends on a target being named, so check it once
+            if targets and engine.is_legal(state, seat, action, targets[0]):
+                options.extend([Command(name, seat, t) for t in targets])
+        elif engine.is_legal(state, seat, action):
+            options.append(Command(name, seat))
+    return options
+
+
+def reaction_options(state, seat):
+    """``None`` (let it go) plus the challenges and blocks open to ``seat``."""
+    pa = state.pending
+    options = [None]
+    if pa.stage == Stage.BLOCK_REACTION:
+        if seat != pa.blocker:
+            options.append(Command("challenge", seat))
+        return options
+    if seat == pa.actor:
+        return options
+    if pa.action in engine.CLAIMS:
+        options.append(Command("challenge", seat))
+    allowed = engine.BLOCKERS.get(pa.action, ())
+    if pa.action == Action.FOREIGN_AID or seat == pa.target:
+        options.extend(Command("block", seat, card=card) for card in allowed)
+    return options
+
+
+def selection_options(state, seat):
+    pa = state.pending
+    hand = state.players[seat].hand
+    if pa.stage == Stage.REVEAL_CLAIM:
+        return [Command("select_card", seat, card_index=i) for i, card in enumerate(hand) if card == pa.required_card]
+    return [Command("select_card", seat, card_index=i) for i in range(len(hand))]
+
+
+# ----------------------------------------------------------------- policies
+
+def random_policy(state, seat, options, rng):
+    """Uniform over the legal options; reactions are let go half the time."""
+    if options[0] is None and rng.random() < 0.5:
+        return None
+    return rng.choice(options)
+
+
+def honest_policy(state, seat, options, rng):
+    """Only claims and blocks with cards it holds; challenges claims it can rule out."""
+    hand = state.players[seat].hand
+    if options[0] is None:
+        pa = state.pending
+        for option in options[1:]:
+            if option.kind == "block" and option.card in hand:
+                return option
+        claimed = pa.block_card if pa.stage == Stage.BLOCK_REACTION else engine.CLAIMS.get(pa.action)
+        # All three copies visible to us means the claim is a bluff
+        if claimed is not None and hand.count(claimed) + state.trash.count(claimed) >= 3:
+            for option in options[1:]:
+                if option.kind == "challenge":
+                    return option
+        return None
+    if options[0].kind == "select_card":
+        return rng.choice(options)
+    coups = [option for option in options if option.kind == "coup"]
+    if coups:
+        return rng.choice(coups)
+    honest = [option for option in options
+              if engine.CLAIMS.get(engine.ACTION_CODES[option.kind]) in (None, *hand)]
+    return rng.choice(honest)
+
+
+def income_policy(state, seat, options, rng):
+    """Takes income until it can coup; never reacts."""
+    if options[0] is None:
+        return None
+    if options[0].kind == "select_card":
+        return options[0]
+    coups = [option for option in options if option.kind == "coup"]
+    if coups:
+        return rng.choice(coups)
+    for option in options:
+        if option.kind == "income":
+            return option
+    return options[0]
+
+
+POLICIES = {
+    "random": random_policy,
+    "honest": honest_policy,
+    "income": income_policy,
+}
+
+
+# --------------------------------------------------------------------- play
+
+def play_game(policies, rng):
+    """Play one game; returns ``(winner seat or None, turns, opening actions by seat)``."""
+    n = len(policies)
+    state = engine.new_game(shuffled_deck(rng), n, turn=rng.randrange(n))
+    openings = [None] * n
+    turns = 0
+    for _ in range(MAX_DECISIONS):
+        if state.game_over:
+            return state.winner, turns, openings
+        pa = state.pending
+        if pa is None:
+            seat = state.turn
+            command = policies[seat](state, seat, turn_options(state, seat), rng)
+            if openings[seat] is None:
+                openings[seat] = command.kind
+            turns += 1
+        elif pa.stage in (Stage.REACTION, Stage.BLOCK_REACTION):
+            command = None
+            for offset in range(1, n + 1):
+                seat = (pa.actor + offset) % n
+                if not state.players[seat].alive:
+                    continue
+                command = policies[seat](state, seat, reaction_options(state, seat), rng)
+                if command is not None:
+                    break
+            if command is None:
+                command = Command("pass", pa.actor)
+        else:
+            seat = pa.awaiting
+            options = selection_options(state, seat) if seat is not None else []
+            if not options:
+                break
+            command = policies[seat](state, seat, options, rng)
+        state, _ = engine.step(state, command)
+    return None, turns, openings
+
+
+def run_batch(policy_names, games, seed):
+    """Play ``games`` games in this process and return aggregated counters."""
+    policies = [POLICIES[name] for name in policy_names]
+    rng = random.Random(seed)
+    wins = Counter()
+    lengths = Counter()
+    openings = Counter()
+    opening_wins = Counter()
+    stalled = 0
+    for _ in range(games):
+        winner, turns, opened = play_game(policies, rng)
+        if winner is None:
+            stalled += 1
+            continue
+        wins[winner] += 1
+        lengths[turns] += 1
+        for seat, action in enumerate(opened):
+            if action is not None:
+                openings[action] += 1
+                if seat == winner:
+                    opening_wins[action] += 1
+    return {"wins": wins, "lengths": lengths, "openings": openings, "opening_wins": opening_wins, "stalled": stalled}
+
+
+def run_vectorized(policy_names, games, seed):
+    """``run_batch`` for the random policy, with every game advanced in lockstep."""
+    import numpy as np
+
+    from backend import batch_engine
+
+    state, turns, opened = batch_engine.rollout(games, len(policy_names), np.random.default_rng(seed),
+                                                max_turns=MAX_DECISIONS)
+    finished = state.game_over & (state.winner >= 0)
+    winners = state.winner[finished]
+    opened = opened[finished]
+    wins = Counter(dict(zip(*(a.tolist() for a in np.unique(winners, return_counts=True)))))
+    lengths = Counter(dict(zip(*(a.tolist() for a in np.unique(turns[finished], return_counts=True)))))
+    openings = Counter()
+    opening_wins = Counter()
+    won = opened[np.arange(len(winners)), winners]
+    for action, name in engine.ACTION_NAMES.items():
+        openings[name] = int((opened == action).sum())
+        opening_wins[name] = int((won == action).sum())
+    openings = +openings
+    return {"wins": wins, "lengths": lengths, "openings": openings, "opening_wins": opening_wins,
+            "stalled": games - int(finished.sum())}
+
+
+def simulate(games, policy_names, workers=None, batch=2000, seed=None, vectorized=False):
+    """Play ``games`` games over a process pool and merge the results."""
+    workers = workers or os.cpu_count() or 1
+    seed = seed if seed is not None else random.randrange(2 ** 32)
+    sizes = [batch] * (games // batch)
+    if games % batch:
+        sizes.append(games % batch)
+    runner = run_vectorized if vectorized else run_batch
+    total = {"wins": Counter(), "lengths": Counter(), "openings": Counter(), "opening_wins": Counter(), "stalled": 0}
+    started = time.perf_counter()
+    if workers == 1:
+        results = (runner(policy_names, size, seed + i) for i, size in enumerate(sizes))
+        results = list(results)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(runner, [policy_names] * len(sizes), sizes,
+                                    [seed + i for i in range(len(sizes))]))
+    for result in results:
+        for key in ("wins", "lengths", "openings", "opening_wins"):
+            total[key].update(result[key])
+        total["stalled"] += result["stalled"]
+    elapsed = time.perf_counter() - started
+    return report(total, games, elapsed, policy_names, workers, seed)
+
+
+def _percentile(lengths, fraction):
+    target = fraction * sum(lengths.values())
+    seen = 0
+    for turns in sorted(lengths):
+        seen += lengths[turns]
+        if seen >= target:
+            return turns
+    return None
+
+
+def report(total, games, elapsed, policy_names, workers, seed):
+    finished = games - total["stalled"]
+    lengths = total["lengths"]
+    return {
+        "games": games,
+        "finished": finished,
+        "stalled": total["stalled"],
+        "seconds": round(elapsed, 3),
+        "games_per_sec": round(games / elapsed, 1) if elapsed else None,
+        "workers": workers,
+        "seed": seed,
+        "policies": list(policy_names),
+        "win_rate_by_seat": {
+            seat: round(total["wins"][seat] / finished, 4) if finished else 0.0
+            for seat in range(len(policy_names))
+        },
+        "win_rate_by_opening": {
+            action: round(total["opening_wins"][action] / count, 4)
+            for action, count in sorted(total["openings"].items())
+        },
+        "length": {
+            "mean": round(sum(t * c for t, c in lengths.items()) / finished, 2) if finished else None,
+            "min": min(lengths) if lengths else None,
+            "p50": _percentile(lengths, 0.5),
+            "p90": _percentile(lengths, 0.9),
+            "p99": _percentile(lengths, 0.99),
+            "max": max(lengths) if lengths else None,
+            "histogram": {str(t): lengths[t] for t in sorted(lengths)},
+        },
+    }
+
+
+def print_report(result):
+    print(f"{result['games']} games in {result['seconds']}s "
+          f"({result['games_per_sec']} games/sec, {result['workers']} workers, seed {result['seed']})")
+    if result["stalled"]:
+        print(f"  {result['stalled']} games stalled without a winner")
+    print("Win rate by seat:")
+    for seat, rate in result["win_rate_by_seat"].items():
+        print(f"  {seat} ({result['policies'][seat]}): {rate:.2%}")
+    print("Win rate by opening action:")
+    for action, rate in result["win_rate_by_opening"].items():
+        print(f"  {action:12} {rate:.2%}")
+    length = result["length"]
+    print(f"Game length (turns): mean {length['mean']}, min {length['min']}, p50 {length['p50']}, "
+          f"p90 {length['p90']}, p99 {length['p99']}, max {length['max']}")
+    peak = max(length["histogram"].values(), default=0)
+    for turns, count in length["histogram"].items():
+        print(f"  {turns:>4} {'#' * max(1, round(40 * count / peak))} {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coup self-play simulator")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--policy", default="random",
+                        help="policy for every seat, or a comma-separated list cycled over the seats "
+                             f"({', '.join(POLICIES)})")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--batch", type=int, default=2000, help="games per worker task")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--vectorized", action="store_true",
+                        help="batch games through NumPy (random policy only; use a larger --batch)")
+    args = parser.parse_args()
+
+    names = args.policy.split(",")
+    unknown = [name for name in names if name not in POLICIES]
+    if unknown:
+        parser.error(f"unknown policy: {', '.join(unknown)}")
+    if args.vectorized and set(names) != {"random"}:
+        parser.error("--vectorized only supports the random policy")
+    policy_names = [names[seat % len(names)] for seat in range(args.players)]
+    result = simulate(args.games, policy_names, args.workers, args.batch, args.seed, args.vectorized)
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Shared public stream for spectator sockets.
+
+Spectators never see a hand, so they all receive the same bytes. Each room
+change is rendered once as the public view (every hand masked), serialized
+once per wire encoding in use and queued as-is on every spectator socket of
+the room. The cost of a broadcast therefore does not grow with the audience
+beyond one queue put per socket.
+
+With ``SPECTATOR_DELAY_MS`` set the stream is held back that long, so a
+spectator can't relay the table to a player as it happens ("ghosting").
+Messages wait in a per-room backlog released by the shared deadline timer,
+and a spectator joining mid-game starts from the newest released message.
+Anyone without a seat is a spectator: player sockets whose ``player_id``
+matches no seat and ``GET /api/game/state`` reads without one are served
+from this stream too. A seat is only claimed with the player's own
+``guest_id`` or ``user_id``, which the public view never carries (other
+players appear by row id), so watching a room doesn't hand out the ids that
+would sidestep the delay.
+"""
+
+import os
+import time
+from collections import deque
+
+from backend.connections import connection_manager
+from backend.timers import reaction_timers
+
+# How far the spectator stream runs behind the table; 0 sends it live
+SPECTATOR_DELAY = float(os.getenv("SPECTATOR_DELAY_MS", "0")) / 1000.0
+
+
+class SharedMessage:
+    """One spectator message, encoded on first use for each codec.
+
+    ``version`` is the room version it shows and ``state()`` the public view
+    as ``GET /api/game/state`` returns it.
+    """
+
+    __slots__ = ("render", "version", "state", "encoded", "_state_json")
+
+    def __init__(self, render, version, state):
+        self.render = render
+        self.version = version
+        self.state = state
+        self.encoded = {}
+        self._state_json = None
+
+    def get(self, codec):
+        data = self.encoded.get(codec.name)
+        if data is None:
+            data = self.encoded[codec.name] = self.render(codec)
+        return data
+
+    def state_json(self):
+        if self._state_json is None:
+            self._state_json = self.state()
+        return self._state_json
+
+
+class SpectatorFeed:
+    __slots__ = ("latest", "backlog")
+
+    def __init__(self):
+        # Newest message released to spectators, the starting point for new ones
+        self.latest = None
+        # (release_at, SharedMessage) not yet released, oldest first
+        self.backlog = deque()
+
+
+class SpectatorStream:
+    """Per-room public message stream, optionally delayed."""
+
+    def __init__(self, manager, timers, delay=SPECTATOR_DELAY):
+        self.manager = manager
+        self.timers = timers
+        self.delay = delay
+        self.feeds = {}
+
+    @property
+    def delayed(self):
+        return self.delay > 0
+
+    def publish(self, room_code, message):
+        """Send ``message`` (a ``SharedMessage``) to the room's spectators.
+
+        It is encoded at most once per encoding in use, and not at all for a
+        live stream nobody is watching. A delayed stream keeps the message so
+        spectators that join later start from the right point.
+        """
+        if not self.delayed:
+            if self.manager.spectators(room_code):
+                self.manager.broadcast_spectators(room_code, message)
+            return
+        feed = self.feeds.get(room_code)
+        if feed is None:
+            feed = self.feeds[room_code] = SpectatorFeed()
+        feed.backlog.append((time.time() + self.delay, message))
+        if len(feed.backlog) == 1:
+            self.timers.schedule(self._key(room_code), feed.backlog[0][0], self._release, room_code)
+
+    def joining(self, room_code):
+        """Message a new spectator of a delayed stream starts from.
+
+        Returns ``(known, message)``: ``known`` is False when the room has no
+        feed yet, and ``message`` (a ``SharedMessage``) is None while everything
+        so far is still held back.
+        """
+        feed = self.feeds.get(room_code)
+        if feed is None:
+            return False, None
+        return True, feed.latest
+
+    async def _release(self, room_code):
+        feed = self.feeds.get(room_code)
+        if feed is None:
+            return
+        now = time.time()
+        while feed.backlog and feed.backlog[0][0] <= now:
+            _, feed.latest = feed.backlog.popleft()
+            self.manager.broadcast_spectators(room_code, feed.latest)
+        if feed.backlog:
+            self.timers.schedule(self._key(room_code), feed.backlog[0][0], self._release, room_code)
+
+    def forget(self, room_code):
+        self.timers.cancel(self._key(room_code))
+        self.feeds.pop(room_code, None)
+
+    @staticmethod
+    def _key(room_code):
+        return f"spectate:{room_code}"
+
+
+spectator_stream = SpectatorStream(connection_manager, reaction_timers)
@@ -0,0 +1,52 @@
+"""Encoded ``GET /api/game/state`` responses, cached per room version.
+
+The room itself is already decoded and held by ``room_store``; what a poll
+still paid for was masking every hand and JSON-encoding the result. The
+first request at a room version builds one ``RoomBroadcast`` of the state;
+later requests at that version reuse it and the response text of their
+seat. Every mutating endpoint bumps the room version, so an entry is never
+served for a state it was not built from and is replaced on the next read.
+"""
+
+from backend import metrics
+from backend.broadcast import RoomBroadcast
+from backend.room_store import room_view
+
+
+class StateEntry:
+    __slots__ = ("version", "bc", "texts")
+
+    def __init__(self, version, bc):
+        self.version = version
+        self.bc = bc
+        # Seat (None for anyone without one) -> encoded view
+        self.texts = {}
+
+
+class StateCache:
+    def __init__(self):
+        self.entries = {}
+
+    def view_json(self, room_code, version, room, index, viewer_id):
+        """JSON text of ``viewer_id``'s masked view of ``room``, the live room at ``version``."""
+        entry = self.entries.get(room_code)
+        if entry is None or entry.version != version:
+            metrics.state_cache_lookups.inc("miss")
+            entry = self.entries[room_code] = StateEntry(version, RoomBroadcast(room_view(room), index))
+        else:
+            metrics.state_cache_lookups.inc("hit")
+        # Keyed by seat, not viewer_id, so arbitrary ids in the URL can't grow the entry
+        seat = entry.bc.seat_of(viewer_id)
+        text = entry.texts.get(seat)
+        if text is None:
+            text = entry.texts[seat] = entry.bc.view_json(viewer_id)
+        return text
+
+    def rooms(self):
+        return list(self.entries)
+
+    def forget(self, room_code):
+        self.entries.pop(room_code, None)
+
+
+state_cache = StateCache()
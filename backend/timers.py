@@ -0,0 +1,90 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class DeadlineScheduler:
+    """One task firing keyed deadlines from a min-heap.
+
+    ``schedule`` and ``cancel`` are O(log n) / O(1); replaced or cancelled
+    entries are discarded lazily when they reach the top of the heap. Deadlines
+    are wall-clock (``time.time()``) timestamps, like ``pending_actions``.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+        # Callbacks in flight; the loop only keeps weak references to tasks
+        self._firing = set()
+
+    def schedule(self, key, deadline, callback, *args):
+        """Run ``await callback(*args)`` at ``deadline``, replacing any timer for ``key``."""
+        self.cancel(key)
+        entry = [deadline, next(self._seq), key, callback, args, True]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry and self._wakeup is not None:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[5] = False
+
+    def deadline(self, key):
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+    async def _run(self):
+        while True:
+            while self._heap and not self._heap[0][5]:
+                heapq.heappop(self._heap)
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                    continue  # An earlier deadline arrived; re-evaluate the top
+                except asyncio.TimeoutError:
+                    pass
+            entry = heapq.heappop(self._heap)
+            if not entry[5]:
+                continue
+            del self._entries[entry[2]]
+            task = asyncio.create_task(self._fire(entry[2], entry[3], entry[4]))
+            self._firing.add(task)
+            task.add_done_callback(self._firing.discard)
+
+    async def _fire(self, key, callback, args):
+        try:
+            await callback(*args)
+        except Exception as e:
+            print(f"Timer {key} error: {e}")
+
+
+reaction_timers = DeadlineScheduler()
@@ -0,0 +1,205 @@
+"""Sampled span tracing for game actions.
+
+A sampled ``POST /api/game/action`` gets a ``Trace`` that follows the
+request through the room executor, the Supabase calls, the broadcast and the
+socket writers (all of them carry the caller's context). Each stage records
+a named span into it. Traces live in a ring buffer of the newest
+``TRACE_BUFFER`` requests, served by ``/api/debug/traces`` and exported in the
+Chrome trace-event format for ``chrome://tracing`` or Perfetto.
+
+Tracing is off unless ``TRACE_SAMPLE_RATE`` is above 0. The debug endpoints,
+which can also change the rate and clear the buffer, are only mounted with
+``TRACE_DEBUG_ENDPOINTS=1``; only then can a request ask to be traced with an
+``X-Trace: 1`` header. Untraced code paths pay one context variable lookup
+per span.
+"""
+
+import itertools
+import os
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+
+# Fraction of action requests traced, 0..1
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# Traces kept in memory; the oldest are dropped first
+BUFFER_SIZE = int(os.getenv("TRACE_BUFFER", "200"))
+# Mount /api/debug/traces and honour X-Trace; leave off on public deployments
+DEBUG_ENDPOINTS = os.getenv("TRACE_DEBUG_ENDPOINTS", "0").lower() in ("1", "true", "yes")
+
+_current = ContextVar("trace", default=None)
+
+
+class Trace:
+    __slots__ = ("id", "name", "started_at", "start", "end", "spans", "attrs")
+
+    def __init__(self, trace_id, name, attrs):
+        self.id = trace_id
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        # (name, start, end, args) with perf_counter timestamps
+        self.spans = []
+        self.attrs = attrs
+
+    def add(self, name, start, end, **args):
+        self.spans.append((name, start, end, args))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(((self.end or time.perf_counter()) - self.start) * 1000, 3),
+            "attrs": self.attrs,
+            "spans": [
+                {"name": name, "offset_ms": round((start - self.start) * 1000, 3),
+                 "duration_ms": round((end - start) * 1000, 3), **({"args": args} if args else {})}
+                for name, start, end, args in self.spans
+            ],
+        }
+
+
+class Span:
+    __slots__ = ("trace", "name", "args", "start")
+
+    def __init__(self, trace, name, args):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.trace.add(self.name, self.start, time.perf_counter(), **self.args)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    def __init__(self, sample_rate=SAMPLE_RATE, buffer_size=BUFFER_SIZE):
+        self.sample_rate = sample_rate
+        self.buffer = deque(maxlen=buffer_size)
+        self._ids = itertools.count(1)
+
+    def begin(self, name, force=False, **attrs):
+        """Start tracing the current task if sampled; returns a token for ``finish`` or None."""
+        if not force and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return None
+        trace = Trace(next(self._ids), name, attrs)
+        # Buffered from the start so in-flight requests are visible too
+        self.buffer.append(trace)
+        return _current.set(trace)
+
+    def finish(self, token, **attrs):
+        trace = _current.get()
+        if trace is not None:
+            trace.end = time.perf_counter()
+            trace.attrs.update(attrs)
+        _current.reset(token)
+
+    @staticmethod
+    def current():
+        return _current.get()
+
+    @staticmethod
+    def span(name, **args):
+        """Context manager recording a span in the current trace, if any."""
+        trace = _current.get()
+        if trace is None:
+            return NULL_SPAN
+        return Span(trace, name, args)
+
+    def traces(self, limit=None):
+        traces = list(self.buffer)[::-1]
+        return traces[:limit] if limit else traces
+
+    def find(self, trace_id):
+        return next((t for t in self.buffer if t.id == trace_id), None)
+
+    def clear(self):
+        self.buffer.clear()
+
+
+def chrome_trace(traces):
+    """Chrome trace-event JSON (``chrome://tracing``, Perfetto) for ``traces``; one row per trace."""
+    events = []
+    if not traces:
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+    epoch = min(t.start for t in traces)
+    for trace in traces:
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": trace.id,
+                       "args": {"name": f"#{trace.id} {trace.name}"}})
+        end = trace.end or max((s[2] for s in trace.spans), default=trace.start)
+        events.append(_complete(trace.name, trace.start, end, epoch, trace.id, trace.attrs))
+        for name, start, span_end, args in trace.spans:
+            events.append(_complete(name, start, span_end, epoch, trace.id, args))
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _complete(name, start, end, epoch, tid, args):
+    return {
+        "name": name,
+        "ph": "X",
+        "ts": round((start - epoch) * 1e6, 3),
+        "dur": round((end - start) * 1e6, 3),
+        "pid": 1,
+        "tid": tid,
+        "args": args,
+    }
+
+
+tracer = Tracer()
+
+
+class TracingMiddleware:
+    """ASGI middleware starting a sampled trace for each request to ``paths``.
+
+    With ``forceable`` set an ``X-Trace`` header traces the request whatever
+    the sampling rate.
+    """
+
+    def __init__(self, app, paths=("/api/game/action",), tracer=tracer, forceable=DEBUG_ENDPOINTS):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.tracer = tracer
+        self.forceable = forceable
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        force = self.forceable and any(k == b"x-trace" and v not in (b"", b"0") for k, v in scope["headers"])
+        token = self.tracer.begin(f"{scope['method']} {scope['path']}", force=force)
+        if token is None:
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            self.tracer.finish(token, status=status[0])
@@ -0,0 +1,226 @@
+"""Encodings for WebSocket messages, negotiated with ``?encoding=`` on connect.
+
+* ``json`` (default): the message as-is.
+* ``compact``: JSON with the short key schema in ``SHORT_KEYS``; the browser
+  client expands it back (see ``expandKeys`` in ``static/game.js``).
+* ``msgpack``: MessagePack binary frames, when the ``msgpack`` package is
+  installed (``requirements-dev.txt``); otherwise the socket falls back to ``compact`` (text frames).
+
+Messages from the client (``ping``, ``ack``, ``resync``) stay JSON text in
+every encoding. JSON is produced by ``orjson`` when it is installed, the
+standard library otherwise. Views are pre-serialized per encoding and spliced into messages
+(see ``backend/broadcast.py``), so only the few message fields around them
+are encoded per socket. Nothing is renamed recursively: views and patches
+are built in each codec's key schema, once per broadcast.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Message, view and pending-action keys; values (card names, stages, ids) are never renamed
+SHORT_KEYS = {
+    "type": "t",
+    "version": "v",
+    "base": "b",
+    "patch": "p",
+    "msg": "m",
+    "message": "mg",
+    "gameState": "s",
+    "game": "g",
+    "players": "ps",
+    "game_unset": "gu",
+    "players_length": "pl",
+    "pending_action": "pa",
+    "id": "i",
+    "room_code": "rc",
+    "host_id": "hi",
+    "status": "st",
+    "turn": "tu",
+    "trash": "tr",
+    "deck_count": "dc",
+    "game_over": "go",
+    "winner": "w",
+    "user_id": "u",
+    "guest_id": "gi",
+    "nickname": "n",
+    "coins": "c",
+    "hand": "h",
+    "revealed": "r",
+    "is_alive": "a",
+    "actor_id": "ai",
+    "action": "ac",
+    "target_id": "ti",
+    "awaiting_from": "af",
+    "required_card": "rq",
+    "time_remaining": "tm",
+    "stage": "sg",
+    "blocker_id": "bi",
+    "block_card": "bc",
+}
+
+
+def dumps(obj):
+    """Compact JSON text of ``obj``."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def short_key(key):
+    return SHORT_KEYS.get(key, key)
+
+
+def _long_key(key):
+    return key
+
+
+def short_keys(obj):
+    """Dict ``obj`` with its own keys shortened (values are kept as they are)."""
+    get = SHORT_KEYS.get
+    return {get(k, k): v for k, v in obj.items()}
+
+
+class Keyed(dict):
+    """A flat message value sent to many sockets (e.g. a pending action).
+
+    Its short-key form is built on first use and reused for every socket.
+    """
+
+    __slots__ = ("_short",)
+
+    def short(self):
+        try:
+            return self._short
+        except AttributeError:
+            self._short = short_keys(self)
+            return self._short
+
+
+class JsonCodec:
+    name = "json"
+    binary = False
+    # Key schema of views and patches; codecs sharing one share them (see backend/broadcast.py)
+    schema = "long"
+    key = staticmethod(_long_key)
+
+    def __init__(self):
+        # Encoded view and message keys, reused by every splice
+        self._keys = {}
+
+    def encoded_key(self, key):
+        encoded = self._keys.get(key)
+        if encoded is None:
+            encoded = self._keys[key] = self.encode(self.key(key))
+        return encoded
+
+    def keyed(self, obj):
+        """Dict ``obj`` in this codec's key schema."""
+        return obj
+
+    def prepare(self, obj):
+        return obj
+
+    def encode(self, obj):
+        """Encode a value that is already in this codec's key schema."""
+        return dumps(obj)
+
+    def dumps(self, obj):
+        return self.encode(self.prepare(obj))
+
+    def view(self, game, players):
+        """A view object from its encoded ``game`` and player fragments."""
+        return ("{" + self.encoded_key("game") + ":" + game + "," + self.encoded_key("players") + ":["
+                + ",".join(players) + "]}")
+
+    def splice(self, fields, fragment, key=None):
+        """Encode ``fields`` with the pre-encoded view ``fragment`` nested under ``key``, or merged in."""
+        head = self.dumps(fields)[:-1]
+        if head != "{":
+            head += ","
+        if key is None:
+            return head + fragment[1:]
+        return head + self.encoded_key(key) + ":" + fragment + "}"
+
+
+class CompactCodec(JsonCodec):
+    """The short key schema.
+
+    Views and patches are built with short keys (see ``backend/broadcast.py``
+    and ``backend/delta.py``), so encoding a message only renames its own
+    top-level keys; ``Keyed`` values bring their short form along.
+    """
+
+    name = "compact"
+    schema = "short"
+    key = staticmethod(short_key)
+    keyed = staticmethod(short_keys)
+
+    def prepare(self, obj):
+        get = SHORT_KEYS.get
+        return {get(k, k): v.short() if type(v) is Keyed else v for k, v in obj.items()}
+
+
+def _map_header(size):
+    if size < 16:
+        return bytes((0x80 | size,))
+    return b"\xde" + size.to_bytes(2, "big")
+
+
+def _array_header(size):
+    if size < 16:
+        return bytes((0x90 | size,))
+    return b"\xdc" + size.to_bytes(2, "big")
+
+
+class MsgpackCodec(CompactCodec):
+    """MessagePack with the short key schema.
+
+    Like the JSON codecs, view fragments are packed once per broadcast and
+    concatenated into each message: a map is its header followed by the
+    packed keys and values, so only the message's own fields are packed per
+    socket.
+    """
+
+    name = "msgpack"
+    binary = True
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def view(self, game, players):
+        return (_map_header(2) + self.encoded_key("game") + game + self.encoded_key("players")
+                + _array_header(len(players)) + b"".join(players))
+
+    def splice(self, fields, fragment, key=None):
+        fields = self.prepare(fields)
+        # The fields' entries without their map header (fields are never more than 15)
+        entries = self.encode(fields)[1:]
+        if key is None:
+            # The view is a two-entry map: its header is one byte
+            return _map_header(len(fields) + 2) + entries + fragment[1:]
+        return _map_header(len(fields) + 1) + entries + self.encoded_key(key) + fragment
+
+
+CODECS = {"json": JsonCodec(), "compact": CompactCodec()}
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+DEFAULT = CODECS["json"]
+
+
+def negotiate(encoding):
+    """Codec for a client's ``encoding`` request; unknown or unavailable ones fall back."""
+    if not encoding:
+        return DEFAULT
+    codec = CODECS.get(encoding)
+    if codec is None and encoding == "msgpack":
+        return CODECS["compact"]
+    return codec or DEFAULT
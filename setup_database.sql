@@ -30,10 +30,16 @@ CREATE TABLE IF NOT EXISTS games (
     current_player_index INTEGER DEFAULT 0,
     winner VARCHAR(255),                               -- UUID of winning player
     game_over BOOLEAN DEFAULT FALSE,
+    version INTEGER NOT NULL DEFAULT 0,                -- Optimistic lock, naik setiap commit state
+    event_seq INTEGER NOT NULL DEFAULT 0,              -- Event terakhir yang sudah termasuk di snapshot ini
     created_at TIMESTAMP DEFAULT NOW(),
     updated_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Untuk database yang dibuat sebelum kolom version ada
+ALTER TABLE games ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE games ADD COLUMN IF NOT EXISTS event_seq INTEGER NOT NULL DEFAULT 0;
+
 -- Game players table: Menyimpan setiap player di game
 CREATE TABLE IF NOT EXISTS game_players (
     id SERIAL PRIMARY KEY,
@@ -49,6 +55,38 @@ CREATE TABLE IF NOT EXISTS game_players (
     updated_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Game events table: Log append-only setiap aksi (command, tahap, kartu yang ditarik)
+-- State room = snapshot di games/game_players + replay event dengan seq > games.event_seq
+CREATE TABLE IF NOT EXISTS game_events (
+    id BIGSERIAL PRIMARY KEY,
+    game_id UUID NOT NULL REFERENCES games(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,                              -- Urutan event dalam satu game, mulai dari 1
+    kind VARCHAR(20) NOT NULL,                         -- start, income, challenge, select_card, ...
+    actor VARCHAR(255),                                -- Id pemain yang mengirim command
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    UNIQUE (game_id, seq)                              -- Dua worker tidak bisa menulis seq yang sama
+);
+
+-- Games archive: Ringkasan game yang sudah selesai, dipindah dari games oleh reaper (backend/reaper.py)
+-- Deck dan hand tidak disimpan, jadi games/game_players/game_events tetap kecil; event ikut pindah
+-- ke sini supaya challenge yang diperdebatkan tetap bisa dicek selama ARCHIVE_RETENTION_DAYS
+CREATE TABLE IF NOT EXISTS games_archive (
+    id UUID PRIMARY KEY,                               -- games.id asli
+    room_code VARCHAR(6) NOT NULL,                     -- Tidak unik: kode room boleh dipakai lagi
+    host_id UUID,
+    outcome VARCHAR(20) NOT NULL,                      -- finished, abandoned
+    winner VARCHAR(255),
+    players JSONB NOT NULL DEFAULT '[]'::jsonb,        -- [{"nickname", "user_id", "guest_id", "coins", "is_alive"}] urut kursi
+    event_count INTEGER NOT NULL DEFAULT 0,
+    events JSONB NOT NULL DEFAULT '[]'::jsonb,         -- Isi game_events: [{"seq", "kind", "actor", "payload", "created_at"}] urut seq
+    created_at TIMESTAMP,                              -- Kapan room dibuat
+    finished_at TIMESTAMP DEFAULT NOW()                -- Kapan game diarsipkan
+);
+
+-- Untuk arsip yang dibuat sebelum event ikut diarsipkan
+ALTER TABLE games_archive ADD COLUMN IF NOT EXISTS events JSONB NOT NULL DEFAULT '[]'::jsonb;
+
 -- ============================================================================
 -- STEP 3: Create indexes untuk performance
 -- ============================================================================
@@ -57,12 +95,16 @@ CREATE INDEX IF NOT EXISTS idx_games_status ON games(status);
 CREATE INDEX IF NOT EXISTS idx_games_created_at ON games(created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_game_players_game_id ON game_players(game_id);
 CREATE INDEX IF NOT EXISTS idx_game_players_guest_id ON game_players(guest_id);
+CREATE INDEX IF NOT EXISTS idx_games_archive_finished_at ON games_archive(finished_at);
+CREATE INDEX IF NOT EXISTS idx_games_archive_room_code ON games_archive(room_code);
 
 -- ============================================================================
 -- STEP 4: Enable RLS (Row Level Security)
 -- ============================================================================
 ALTER TABLE games ENABLE ROW LEVEL SECURITY;
 ALTER TABLE game_players ENABLE ROW LEVEL SECURITY;
+ALTER TABLE game_events ENABLE ROW LEVEL SECURITY;
+ALTER TABLE games_archive ENABLE ROW LEVEL SECURITY;
 
 -- ============================================================================
 -- STEP 5: Create RLS Policies (MVP - Permissive for testing)
@@ -72,6 +114,8 @@ ALTER TABLE game_players ENABLE ROW LEVEL SECURITY;
 -- Drop existing policies jika ada
 DROP POLICY IF EXISTS "Allow all operations on games" ON games;
 DROP POLICY IF EXISTS "Allow all operations on game_players" ON game_players;
+DROP POLICY IF EXISTS "Allow all operations on game_events" ON game_events;
+DROP POLICY IF EXISTS "Allow all operations on games_archive" ON games_archive;
 
 -- Create new permissive policies
 CREATE POLICY "Allow all operations on games" ON games
@@ -80,6 +124,12 @@ CREATE POLICY "Allow all operations on games" ON games
 CREATE POLICY "Allow all operations on game_players" ON game_players
     FOR ALL USING (true) WITH CHECK (true);
 
+CREATE POLICY "Allow all operations on game_events" ON game_events
+    FOR ALL USING (true) WITH CHECK (true);
+
+CREATE POLICY "Allow all operations on games_archive" ON games_archive
+    FOR ALL USING (true) WITH CHECK (true);
+
 -- ============================================================================
 -- STEP 6: Create helpful views
 -- ============================================================================
@@ -101,6 +151,7 @@ GROUP BY g.id, g.room_code, g.status, g.winner, g.created_at
 ORDER BY g.created_at DESC;
 
 -- View: Player stats (useful untuk leaderboard later)
+-- Termasuk game yang sudah dipindah ke games_archive
 CREATE OR REPLACE VIEW player_stats AS
 SELECT 
     guest_id,
@@ -108,13 +159,162 @@ SELECT
     SUM(CASE WHEN is_alive = false THEN 1 ELSE 0 END) as games_eliminated,
     ROUND(AVG(coins)::numeric, 2) as avg_coins,
     MAX(coins) as max_coins
-FROM game_players
+FROM (
+    SELECT guest_id, is_alive, coins FROM game_players
+    UNION ALL
+    SELECT p->>'guest_id', (p->>'is_alive')::BOOLEAN, (p->>'coins')::INTEGER
+    FROM games_archive, jsonb_array_elements(games_archive.players) AS p
+) all_players
 WHERE guest_id IS NOT NULL
 GROUP BY guest_id
 ORDER BY total_games DESC;
 
 -- ============================================================================
--- STEP 7: Verification & Documentation
+-- STEP 7: Create functions
+-- ============================================================================
+
+-- Function: Simpan seluruh state game setelah satu aksi dalam satu transaksi
+-- p_expected_version : games.version yang dibaca server; gagal jika sudah berubah
+-- p_game             : {"status", "turn", "deck", "trash", "winner", "game_over", "event_seq"}
+-- p_players          : [{"id", "coins", "hand", "revealed", "is_alive"}, ...]
+-- Return: version baru
+DROP FUNCTION IF EXISTS apply_game_state(UUID, JSONB, JSONB);
+
+CREATE OR REPLACE FUNCTION apply_game_state(p_game_id UUID, p_expected_version INTEGER, p_game JSONB, p_players JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    new_version INTEGER;
+BEGIN
+    UPDATE games SET
+        status = COALESCE(p_game->>'status', status),
+        turn = (p_game->>'turn')::INTEGER,
+        deck = p_game->'deck',
+        trash = p_game->'trash',
+        winner = p_game->>'winner',
+        game_over = COALESCE((p_game->>'game_over')::BOOLEAN, FALSE),
+        event_seq = COALESCE((p_game->>'event_seq')::INTEGER, event_seq),
+        version = version + 1,
+        updated_at = NOW()
+    WHERE id = p_game_id
+      AND version = p_expected_version
+    RETURNING version INTO new_version;
+
+    IF new_version IS NULL THEN
+        RAISE EXCEPTION 'version conflict on game %', p_game_id
+            USING ERRCODE = '40001', HINT = 'reload the room and retry';
+    END IF;
+
+    UPDATE game_players gp SET
+        coins = (elem.data->>'coins')::INTEGER,
+        hand = elem.data->'hand',
+        revealed = elem.data->'revealed',
+        is_alive = (elem.data->>'is_alive')::BOOLEAN,
+        updated_at = NOW()
+    FROM jsonb_array_elements(p_players) AS elem(data)
+    WHERE gp.id = (elem.data->>'id')::INTEGER
+      AND gp.game_id = p_game_id;
+
+    RETURN new_version;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION apply_game_state(UUID, INTEGER, JSONB, JSONB) TO anon, authenticated;
+
+-- Function: Pindahkan satu game ke games_archive lalu hapus dari games
+-- (event disalin ke games_archive.events, lalu game_players dan game_events terhapus lewat ON DELETE CASCADE)
+-- p_outcome : 'finished' atau 'abandoned'
+-- Return: TRUE jika game ditemukan
+CREATE OR REPLACE FUNCTION archive_game(p_game_id UUID, p_outcome VARCHAR DEFAULT 'finished')
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO games_archive (id, room_code, host_id, outcome, winner, players, event_count, events, created_at)
+    SELECT
+        g.id, g.room_code, g.host_id, p_outcome, g.winner,
+        COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'nickname', gp.nickname, 'user_id', gp.user_id, 'guest_id', gp.guest_id,
+                'coins', gp.coins, 'is_alive', gp.is_alive) ORDER BY gp.id)
+            FROM game_players gp WHERE gp.game_id = g.id
+        ), '[]'::jsonb),
+        (SELECT COUNT(*) FROM game_events e WHERE e.game_id = g.id),
+        COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'seq', e.seq, 'kind', e.kind, 'actor', e.actor, 'payload', e.payload,
+                'created_at', e.created_at) ORDER BY e.seq)
+            FROM game_events e WHERE e.game_id = g.id
+        ), '[]'::jsonb),
+        g.created_at
+    FROM games g
+    WHERE g.id = p_game_id
+    ON CONFLICT (id) DO NOTHING;
+
+    DELETE FROM games WHERE id = p_game_id;
+    RETURN FOUND;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION archive_game(UUID, VARCHAR) TO anon, authenticated;
+
+-- Function: Bersihkan game yang sudah lama tidak aktif (dipanggil berkala oleh reaper)
+-- Aktivitas terakhir = paling baru dari games.updated_at, join pemain, dan event
+-- p_waiting_ttl       : detik; room 'waiting' yang tidak pernah dimulai dihapus
+-- p_finished_ttl      : detik; game yang selesai diarsipkan sebagai 'finished'
+-- p_abandoned_ttl     : detik; game berjalan yang ditinggal diarsipkan sebagai 'abandoned'
+-- p_archive_retention : hari; baris games_archive yang lebih tua dihapus (0 = simpan selamanya)
+-- Return: {"deleted", "finished", "abandoned", "expired"}
+CREATE OR REPLACE FUNCTION purge_stale_games(p_waiting_ttl INTEGER, p_finished_ttl INTEGER,
+                                             p_abandoned_ttl INTEGER, p_archive_retention INTEGER)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    g RECORD;
+    deleted INTEGER := 0;
+    finished INTEGER := 0;
+    abandoned INTEGER := 0;
+    expired INTEGER := 0;
+BEGIN
+    FOR g IN
+        SELECT games.id, games.status, games.game_over, GREATEST(
+            games.updated_at,
+            (SELECT MAX(gp.created_at) FROM game_players gp WHERE gp.game_id = games.id),
+            (SELECT MAX(e.created_at) FROM game_events e WHERE e.game_id = games.id)
+        ) AS active_at
+        FROM games
+    LOOP
+        IF g.game_over THEN
+            IF g.active_at < NOW() - make_interval(secs => p_finished_ttl) THEN
+                PERFORM archive_game(g.id, 'finished');
+                finished := finished + 1;
+            END IF;
+        ELSIF g.status = 'waiting' THEN
+            IF g.active_at < NOW() - make_interval(secs => p_waiting_ttl) THEN
+                DELETE FROM games WHERE id = g.id;
+                deleted := deleted + 1;
+            END IF;
+        ELSIF g.active_at < NOW() - make_interval(secs => p_abandoned_ttl) THEN
+            PERFORM archive_game(g.id, 'abandoned');
+            abandoned := abandoned + 1;
+        END IF;
+    END LOOP;
+
+    IF p_archive_retention > 0 THEN
+        DELETE FROM games_archive WHERE finished_at < NOW() - make_interval(days => p_archive_retention);
+        GET DIAGNOSTICS expired = ROW_COUNT;
+    END IF;
+
+    RETURN jsonb_build_object('deleted', deleted, 'finished', finished, 'abandoned', abandoned, 'expired', expired);
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION purge_stale_games(INTEGER, INTEGER, INTEGER, INTEGER) TO anon, authenticated;
+
+-- ============================================================================
+-- STEP 8: Verification & Documentation
 -- ============================================================================
 -- Run these queries untuk verify setup:
 
@@ -138,11 +338,18 @@ ORDER BY total_games DESC;
 -- Tables yang terbuat:
 -- - games: Menyimpan game room dan state
 -- - game_players: Menyimpan player data per game
+-- - game_events: Log aksi append-only untuk replay dan audit
+-- - games_archive: Ringkasan game yang sudah selesai atau ditinggal
 --
 -- Views yang terbuat:
 -- - game_status: Monitor game status
 -- - player_stats: Player statistics
 --
+-- Functions yang terbuat:
+-- - apply_game_state: Commit state game (players + deck/trash/turn) sekaligus
+-- - archive_game: Pindahkan satu game ke games_archive
+-- - purge_stale_games: Hapus/arsipkan game yang sudah lama tidak aktif
+--
 -- Selanjutnya:
 -- 1. Update .env dengan SUPABASE_URL dan SUPABASE_KEY
 -- 2. Jalankan backend: python -m uvicorn backend.main:app --reload
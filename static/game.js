@@ -4,6 +4,8 @@ let playerId = null,
   nickname = null,
   pendingRoomCode = null;
 let lobbyPoll = null;
+let lobbyEtag = null;
+const LOBBY_FALLBACK_POLL_MS = 10000;
 let actionLog = [];
 let pendingAction = null;
 let reactionTimer = null;
@@ -11,6 +13,40 @@ let lastGameState = null;
 let isInWaitingLobby = false; // Track if we're in waiting lobby to avoid repeated audio plays
 let handRevealShown = false;
 let lastHandSignature = null;
+let stateHistory = {}; // version -> state, bases for server patches (see backend/delta.py)
+let lastVersion = null; // Newest room version applied, sent as ?since= to resume after a drop
+let historyRoom = null; // Room the state history belongs to
+let reconnectTimer = null;
+const WS_RECONNECT_MIN_MS = 500;
+const WS_RECONNECT_MAX_MS = 10000;
+// "ping" keeps the server's idle timeout (WS_IDLE_TIMEOUT_MS) from closing a quiet socket
+const WS_HEARTBEAT_MS = 25000;
+let reconnectDelay = WS_RECONNECT_MIN_MS;
+let spectating = false; // Watching a room (?watch=CODE) on the shared public stream, no actions
+
+// "compact" switches server messages to the short key schema of backend/wire.py, expanded below;
+// json stays the default until compact benchmarks faster (python -m backend.bench)
+const WS_ENCODING = "json";
+const SHORT_KEYS = {
+  type: "t", version: "v", base: "b", patch: "p", msg: "m", message: "mg", gameState: "s", game: "g",
+  players: "ps", game_unset: "gu", players_length: "pl", pending_action: "pa", id: "i", room_code: "rc",
+  host_id: "hi", status: "st", turn: "tu", trash: "tr", deck_count: "dc", game_over: "go", winner: "w",
+  user_id: "u", guest_id: "gi", nickname: "n", coins: "c", hand: "h", revealed: "r", is_alive: "a",
+  actor_id: "ai", action: "ac", target_id: "ti", awaiting_from: "af", required_card: "rq",
+  time_remaining: "tm", stage: "sg", blocker_id: "bi", block_card: "bc",
+};
+const LONG_KEYS = Object.fromEntries(Object.entries(SHORT_KEYS).map(([long, short]) => [short, long]));
+
+function expandKeys(value) {
+  if (Array.isArray(value)) return value.map(expandKeys);
+  if (!value || typeof value !== "object") return value;
+  const out = {};
+  for (const [key, v] of Object.entries(value)) {
+    const long = LONG_KEYS[key] || key;
+    out[long] = long === "game_unset" && Array.isArray(v) ? v.map((f) => LONG_KEYS[f] || f) : expandKeys(v);
+  }
+  return out;
+}
 
 // Asset mapping for each card role
 const CARD_IMAGES = {
@@ -167,7 +203,7 @@ function showHandRevealModal(hand) {
 }
 
 function maybeShowHandReveal(gameState) {
-  if (!gameState || !gameState.game) return;
+  if (spectating || !gameState || !gameState.game) return;
   const status = gameState.game.status;
   const started = typeof status === "undefined" ? true : status === "started";
   if (!started) return;
@@ -371,7 +407,7 @@ function renderGameBoard(gameState) {
   const turnIndex = typeof game.turn === "number" ? game.turn : null;
   const currentTurnPlayer = turnIndex !== null && players[turnIndex] ? players[turnIndex] : null;
   const currentTurnName = currentTurnPlayer ? currentTurnPlayer.nickname || "Anonymous" : "-";
-  const isSelfTurn = currentTurnPlayer && (String(currentTurnPlayer.user_id) === String(playerId) || String(currentTurnPlayer.guest_id) === String(playerId) || String(currentTurnPlayer.id) === String(playerId));
+  const isSelfTurn = !spectating && currentTurnPlayer && (String(currentTurnPlayer.user_id) === String(playerId) || String(currentTurnPlayer.guest_id) === String(playerId) || String(currentTurnPlayer.id) === String(playerId));
   const deckCount =
     typeof game.deck_count === "number"
       ? game.deck_count
@@ -446,11 +482,11 @@ function renderGameBoard(gameState) {
   for (const p of players) {
     const hand = Array.isArray(p.hand) ? p.hand : [];
     const revealed = Array.isArray(p.revealed) ? p.revealed : hand.map(() => false);
-    const isSelf = String(p.user_id) === String(playerId) || String(p.guest_id) === String(playerId) || String(p.id) === String(playerId);
+    const isSelf = !spectating && (String(p.user_id) === String(playerId) || String(p.guest_id) === String(playerId) || String(p.id) === String(playerId));
     const isCurrentTurn = turnIndex !== null && turnIndex < players.length && String(players[turnIndex].id) === String(p.id);
 
     html += `
-      <div class="player-card bg-gray-800 rounded-lg p-4 ${isSelf ? "border-2 border-yellow-400" : isCurrentTurn ? "border-2 border-cyan-400" : ""} ${!p.is_alive ? "opacity-50" : ""}" data-player-id="${p.guest_id || p.user_id || p.id}">
+      <div class="player-card bg-gray-800 rounded-lg p-4 ${isSelf ? "border-2 border-yellow-400" : isCurrentTurn ? "border-2 border-cyan-400" : ""} ${!p.is_alive ? "opacity-50" : ""}" data-player-id="${p.id}">
         <div class="flex justify-between items-center mb-2">
           <div class="font-bold ${isSelf ? "text-yellow-400" : "text-white"}">${p.nickname || "Anonymous"}</div>
           ${isCurrentTurn ? '<span class="text-cyan-400 font-bold">→ TURN</span>' : ""}
@@ -470,6 +506,7 @@ function renderGameBoard(gameState) {
   }
   html += `</div>`;
 
+  if (!spectating) {
   // Target selector
   html += `<select id="target_id" class="w-full mb-2 p-2 rounded bg-gray-700 text-white">
     <option value="">📍 Pilih Target</option>
@@ -496,6 +533,11 @@ function renderGameBoard(gameState) {
     </div>
 
     <!-- Reaction buttons removed: reactions handled via modal -->
+  `;
+  } else {
+    html += `<div class="mb-4 p-2 bg-gray-900 rounded-lg text-center text-gray-300">👀 Menonton ruangan ${roomCode}</div>`;
+  }
+  html += `
 
     <div class="mt-4 bg-gray-900 rounded-lg p-3 max-h-40 overflow-y-auto border border-gray-700">
       <h4 class="text-sm font-bold text-gray-300 mb-2">📋 Action Log (Last 5)</h4>
@@ -767,7 +809,7 @@ async function safeFetch(url, options) {
     } catch (e) {
       data = null;
     }
-    return { ok: res.ok, status: res.status, data };
+    return { ok: res.ok, status: res.status, data, headers: res.headers };
   } catch (err) {
     return { ok: false, status: 0, data: null, error: err.message };
   }
@@ -946,7 +988,9 @@ function renderWaitingLobby(state) {
 
   html += `<div class="flex gap-2 mb-2">`;
   html += `<button onclick="leaveLobby()" class="flex-1 py-2 bg-red-600 text-white rounded">Keluar</button>`;
-  if (!isHost) {
+  if (spectating) {
+    html += `<button disabled class="flex-1 py-2 bg-gray-600 text-white rounded">👀 Menonton</button>`;
+  } else if (!isHost) {
     html += `<button disabled class="flex-1 py-2 bg-gray-600 text-white rounded">Menunggu Host</button>`;
   } else {
     if (!canStart) {
@@ -969,8 +1013,11 @@ function renderWaitingLobby(state) {
 
 async function fetchAndRenderLobbyState() {
   if (!roomCode) return;
-  const { ok, data } = await safeFetch(`/api/game/state?room_code=${roomCode}&viewer_id=${encodeURIComponent(playerId || "")}`);
+  const headers = lobbyEtag ? { "If-None-Match": lobbyEtag } : {};
+  const { ok, status, data, headers: resHeaders } = await safeFetch(`/api/game/state?room_code=${roomCode}&viewer_id=${encodeURIComponent(playerId || "")}`, { headers });
+  if (status === 304) return; // Lobby unchanged since the last render
   if (ok && data) {
+    lobbyEtag = resHeaders && resHeaders.get("ETag");
     if (data.game && data.game.status === "started") {
       stopLobbyPolling();
       renderGameBoard({ game: data.game, players: data.players });
@@ -985,9 +1032,10 @@ async function fetchAndRenderLobbyState() {
 
 function startLobbyPolling() {
   stopLobbyPolling();
+  // Lobby changes are pushed over the WebSocket; polling only covers a dropped socket
   lobbyPoll = setInterval(() => {
-    if (roomCode) fetchAndRenderLobbyState();
-  }, 1500);
+    if (roomCode && (!ws || ws.readyState !== 1)) fetchAndRenderLobbyState();
+  }, LOBBY_FALLBACK_POLL_MS);
 }
 
 function stopLobbyPolling() {
@@ -1022,18 +1070,27 @@ async function startGame() {
 
 function leaveLobby() {
   stopLobbyPolling();
+  clearTimeout(reconnectTimer);
+  reconnectTimer = null;
   if (ws) {
     try {
       ws.close();
     } catch (e) {}
     ws = null;
   }
+  if (spectating) {
+    spectating = false;
+    roomCode = null;
+    renderLogin();
+    return;
+  }
   safeFetch("/api/game/leave", {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({ room_code: roomCode, player_id: playerId }),
   }).finally(() => {
     roomCode = null;
+    lobbyEtag = null;
     resetHandRevealState();
     // Remove audio controls and stop audio when leaving lobby
     try {
@@ -1189,35 +1246,134 @@ async function sendBlock(blockCard) {
   }
 }
 
+function sendWS(message) {
+  if (ws && ws.readyState === 1) ws.send(JSON.stringify(message));
+}
+
+function applyStatePatch(base, patch) {
+  const game = Object.assign({}, base.game, patch.game || {});
+  for (const key of patch.game_unset || []) delete game[key];
+  let players = (base.players || []).map((p) => Object.assign({}, p));
+  if (typeof patch.players_length === "number") players = players.slice(0, patch.players_length);
+  for (const [idx, fields] of Object.entries(patch.players || {})) {
+    const i = Number(idx);
+    while (players.length <= i) players.push({});
+    players[i] = Object.assign(players[i], fields);
+  }
+  return { game, players };
+}
+
+// Rebuild patched state from its acknowledged base, remember it and ack it.
+// Returns false when the base is missing and a full snapshot was requested.
+function resolveVersionedState(msg) {
+  if (msg.patch) {
+    const base = stateHistory[msg.base];
+    if (!base) {
+      sendWS({ type: "resync" });
+      return false;
+    }
+    msg.gameState = applyStatePatch(base, msg.patch);
+    for (const v of Object.keys(stateHistory)) {
+      if (Number(v) < msg.base) delete stateHistory[v];
+    }
+  }
+  const state = msg.gameState || (msg.players ? { game: msg.game, players: msg.players } : null);
+  if (state) {
+    stateHistory[msg.version] = JSON.parse(JSON.stringify(state));
+    const versions = Object.keys(stateHistory).map(Number).sort((a, b) => a - b);
+    while (versions.length > 32) delete stateHistory[versions.shift()];
+    if (lastVersion == null || msg.version > lastVersion) lastVersion = msg.version;
+  }
+  sendWS({ type: "ack", version: msg.version });
+  return true;
+}
+
+// Reconnect with jittered exponential backoff, so a restarting server isn't hit by every client at once
+function scheduleReconnect() {
+  if (reconnectTimer) return;
+  const delay = reconnectDelay * (0.5 + Math.random() / 2);
+  reconnectDelay = Math.min(reconnectDelay * 2, WS_RECONNECT_MAX_MS);
+  reconnectTimer = setTimeout(() => {
+    reconnectTimer = null;
+    connectWS();
+  }, delay);
+}
+
 function connectWS() {
   if (!roomCode) return;
-  if (ws && ws.readyState === 1) return;
+  if (ws && ws.readyState <= 1) return;
+  clearTimeout(reconnectTimer);
+  reconnectTimer = null;
+  if (historyRoom !== roomCode) {
+    stateHistory = {};
+    lastVersion = null;
+    historyRoom = roomCode;
+  }
   const protocol = window.location.protocol === "https:" ? "wss" : "ws";
-  const url = `${protocol}://${window.location.host}/api/ws/${roomCode}?player_id=${encodeURIComponent(playerId || "")}`;
+  let query = spectating ? "role=spectator" : `player_id=${encodeURIComponent(playerId || "")}`;
+  // Still holding the last state: the server sends only the events after it (see backend/resume.py)
+  if (!spectating && lastVersion != null && stateHistory[lastVersion]) query += `&since=${lastVersion}`;
+  const url = `${protocol}://${window.location.host}/api/ws/${roomCode}?${query}&encoding=${WS_ENCODING}`;
+  let socket;
   try {
-    ws = new WebSocket(url);
+    socket = ws = new WebSocket(url);
   } catch (e) {
     showNotification("WebSocket init gagal", "error");
     return;
   }
-  ws.onopen = () => showNotification("Terhubung ke ruangan!", "success");
-  ws.onclose = () => {
-    showNotification("Terputus dari ruangan", "error");
+  let heartbeat = null;
+  let lastMessageAt = Date.now();
+  socket.onopen = () => {
+    reconnectDelay = WS_RECONNECT_MIN_MS;
+    showNotification("Terhubung ke ruangan!", "success");
+    heartbeat = setInterval(() => {
+      if (ws !== socket) return clearInterval(heartbeat);
+      if (Date.now() - lastMessageAt > WS_HEARTBEAT_MS * 2.5) {
+        // No pong for two heartbeats: the connection is dead even if no close event arrived
+        clearInterval(heartbeat);
+        socket.onclose = null;
+        ws = null;
+        socket.close();
+        scheduleReconnect();
+        return;
+      }
+      socket.send("ping");
+    }, WS_HEARTBEAT_MS);
+  };
+  socket.onclose = (event) => {
+    clearInterval(heartbeat);
+    // Closed on purpose (left the room) or already replaced by a newer socket
+    if (ws !== socket) return;
     ws = null;
+    // 1001: the server closed the room for good (see backend/reaper.py)
+    if (!roomCode || event.code === 1001) {
+      showNotification("Terputus dari ruangan", "error");
+      return;
+    }
+    if (reconnectDelay === WS_RECONNECT_MIN_MS) showNotification("Terputus, menyambung ulang...", "error");
+    scheduleReconnect();
+  };
+  socket.onerror = (e) => {
+    // Failed reconnect attempts are already reported by onclose
+    if (reconnectDelay === WS_RECONNECT_MIN_MS) showNotification("WebSocket error", "error");
   };
-  ws.onerror = (e) => showNotification("WebSocket error", "error");
-  ws.onmessage = (event) => {
+  socket.onmessage = (event) => {
+    lastMessageAt = Date.now();
     let msg = null;
     try {
       msg = JSON.parse(event.data);
+      if (WS_ENCODING === "compact") msg = expandKeys(msg);
     } catch (e) {
       console.warn("Invalid WS message", event.data);
       return;
     }
+    if (msg.version != null && !resolveVersionedState(msg)) return;
     if (msg.type === "action" && msg.gameState) {
       lastGameState = msg.gameState;
       if (msg.msg) actionLog.push(msg.msg);
-      if (msg.pending_action) {
+      if (msg.pending_action && spectating) {
+        pendingAction = msg.pending_action;
+      } else if (msg.pending_action) {
         console.log("Received pending_action:", msg.pending_action, "playerId:", playerId);
         const awaitingMe = isAwaitingCurrentUser(msg.pending_action, msg.gameState);
         pendingAction = msg.pending_action;
@@ -1241,9 +1397,9 @@ function connectWS() {
         } else if (msg.pending_action.stage === "reveal_claim" && awaitingMe) {
           const required = msg.pending_action.required_card || "?";
           showClaimRevealModal(required);
-        } else if (msg.pending_action.stage === "reaction" && String(msg.pending_action.actor_id) !== String(playerId)) {
+        } else if (msg.pending_action.stage === "reaction" && !getSelfIds(msg.gameState).has(String(msg.pending_action.actor_id))) {
           showReactionWindow(msg.pending_action);
-        } else if (msg.pending_action.stage === "block_reaction" && String(msg.pending_action.blocker_id) !== String(playerId)) {
+        } else if (msg.pending_action.stage === "block_reaction" && !getSelfIds(msg.gameState).has(String(msg.pending_action.blocker_id))) {
           // Show reaction window for challenging the block
           showReactionWindow(msg.pending_action);
         }
@@ -1301,5 +1457,12 @@ window.onload = () => {
     el.id = "app";
     document.body.appendChild(el);
   }
+  const watch = new URLSearchParams(window.location.search).get("watch");
+  if (watch) {
+    spectating = true;
+    roomCode = watch.toUpperCase();
+    connectWS();
+    return;
+  }
   renderLogin();
 };
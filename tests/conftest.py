@@ -0,0 +1,23 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.fake_supabase import FakeSupabase
+from backend.main import app
+from backend.repository import repository
+
+
+@pytest.fixture
+def client():
+    """The app against an in-memory ``FakeSupabase``, startup tasks running."""
+    repository.transport = FakeSupabase().transport()
+    with TestClient(app) as client:
+        yield client
+    repository.transport = None
+
+
+def start_room(client, room_code, guest_ids):
+    """Create ``room_code`` with one player per guest id and start it."""
+    client.post("/api/game/create", json={"host_id": guest_ids[0], "room_code": room_code})
+    for seat, guest_id in enumerate(guest_ids):
+        client.post("/api/game/join", json={"room_code": room_code, "player_id": guest_id, "nickname": f"p{seat}"})
+    client.post("/api/game/start", json={"room_code": room_code})
@@ -0,0 +1,50 @@
+import json
+
+from backend.game_logic import PlayerIndex
+from conftest import start_room
+
+GUESTS = ["secret-0", "secret-1", "secret-2"]
+
+
+def view_of(text):
+    """The view in a socket message: nested as ``gameState`` or merged in (lobby updates)."""
+    message = json.loads(text)
+    return message.get("gameState", message)
+
+
+def hands(state):
+    return [p["hand"] for p in state["players"]]
+
+
+def masked(state):
+    return all(card == "?" for hand in hands(state) for card in hand)
+
+
+def test_row_id_names_targets_but_claims_no_seat():
+    index = PlayerIndex([{"id": 7, "guest_id": "g"}, {"id": 8, "user_id": "u"}])
+    assert index.get("g") == 0 and index.get("u") == 1
+    assert index.get(7) is None and index.get("8") is None
+    assert index.target("7") == 0 and index.target("u") == 1
+    assert index.public_id("g") == "7"
+
+
+def test_spectator_learns_no_id_that_unlocks_a_hand(client):
+    start_room(client, "GHOST", GUESTS)
+    with client.websocket_connect("/api/ws/GHOST?role=spectator") as ws:
+        text = ws.receive_text()
+    assert not any(guest in text for guest in GUESTS)
+    state = view_of(text)
+    assert masked(state)
+
+    # Every id the spectator saw, tried as a viewer and as a player socket
+    ids = {str(p["id"]) for p in state["players"]} | {str(state["game"]["id"])}
+    for viewer_id in ids:
+        res = client.get("/api/game/state", params={"room_code": "GHOST", "viewer_id": viewer_id})
+        assert res.status_code == 200 and masked(res.json()), viewer_id
+        with client.websocket_connect(f"/api/ws/GHOST?player_id={viewer_id}") as ws:
+            assert masked(view_of(ws.receive_text())), viewer_id
+
+    own = client.get("/api/game/state", params={"room_code": "GHOST", "viewer_id": GUESTS[0]}).json()
+    assert "?" not in hands(own)[0]
+    assert own["players"][0]["guest_id"] == GUESTS[0]
+    assert all("guest_id" not in p for p in own["players"][1:])